@@ -0,0 +1,278 @@
+"""
+Timer: incremental Parquet export of traceability and furnace data for analytics.
+Export do Parquetu pro analýzy (notebooky) — místo dotazů na OLTP databázi.
+
+Every run rewrites whole date partitions of each table in each database as
+Hive-partitioned Parquet, one file per date:
+
+    <root>/db=Traceability/table=traceability_log/date=2026-03-02/data.parquet
+
+<root> is ANALYTICS_EXPORT_DIR (local directory) or, when that is not set,
+the ANALYTICS_EXPORT_CONTAINER blob container of AzureWebJobsStorage
+(Azurite locally). Read with e.g. pyarrow.dataset / pandas.read_parquet /
+DuckDB read_parquet('.../**/*.parquet', hive_partitioning = true).
+
+Progress is a timestamp watermark per database and table, stored next to
+the data in _watermarks/<db>/<table>.json. Like StationRollup, a run starts
+ANALYTICS_EXPORT_OVERLAP_HOURS before the watermark (floored to the date)
+and re-exports those dates whole, so rows that arrive late (status_timestamp
+and check_timestamp are scanner times, queued and async writes land minutes
+later) are picked up, and rewriting a date never duplicates rows. A run stops
+at now - ANALYTICS_EXPORT_LAG_SECONDS, after ANALYTICS_EXPORT_MAX_DAYS dates
+per table, or once ANALYTICS_EXPORT_RUN_SECONDS have passed; with one date
+taking at most ANALYTICS_EXPORT_DEADLINE_SECONDS that stays under the 5 min
+functionTimeout of host.json. The watermark advances after every finished date,
+so a first run backfills gradually from ANALYTICS_EXPORT_START. Rows are
+streamed into the file in row groups of ANALYTICS_ROW_GROUP_ROWS, so memory
+does not grow with the size of a date.
+"""
+import contextlib
+import datetime
+import json
+import logging
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import azure.functions as func
+from shared_utils import get_connection_string, call_with_resilience, db_connect, timed_request
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional
+    pa = pq = None
+
+bp = func.Blueprint()
+
+ANALYTICS_EXPORT_DIR = os.getenv("ANALYTICS_EXPORT_DIR")
+ANALYTICS_EXPORT_CONTAINER = os.getenv("ANALYTICS_EXPORT_CONTAINER", "analytics")
+ANALYTICS_EXPORT_DATABASES = [
+    name.strip() for name in os.getenv("ANALYTICS_EXPORT_DATABASES", "Traceability,Traceability_TEST").split(",")
+    if name.strip()
+]
+ANALYTICS_EXPORT_START = os.getenv("ANALYTICS_EXPORT_START", "2025-01-01T00:00:00")
+ANALYTICS_EXPORT_LAG_SECONDS = int(os.getenv("ANALYTICS_EXPORT_LAG_SECONDS", "120"))
+ANALYTICS_EXPORT_OVERLAP_HOURS = int(os.getenv("ANALYTICS_EXPORT_OVERLAP_HOURS", "3"))
+ANALYTICS_EXPORT_MAX_DAYS = int(os.getenv("ANALYTICS_EXPORT_MAX_DAYS", "7"))
+ANALYTICS_EXPORT_RUN_SECONDS = float(os.getenv("ANALYTICS_EXPORT_RUN_SECONDS", "150"))
+ANALYTICS_EXPORT_DEADLINE_SECONDS = float(os.getenv("ANALYTICS_EXPORT_DEADLINE_SECONDS", "120"))
+ANALYTICS_FETCH_ROWS = int(os.getenv("ANALYTICS_FETCH_ROWS", "5000"))
+ANALYTICS_ROW_GROUP_ROWS = int(os.getenv("ANALYTICS_ROW_GROUP_ROWS", "100000"))
+
+# table -> (timestamp expression the watermark runs on, [(column, arrow type name)])
+EXPORT_TABLES: Dict[str, Tuple[str, List[Tuple[str, str]]]] = {
+    "traceability_log": ("status_timestamp", [
+        ("part_id", "string"), ("employee_id", "string"), ("station_id", "string"),
+        ("status", "string"), ("status_timestamp", "timestamp"), ("shipping_id", "string"),
+    ]),
+    "h_part_status": ("status_timestamp", [
+        ("part_id", "string"), ("employee_id", "string"), ("station_id", "string"),
+        ("status", "string"), ("status_timestamp", "timestamp"), ("shipping_id", "string"),
+    ]),
+    "Control_Station": ("check_timestamp", [
+        ("id", "int64"), ("station_id", "int64"), ("part_id", "string"), ("sample", "int64"),
+        ("check_timestamp", "timestamp"), ("shipping_id", "string"), ("operator_id", "string"),
+        ("part_type", "int64"), ("melt", "string"), ("control_group_id", "int64"), ("status", "string"),
+    ]),
+    # Rows get updated_timestamp when recomputed; the re-export lands in a later date, dedup by id.
+    "furnace_temperature_report": ("COALESCE(updated_timestamp, created_timestamp)", [
+        ("id", "int64"), ("DMC", "string"), ("PartID", "string"), ("Furnace", "string"),
+        ("MinTemp", "float64"), ("MaxTemp", "float64"), ("AvgTemp", "float64"),
+        ("MeasurementCount", "int64"), ("InsertTime", "timestamp"), ("FurnaceTimeSeconds", "int64"),
+        ("FurnaceTimeHours", "float64"), ("TempStartTime", "timestamp"), ("TempEndTime", "timestamp"),
+        ("TempDifference", "float64"), ("MeasurementsPerMinute", "float64"),
+        ("created_timestamp", "timestamp"), ("updated_timestamp", "timestamp"),
+    ]),
+}
+
+
+def _arrow_schema(columns: List[Tuple[str, str]]) -> "pa.Schema":
+    types = {"string": pa.string(), "int64": pa.int64(), "float64": pa.float64(), "timestamp": pa.timestamp("ms")}
+    return pa.schema([(name, types[kind]) for name, kind in columns])
+
+
+class _LocalStore:
+    def __init__(self, root: str):
+        self.root = Path(root)
+
+    def read(self, path: str) -> Optional[bytes]:
+        target = self.root / path
+        return target.read_bytes() if target.exists() else None
+
+    def write(self, path: str, data: bytes) -> None:
+        with self.open_write(path) as sink:
+            sink.write(data)
+
+    @contextlib.contextmanager
+    def open_write(self, path: str) -> Iterator[Any]:
+        """File to write `path` into; replaces the target only when the block succeeds."""
+        target = self.root / path
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = target.with_suffix(target.suffix + ".tmp")
+        try:
+            with open(tmp, "wb") as sink:
+                yield sink
+            tmp.replace(target)
+        finally:
+            tmp.unlink(missing_ok=True)
+
+    def list(self, prefix: str) -> List[str]:
+        folder = self.root / prefix
+        return [f"{prefix}{p.name}" for p in folder.iterdir() if p.is_file()] if folder.is_dir() else []
+
+    def delete(self, path: str) -> None:
+        (self.root / path).unlink(missing_ok=True)
+
+
+class _BlobStore:
+    def __init__(self, connection_string: str, container: str):
+        from azure.core.exceptions import ResourceExistsError
+        from azure.storage.blob import BlobServiceClient
+
+        self._container = BlobServiceClient.from_connection_string(connection_string).get_container_client(container)
+        try:
+            self._container.create_container()
+        except ResourceExistsError:
+            pass
+
+    def read(self, path: str) -> Optional[bytes]:
+        from azure.core.exceptions import ResourceNotFoundError
+
+        try:
+            return self._container.download_blob(path).readall()
+        except ResourceNotFoundError:
+            return None
+
+    def write(self, path: str, data: bytes) -> None:
+        self._container.upload_blob(path, data, overwrite=True)
+
+    @contextlib.contextmanager
+    def open_write(self, path: str) -> Iterator[Any]:
+        """Spool to a local temp file and upload it (streamed) when the block succeeds."""
+        with tempfile.TemporaryFile() as sink:
+            yield sink
+            sink.seek(0)
+            self._container.upload_blob(path, sink, overwrite=True)
+
+    def list(self, prefix: str) -> List[str]:
+        return [blob.name for blob in self._container.list_blobs(name_starts_with=prefix)]
+
+    def delete(self, path: str) -> None:
+        self._container.delete_blob(path)
+
+
+def open_store():
+    if ANALYTICS_EXPORT_DIR:
+        return _LocalStore(ANALYTICS_EXPORT_DIR)
+    return _BlobStore(os.environ["AzureWebJobsStorage"], ANALYTICS_EXPORT_CONTAINER)
+
+
+def _watermark_path(database: str, table: str) -> str:
+    return f"_watermarks/{database}/{table}.json"
+
+
+def _partition(database: str, table: str, date: datetime.date) -> str:
+    return f"db={database}/table={table}/date={date.isoformat()}/"
+
+
+def export_date(conn_str: str, store, database: str, table: str, date: datetime.date,
+                end: datetime.datetime) -> int:
+    """Rewrite the partition of `date` with its rows up to `end` (exclusive); returns the row count."""
+    ts_expr, columns = EXPORT_TABLES[table]
+    schema = _arrow_schema(columns)
+    select = ", ".join(f"[{name}]" for name, _ in columns)
+    query = f"""
+        SELECT {select}
+        FROM [{database}].[dbo].[{table}]
+        WHERE {ts_expr} >= ? AND {ts_expr} < ?
+        ORDER BY {ts_expr}
+    """
+    day_start = datetime.datetime.combine(date, datetime.time())
+    day_end = min(end, day_start + datetime.timedelta(days=1))
+    prefix = _partition(database, table, date)
+    path = f"{prefix}data.parquet"
+
+    count = 0
+    with db_connect(conn_str) as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(query, (day_start, day_end))
+            chunk = cursor.fetchmany(ANALYTICS_FETCH_ROWS)
+            if not chunk:
+                return 0
+            with store.open_write(path) as sink:
+                writer = pq.ParquetWriter(sink, schema, compression="zstd")
+                pending: List[Any] = []
+                while chunk:
+                    pending.extend(chunk)
+                    chunk = cursor.fetchmany(ANALYTICS_FETCH_ROWS)
+                    if len(pending) >= ANALYTICS_ROW_GROUP_ROWS or not chunk:
+                        arrays = [pa.array([row[i] for row in pending], type=field.type)
+                                  for i, field in enumerate(schema)]
+                        writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+                        count += len(pending)
+                        pending = []
+                writer.close()
+        finally:
+            cursor.close()
+
+    # Files of the former part-<from>.parquet layout would duplicate the rewritten rows
+    for other in store.list(prefix):
+        if other != path:
+            store.delete(other)
+    return count
+
+
+def run_export(now: Optional[datetime.datetime] = None, store=None) -> Dict[str, Dict[str, Any]]:
+    """One pass over all databases and tables within the run budget; summary per database/table."""
+    if pa is None:
+        raise RuntimeError("pyarrow is not installed")
+    started = time.monotonic()
+    store = store or open_store()
+    now = now or datetime.datetime.now()
+    upper = now - datetime.timedelta(seconds=ANALYTICS_EXPORT_LAG_SECONDS)
+    conn_str = get_connection_string()
+    summary: Dict[str, Dict[str, Any]] = {}
+    for database in ANALYTICS_EXPORT_DATABASES:
+        for table in EXPORT_TABLES:
+            raw = store.read(_watermark_path(database, table))
+            if raw is None:
+                lower = datetime.datetime.fromisoformat(ANALYTICS_EXPORT_START)
+            else:
+                watermark = datetime.datetime.fromisoformat(json.loads(raw)["watermark"])
+                lower = watermark - datetime.timedelta(hours=ANALYTICS_EXPORT_OVERLAP_HOURS)
+            date = lower.date()
+            rows, dates = 0, []
+            while len(dates) < ANALYTICS_EXPORT_MAX_DAYS and datetime.datetime.combine(date, datetime.time()) < upper:
+                if time.monotonic() - started >= ANALYTICS_EXPORT_RUN_SECONDS:
+                    logging.warning("AnalyticsExport: run budget used up, continuing in the next run")
+                    return summary
+                rows += call_with_resilience(export_date, conn_str, store, database, table, date, upper,
+                                             deadline_seconds=ANALYTICS_EXPORT_DEADLINE_SECONDS)
+                dates.append(date)
+                done_to = min(upper, datetime.datetime.combine(date + datetime.timedelta(days=1), datetime.time()))
+                store.write(_watermark_path(database, table), json.dumps({
+                    "watermark": done_to.isoformat(),
+                    "exported_at": now.isoformat(),
+                }).encode("utf-8"))
+                summary[f"{database}.{table}"] = {"from": dates[0], "to": done_to, "rows": rows}
+                date += datetime.timedelta(days=1)
+    return summary
+
+
+@bp.function_name(name="AnalyticsExportTimer")
+@bp.timer_trigger(arg_name="timer", schedule="0 15 * * * *", run_on_startup=False, use_monitor=True)
+@timed_request("AnalyticsExport", db=None)
+def analytics_export(timer: func.TimerRequest) -> None:
+    if timer.past_due:
+        logging.warning("AnalyticsExport: timer is past due, catching up")
+    try:
+        summary = run_export()
+    except Exception as e:
+        logging.error(f"AnalyticsExport failed: {e}")
+        raise
+    for name, result in summary.items():
+        logging.info(f"AnalyticsExport {name}: {result['rows']} rows ({result['from']} .. {result['to']})")
@@ -0,0 +1,221 @@
+"""
+Write-behind ingest: queue consumer + status endpoint.
+
+Scan endpoints in async mode (see shared_utils.async_ingest_requested) answer
+202 with a tracking id and drop the validated payload on the ingest queue.
+This consumer applies the write through the same functions the synchronous
+path uses, with the tracking id as idempotency key.
+
+A write that can never be applied — the payload fails validation, or the
+message ends in the poison queue after ASYNC_INGEST_MAX_DEQUEUE deliveries —
+is recorded in dbo.ingest_failures (database/ingest_failures.sql), so
+IngestStatus answers "failed" with the reason instead of "pending" forever.
+"""
+import json
+import logging
+import os
+import azure.functions as func
+from shared_utils import (
+    get_connection_string,
+    is_idempotency_key_processed,
+    remember_idempotency_key,
+    call_with_resilience,
+    CircuitOpenError,
+    service_unavailable_response,
+    SQL_READ_DEADLINE_SECONDS,
+    ASYNC_INGEST_QUEUE,
+    db_connect,
+    run_blocking,
+    timed_request,
+    add_log_fields,
+)
+from ChangeStatus import update_gitter_status, update_gitter_status_batch
+from ControlStationInsert import insert_control_station
+from KovaciLinkaScan import process_kovaci_linka_scan
+
+bp = func.Blueprint()
+
+# Must match extensions.queues.maxDequeueCount in host.json
+ASYNC_INGEST_MAX_DEQUEUE = int(os.getenv("ASYNC_INGEST_MAX_DEQUEUE", "5"))
+FAILURE_REASON_MAX_LENGTH = 1000
+
+# route -> coroutine(data, conn_str, idempotency_key) -> truthy when applied
+INGEST_HANDLERS = {
+    "ChangeStatus": update_gitter_status,
+    "ChangeStatusBatch": update_gitter_status_batch,
+    "ControlStationInsert": insert_control_station,
+    "KovaciLinkaScan": process_kovaci_linka_scan,
+}
+
+
+@bp.function_name(name="AsyncIngestQueueFunc")
+@bp.queue_trigger(
+    arg_name="msg",
+    queue_name=ASYNC_INGEST_QUEUE,
+    connection="AzureWebJobsStorage"
+)
+@timed_request("AsyncIngestQueue")
+async def queue_function(msg: func.QueueMessage) -> None:
+    """Apply a write that was accepted by a scan endpoint in async mode."""
+    route = tracking_id = None
+    try:
+        envelope = json.loads(msg.get_body().decode("utf-8"))
+        route = envelope.get("route")
+        tracking_id = envelope.get("tracking_id")
+        payload = envelope.get("payload")
+        handler = INGEST_HANDLERS.get(route)
+        if handler is None or not tracking_id or not isinstance(payload, dict):
+            # Retrying can't fix a malformed envelope; ack it.
+            logging.error(f"Invalid async ingest message {msg.id}: route={route}, tracking_id={tracking_id}")
+            if tracking_id:
+                await _record_failure(tracking_id, route, f"Invalid async ingest message for route {route!r}")
+            return
+
+        add_log_fields(ingest_route=route, tracking_id=tracking_id, dequeue_count=msg.dequeue_count)
+        applied = await handler(payload, get_connection_string(), tracking_id)
+        if not applied:
+            add_log_fields(duplicate=True)
+
+    except json.JSONDecodeError as e:
+        logging.error(f"Invalid async ingest message format. Expected JSON. Error: {e}")
+    except ValueError as ve:
+        logging.error(f"Validation error in async ingest message {msg.id}: {ve}")
+        if tracking_id:
+            # Acked, so this is final; if recording fails the message is retried
+            await _record_failure(tracking_id, route, f"Validation error: {ve}")
+    except Exception as e:
+        logging.error(f"Error applying async ingest message {msg.id}: {e}")
+        if tracking_id and msg.dequeue_count >= ASYNC_INGEST_MAX_DEQUEUE:
+            # Last delivery: keep the real error, the poison trigger only knows it gave up
+            try:
+                await _record_failure(tracking_id, route, f"Not applied after {msg.dequeue_count} deliveries: {e}")
+            except Exception as record_error:
+                logging.error(f"Could not record ingest failure of {tracking_id}: {record_error}")
+        raise
+
+
+@bp.function_name(name="AsyncIngestPoisonQueueFunc")
+@bp.queue_trigger(
+    arg_name="msg",
+    queue_name=f"{ASYNC_INGEST_QUEUE}-poison",
+    connection="AzureWebJobsStorage"
+)
+@timed_request("AsyncIngestPoisonQueue")
+async def poison_queue_function(msg: func.QueueMessage) -> None:
+    """Mark a write the runtime gave up on as failed, so IngestStatus stops saying pending."""
+    try:
+        envelope = json.loads(msg.get_body().decode("utf-8"))
+    except ValueError as e:
+        logging.error(f"Invalid poison async ingest message {msg.id}: {e}")
+        return
+    tracking_id = envelope.get("tracking_id") if isinstance(envelope, dict) else None
+    if not tracking_id:
+        logging.error(f"Poison async ingest message {msg.id} has no tracking_id")
+        return
+    add_log_fields(ingest_route=envelope.get("route"), tracking_id=tracking_id)
+    await _record_failure(
+        tracking_id, envelope.get("route"), f"Not applied after {ASYNC_INGEST_MAX_DEQUEUE} deliveries"
+    )
+
+
+def record_ingest_failure(conn_str: str, tracking_id: str, route: str, reason: str) -> None:
+    """Insert the failure unless one is recorded already (the first reason is the informative one)."""
+    with db_connect(conn_str) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                """
+                INSERT INTO dbo.ingest_failures (tracking_id, route, reason)
+                SELECT ?, ?, ?
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM dbo.ingest_failures WITH (UPDLOCK, HOLDLOCK)
+                    WHERE tracking_id = ?
+                );
+                """,
+                (tracking_id, route, reason[:FAILURE_REASON_MAX_LENGTH], tracking_id)
+            )
+        conn.commit()
+
+
+async def _record_failure(tracking_id: str, route: str, reason: str) -> None:
+    await run_blocking(call_with_resilience, record_ingest_failure, get_connection_string(), tracking_id, route, reason)
+
+
+def fetch_ingest_status(conn_str: str, tracking_id: str) -> dict:
+    """Look up whether the write behind `tracking_id` has been committed or has failed for good."""
+    if is_idempotency_key_processed(tracking_id, "IngestStatus"):
+        return {"tracking_id": tracking_id, "status": "applied"}
+
+    with db_connect(conn_str) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT route, created_timestamp
+                FROM dbo.idempotency_keys
+                WHERE idempotency_key = ?
+                """,
+                (tracking_id,)
+            )
+            row = cursor.fetchone()
+            failure = None
+            if not row:
+                cursor.execute(
+                    """
+                    SELECT route, reason, failed_timestamp
+                    FROM dbo.ingest_failures
+                    WHERE tracking_id = ?
+                    """,
+                    (tracking_id,)
+                )
+                failure = cursor.fetchone()
+
+    if failure:
+        return {
+            "tracking_id": tracking_id,
+            "status": "failed",
+            "route": failure[0],
+            "reason": failure[1],
+            "failed_timestamp": failure[2],
+        }
+    if not row:
+        return {"tracking_id": tracking_id, "status": "pending"}
+
+    remember_idempotency_key(tracking_id, "IngestStatus")
+    return {
+        "tracking_id": tracking_id,
+        "status": "applied",
+        "route": row[0],
+        "applied_timestamp": row[1],
+    }
+
+
+@bp.function_name(name="IngestStatus")
+@bp.route(route="IngestStatus", methods=["GET"], auth_level=func.AuthLevel.FUNCTION)
+@timed_request("IngestStatus")
+def ingest_status(req: func.HttpRequest) -> func.HttpResponse:
+    tracking_id = (req.params.get("tracking_id") or "").strip()
+    if not tracking_id:
+        return func.HttpResponse(
+            json.dumps({"error": "Missing tracking_id"}),
+            status_code=400,
+            mimetype="application/json"
+        )
+
+    try:
+        payload = call_with_resilience(
+            fetch_ingest_status, get_connection_string(), tracking_id,
+            deadline_seconds=SQL_READ_DEADLINE_SECONDS
+        )
+        return func.HttpResponse(
+            json.dumps(payload, default=str),
+            status_code=200,
+            mimetype="application/json"
+        )
+    except CircuitOpenError as e:
+        return service_unavailable_response(e)
+    except Exception as e:
+        logging.error(f"Error reading ingest status for {tracking_id}: {e}")
+        return func.HttpResponse(
+            json.dumps({"error": str(e)}),
+            status_code=500,
+            mimetype="application/json"
+        )
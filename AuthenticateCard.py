@@ -5,10 +5,10 @@ Autentifikácia používateľov pomocou NFC/RFID kariet
 
 import logging
 import azure.functions as func
-import pyodbc
 import json
 import os
 from typing import Optional, Dict, Any
+from shared_utils import db_connect, timed_request
 
 # Create a Blueprint for registering with the Functions host
 bp = func.Blueprint()
@@ -19,6 +19,8 @@ def get_connection_string() -> str:
     sql_user = os.getenv("AZURE_SQL_DB_USER")
     sql_pwd = os.getenv("AZURE_SQL_DB_PASSWORD")
     sql_driver = os.getenv("AZURE_SQL_DRIVER", "ODBC Driver 17 for SQL Server")
+    # "yes" only for a local SQL Server with a self-signed cert (benchmarks/)
+    trust_cert = os.getenv("AZURE_SQL_TRUST_SERVER_CERTIFICATE", "no")
 
     return (f"Driver={sql_driver};"
             f"Server={sql_conn_str};"
@@ -26,7 +28,7 @@ def get_connection_string() -> str:
             f"Uid={sql_user};"
             f"Pwd={sql_pwd};"
             "Encrypt=yes;"
-            "TrustServerCertificate=no;"
+            f"TrustServerCertificate={trust_cert};"
             "Connection Timeout=60;")
 
 def authenticate_card(conn_str: str, card_id: str) -> Optional[Dict[str, Any]]:
@@ -42,7 +44,7 @@ def authenticate_card(conn_str: str, card_id: str) -> Optional[Dict[str, Any]]:
         Dictionary with authentication result or None on error
     """
     try:
-        conn = pyodbc.connect(conn_str)
+        conn = db_connect(conn_str)
         cursor = conn.cursor()
         
         # Call stored procedure
@@ -81,6 +83,7 @@ def authenticate_card(conn_str: str, card_id: str) -> Optional[Dict[str, Any]]:
         }
 
 @bp.route(route="authenticatecard", methods=["GET", "POST"], auth_level=func.AuthLevel.FUNCTION)
+@timed_request("authenticatecard")
 def AuthenticateCard(req: func.HttpRequest) -> func.HttpResponse:
     """
     HTTP endpoint for NFC/RFID card authentication
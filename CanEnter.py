@@ -0,0 +1,46 @@
+"""
+HTTP GET: pre-flight check whether a part may enter a station.
+Kontrola před skenem — smí díl vstoupit na danou stanici?
+
+Rules: station_rules.STATION_RULES (mirror of trg_Insert_Update_Part_Status).
+"""
+import json
+import logging
+import azure.functions as func
+from shared_utils import get_connection_string, CircuitOpenError, service_unavailable_response, timed_request
+from station_rules import can_enter
+
+bp = func.Blueprint()
+
+
+@bp.function_name(name="CanEnter")
+@bp.route(route="CanEnter", methods=["GET"], auth_level=func.AuthLevel.ANONYMOUS)
+@timed_request("CanEnter")
+def can_enter_http(req: func.HttpRequest) -> func.HttpResponse:
+    part_id = (req.params.get("part_id") or "").strip()
+    station_id = (req.params.get("station_id") or "").strip()
+    status = req.params.get("status") or "OK"
+
+    if not part_id or not station_id:
+        return func.HttpResponse(
+            json.dumps({"error": "Missing part_id or station_id"}),
+            status_code=400,
+            mimetype="application/json"
+        )
+
+    try:
+        decision = can_enter(get_connection_string(), part_id, station_id, status)
+        return func.HttpResponse(
+            json.dumps(decision, ensure_ascii=False),
+            status_code=200,
+            mimetype="application/json"
+        )
+    except CircuitOpenError as e:
+        return service_unavailable_response(e)
+    except Exception as e:
+        logging.error(f"CanEnter failed for part {part_id} at station {station_id}: {e}")
+        return func.HttpResponse(
+            json.dumps({"error": str(e)}),
+            status_code=500,
+            mimetype="application/json"
+        )
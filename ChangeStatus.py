@@ -1,18 +1,63 @@
 import logging
 import azure.functions as func
-import pyodbc
 import json
 import asyncio
 import concurrent.futures
-from typing import Dict, Any
-from shared_utils import get_connection_string
+import contextvars
+from typing import Dict, Any, List, Optional
+from shared_utils import (
+    get_connection_string,
+    idempotency_key_from_request,
+    is_idempotency_key_processed,
+    remember_idempotency_key,
+    claim_idempotency_key,
+    serialization_keys,
+    run_serialized,
+    CircuitOpenError,
+    service_unavailable_response,
+    async_ingest_requested,
+    enqueue_ingest,
+    ingest_accepted_response,
+    db_connect,
+    timed_request,
+    add_log_fields,
+    log_event,
+    notify_write,
+)
 
 
 # Create a Blueprint for registering with the Functions host
 bp = func.Blueprint()
 
-async def update_gitter_status(data: Dict[str, Any], conn_str: str) -> None:
-    """Update gitter status using a separate thread."""
+REQUIRED_FIELDS = ["station_id", "status", "shipping_id", "current_workspace_id"]
+BATCH_REQUIRED_FIELDS = ["station_id", "status", "shipping_ids", "current_workspace_id"]
+MAX_BATCH_SHIPPING_IDS = 200
+
+def is_batch_request(data: Dict[str, Any]) -> bool:
+    """A body with `shipping_ids` (list) moves several gitterboxes at once."""
+    return isinstance(data, dict) and "shipping_ids" in data
+
+def validate_gitter_status(data: Dict[str, Any]) -> None:
+    """Raise ValueError if the status change payload can't be written."""
+    if not isinstance(data, dict):
+        raise ValueError("Request body must be a JSON object")
+    required_fields = BATCH_REQUIRED_FIELDS if is_batch_request(data) else REQUIRED_FIELDS
+    missing_fields = [field for field in required_fields if data.get(field) in (None, "", [])]
+    if missing_fields:
+        raise ValueError(f"Missing required fields: {', '.join(missing_fields)}")
+    if is_batch_request(data):
+        shipping_ids = data["shipping_ids"]
+        if not isinstance(shipping_ids, list) or not all(isinstance(s, str) and s.strip() for s in shipping_ids):
+            raise ValueError("shipping_ids must be a list of non-empty strings")
+        if len(shipping_ids) > MAX_BATCH_SHIPPING_IDS:
+            raise ValueError(f"At most {MAX_BATCH_SHIPPING_IDS} shipping_ids per request")
+
+async def update_gitter_status(data: Dict[str, Any], conn_str: str,
+                               idempotency_key: Optional[str] = None) -> bool:
+    """Update gitter status using a separate thread.
+
+    Returns False when the write was skipped as a replay of `idempotency_key`.
+    """
     station_id = data.get("station_id")
     status = data.get("status")
     status_timestamp = data.get("status_timestamp")
@@ -20,28 +65,41 @@ async def update_gitter_status(data: Dict[str, Any], conn_str: str) -> None:
     current_workspace_id = data.get("current_workspace_id")
     employee_id = data.get("employee_id")
     
-    # Use thread pool for database operations
-    with concurrent.futures.ThreadPoolExecutor() as pool:
-        await asyncio.get_event_loop().run_in_executor(
-            pool,
-            execute_stored_procedure,
-            conn_str,
-            station_id,
-            status,
-            status_timestamp,
-            shipping_id,
-            current_workspace_id,
-            employee_id
-        )
+    # Serialize with other writes to the same gitterbox (part_status trigger)
+    return await run_serialized(
+        serialization_keys(shipping_ids=[shipping_id]),
+        execute_stored_procedure,
+        conn_str,
+        station_id,
+        status,
+        status_timestamp,
+        shipping_id,
+        current_workspace_id,
+        employee_id,
+        idempotency_key,
+        idempotent=idempotency_key is not None
+    )
 
 def execute_stored_procedure(conn_str: str, station_id: str, status: str, 
                             status_timestamp: str, shipping_id: str, current_workspace_id: str = None, 
-                            employee_id: str = None) -> None:
+                            employee_id: str = None, idempotency_key: str = None) -> bool:
     """Execute the stored procedure in a separate thread."""
+    if is_idempotency_key_processed(idempotency_key, "ChangeStatus"):
+        log_event("ChangeStatus", "Skipping replayed status change", idempotency_key=idempotency_key,
+                  shipping_id=shipping_id)
+        return False
+
+    conn = None
+    cursor = None
     try:
-        conn = pyodbc.connect(conn_str)
+        conn = db_connect(conn_str)
         cursor = conn.cursor()
 
+        if idempotency_key and not claim_idempotency_key(cursor, idempotency_key, "ChangeStatus"):
+            conn.rollback()
+            remember_idempotency_key(idempotency_key, "ChangeStatus")
+            return False
+
         cursor.execute(
             """
             EXEC set_gitter_status 
@@ -55,15 +113,104 @@ def execute_stored_procedure(conn_str: str, station_id: str, status: str,
             (station_id, status, status_timestamp, shipping_id, current_workspace_id, employee_id)
         )
         conn.commit()
-        logging.info(f"Stored procedure executed successfully for station: {station_id}")
+        remember_idempotency_key(idempotency_key, "ChangeStatus")
+        log_event("ChangeStatus", "Gitterbox status changed", shipping_id=shipping_id, station_id=station_id)
+        notify_write("gitter_status", shipping_ids=[shipping_id], station_id=station_id,
+                     current_workspace_id=current_workspace_id, status=status)
+        return True
 
     except Exception as e:
         logging.error(f"Error executing stored procedure for station {station_id}: {e}")
         raise e
 
     finally:
-        cursor.close()
-        conn.close()
+        if cursor is not None:
+            cursor.close()
+        if conn is not None:
+            conn.close()
+
+async def update_gitter_status_batch(data: Dict[str, Any], conn_str: str,
+                                     idempotency_key: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
+    """Move several gitterboxes of one station in one transaction.
+
+    Returns per-gitterbox affected part counts, or None when the write was
+    skipped as a replay of `idempotency_key`.
+    """
+    shipping_ids = list(dict.fromkeys(s.strip() for s in data.get("shipping_ids")))
+    
+    # Holds all gitterboxes of the batch (acquired in sorted order)
+    return await run_serialized(
+        serialization_keys(shipping_ids=shipping_ids),
+        execute_batch_procedure,
+        conn_str,
+        data.get("station_id"),
+        data.get("status"),
+        data.get("status_timestamp"),
+        shipping_ids,
+        data.get("current_workspace_id"),
+        data.get("employee_id"),
+        idempotency_key,
+        idempotent=idempotency_key is not None
+    )
+
+def execute_batch_procedure(conn_str: str, station_id: str, status: str, status_timestamp: str,
+                            shipping_ids: List[str], current_workspace_id: str = None,
+                            employee_id: str = None, idempotency_key: str = None) -> Optional[List[Dict[str, Any]]]:
+    """Execute set_gitter_status_batch in a separate thread."""
+    if is_idempotency_key_processed(idempotency_key, "ChangeStatus"):
+        log_event("ChangeStatus", "Skipping replayed batch status change", idempotency_key=idempotency_key,
+                  station_id=station_id)
+        return None
+
+    conn = None
+    cursor = None
+    try:
+        conn = db_connect(conn_str)
+        cursor = conn.cursor()
+
+        if idempotency_key and not claim_idempotency_key(cursor, idempotency_key, "ChangeStatus"):
+            conn.rollback()
+            remember_idempotency_key(idempotency_key, "ChangeStatus")
+            return None
+
+        cursor.execute(
+            """
+            EXEC set_gitter_status_batch 
+                @station_id = ?,
+                @status = ?,
+                @status_timestamp = ?,
+                @shipping_ids = ?,
+                @current_workspace_id = ?,
+                @employee_id = ?;
+            """,
+            (station_id, status, status_timestamp, json.dumps(shipping_ids), current_workspace_id, employee_id)
+        )
+        # Skip anything before the per-gitterbox result set
+        while cursor.description is None and cursor.nextset():
+            pass
+        counts = {row[0]: int(row[1]) for row in cursor.fetchall()} if cursor.description else {}
+        conn.commit()
+        remember_idempotency_key(idempotency_key, "ChangeStatus")
+
+        results = [
+            {"shipping_id": shipping_id, "affected_parts": counts.get(shipping_id, 0)}
+            for shipping_id in shipping_ids
+        ]
+        log_event("ChangeStatus", "Batch status change", station_id=station_id, gitterboxes=len(shipping_ids),
+                  parts=sum(r['affected_parts'] for r in results))
+        notify_write("gitter_status", shipping_ids=shipping_ids, station_id=station_id,
+                     current_workspace_id=current_workspace_id, status=status)
+        return results
+
+    except Exception as e:
+        logging.error(f"Error executing batch stored procedure for station {station_id}: {e}")
+        raise e
+
+    finally:
+        if cursor is not None:
+            cursor.close()
+        if conn is not None:
+            conn.close()
 
 async def update_kovaci_linka_scan(data: Dict[str, Any], conn_str: str) -> None:
     """Update kovaci linka scan using a separate thread."""
@@ -75,6 +222,7 @@ async def update_kovaci_linka_scan(data: Dict[str, Any], conn_str: str) -> None:
     with concurrent.futures.ThreadPoolExecutor() as pool:
         await asyncio.get_event_loop().run_in_executor(
             pool,
+            contextvars.copy_context().run,
             execute_kovaci_linka_procedure,
             conn_str,
             gitter_id,
@@ -85,7 +233,7 @@ async def update_kovaci_linka_scan(data: Dict[str, Any], conn_str: str) -> None:
 def execute_kovaci_linka_procedure(conn_str: str, gitter_id: str, user: str, position: str) -> None:
     """Execute the stored procedure for kovaci linka scans in a separate thread."""
     try:
-        conn = pyodbc.connect(conn_str)
+        conn = db_connect(conn_str)
         cursor = conn.cursor()
 
         cursor.execute(
@@ -98,7 +246,7 @@ def execute_kovaci_linka_procedure(conn_str: str, gitter_id: str, user: str, pos
             (gitter_id, user, position)
         )
         conn.commit()
-        logging.info(f"Kovaci linka scan saved successfully for gitter: {gitter_id}")
+        log_event("ChangeStatus", "Kovaci linka scan saved", gitter_id=gitter_id, position=position)
 
     except Exception as e:
         logging.error(f"Error saving kovaci linka scan for gitter {gitter_id}: {e}")
@@ -110,6 +258,7 @@ def execute_kovaci_linka_procedure(conn_str: str, gitter_id: str, user: str, pos
 
 @bp.function_name(name="ChangeStatusHttpFunc")
 @bp.route(route="ChangeStatus", methods=["POST"], auth_level=func.AuthLevel.FUNCTION)
+@timed_request("ChangeStatus")
 async def http_function(req: func.HttpRequest) -> func.HttpResponse:
     """Process HTTP request to change gitter status."""
     conn_str = get_connection_string()
@@ -117,13 +266,35 @@ async def http_function(req: func.HttpRequest) -> func.HttpResponse:
     try:
         # Parse the request body
         req_body = req.get_json()
-        logging.info(f"Processing HTTP request: {req_body}")
+        # Rejects arrays and scalars (400) before anything calls .get on the body
+        validate_gitter_status(req_body)
+        add_log_fields(station_id=req_body.get("station_id"), shipping_id=req_body.get("shipping_id"))
+        idempotency_key = idempotency_key_from_request(req, req_body)
+
+        if async_ingest_requested("ChangeStatus", req):
+            route = "ChangeStatusBatch" if is_batch_request(req_body) else "ChangeStatus"
+            tracking_id = await enqueue_ingest(route, req_body, idempotency_key)
+            return ingest_accepted_response(tracking_id)
+
+        if is_batch_request(req_body):
+            results = await update_gitter_status_batch(req_body, conn_str, idempotency_key)
+            return func.HttpResponse(
+                body=json.dumps({
+                    "message": "Status updated successfully",
+                    "duplicate": results is None,
+                    "station_id": req_body.get("station_id"),
+                    "results": results or [],
+                    "total_affected_parts": sum(r["affected_parts"] for r in results or []),
+                }),
+                mimetype="application/json",
+                status_code=200
+            )
         
         # Process request asynchronously
-        await update_gitter_status(req_body, conn_str)
+        applied = await update_gitter_status(req_body, conn_str, idempotency_key)
         
         return func.HttpResponse(
-            body=json.dumps({"message": "Status updated successfully"}),
+            body=json.dumps({"message": "Status updated successfully", "duplicate": not applied}),
             mimetype="application/json",
             status_code=200
         )
@@ -135,6 +306,16 @@ async def http_function(req: func.HttpRequest) -> func.HttpResponse:
             mimetype="application/json",
             status_code=400
         )
+    except CircuitOpenError as e:
+        logging.error(f"Database unavailable, rejecting status change: {e}")
+        return service_unavailable_response(e)
+    except ValueError as e:
+        logging.error(f"Invalid request: {e}")
+        return func.HttpResponse(
+            body=json.dumps({"error": str(e)}),
+            mimetype="application/json",
+            status_code=400
+        )
     except Exception as e:
         logging.error(f"Error processing request: {e}")
         return func.HttpResponse(
@@ -1,19 +1,35 @@
 import logging
 import azure.functions as func
-import pyodbc
 import json
-import asyncio
-import concurrent.futures
 from azure.storage.queue import QueueClient
-from typing import Dict, Any
-from shared_utils import get_connection_string
+from typing import Dict, Any, Optional
+from shared_utils import (
+    get_connection_string,
+    idempotency_key_from_message,
+    is_idempotency_key_processed,
+    remember_idempotency_key,
+    claim_idempotency_key,
+    serialization_keys,
+    run_serialized,
+    run_blocking,
+    db_connect,
+    timed_request,
+    add_log_fields,
+    log_event,
+    notify_write,
+)
+from station_rules import can_enter, forget_part_state, is_gating_enforced, peek_part_state
 
 
 # Create a Blueprint for registering with the Functions host
 bp = func.Blueprint()
 
-async def insert_traceability_log(data: Dict[str, Any], conn_str: str) -> None:
-    """Insert data into traceability_log table using a separate thread."""
+async def insert_traceability_log(data: Dict[str, Any], conn_str: str,
+                                  idempotency_key: Optional[str] = None) -> bool:
+    """Insert data into traceability_log table using a separate thread.
+
+    Returns False when the write was skipped as a replay of `idempotency_key`.
+    """
     part_id = data.get("part_id")
     employee_id = data.get("employee_id")
     station_id = data.get("station_id")
@@ -21,27 +37,40 @@ async def insert_traceability_log(data: Dict[str, Any], conn_str: str) -> None:
     status_timestamp = data.get("status_timestamp")
     shipping_id = data.get("shipping_id")
     
-    # Use thread pool for database operations
-    with concurrent.futures.ThreadPoolExecutor() as pool:
-        await asyncio.get_event_loop().run_in_executor(
-            pool,
-            execute_stored_procedure,
-            conn_str,
-            part_id,
-            employee_id,
-            station_id,
-            status,
-            status_timestamp,
-            shipping_id
-        )
+    # Serialize with other writes to the same part / gitterbox (part_status trigger)
+    return await run_serialized(
+        serialization_keys([part_id], [shipping_id]),
+        execute_stored_procedure,
+        conn_str,
+        part_id,
+        employee_id,
+        station_id,
+        status,
+        status_timestamp,
+        shipping_id,
+        idempotency_key,
+        idempotent=idempotency_key is not None
+    )
 
 def execute_stored_procedure(conn_str: str, part_id: str, employee_id: str, station_id: str, 
-                            status: str, status_timestamp: str, shipping_id: str = None) -> None:
+                            status: str, status_timestamp: str, shipping_id: str = None,
+                            idempotency_key: str = None) -> bool:
     """Execute the stored procedure in a separate thread."""
+    if is_idempotency_key_processed(idempotency_key, "CheckInsert"):
+        log_event("CheckInsertQueue", "Skipping replayed message", idempotency_key=idempotency_key, part_id=part_id)
+        return False
+
+    conn = None
+    cursor = None
     try:
-        conn = pyodbc.connect(conn_str)
+        conn = db_connect(conn_str)
         cursor = conn.cursor()
 
+        if idempotency_key and not claim_idempotency_key(cursor, idempotency_key, "CheckInsert"):
+            conn.rollback()
+            remember_idempotency_key(idempotency_key, "CheckInsert")
+            return False
+
         cursor.execute(
             """
             EXEC InsertTraceabilityLog 
@@ -55,15 +84,24 @@ def execute_stored_procedure(conn_str: str, part_id: str, employee_id: str, stat
             (part_id, employee_id, station_id, status, status_timestamp, shipping_id)
         )
         conn.commit()
-        logging.info(f"Stored procedure executed successfully for code: {part_id}")
+        remember_idempotency_key(idempotency_key, "CheckInsert")
+        # State before the scan (from the gating check) lets listeners move counters exactly
+        cached, previous = peek_part_state(part_id)
+        forget_part_state(part_id)
+        notify_write("part", part_id=part_id, station_id=station_id, status=status, shipping_id=shipping_id,
+                     **({"previous": previous} if cached else {}))
+        log_event("CheckInsertQueue", "Scan written", part_id=part_id, station_id=station_id)
+        return True
 
     except Exception as e:
         logging.error(f"Error executing stored procedure for code {part_id}: {e}")
         raise e
 
     finally:
-        cursor.close()
-        conn.close()
+        if cursor is not None:
+            cursor.close()
+        if conn is not None:
+            conn.close()
 
 @bp.function_name(name="QueueFunc")
 @bp.queue_trigger(
@@ -71,6 +109,7 @@ def execute_stored_procedure(conn_str: str, part_id: str, employee_id: str, stat
     queue_name="operations-log-insert-test",
     connection="AzureWebJobsStorage"
 )
+@timed_request("CheckInsertQueue")
 async def queue_function(msg: func.QueueMessage) -> None:
     """Process queue message."""
     conn_str = get_connection_string()
@@ -78,12 +117,29 @@ async def queue_function(msg: func.QueueMessage) -> None:
     try:
         # Decode and parse the queue message
         message_body = msg.get_body().decode("utf-8")
-        logging.info(f"Processing queue message: {message_body}")
-        
         data = json.loads(message_body)
+        add_log_fields(part_id=data.get("part_id"), station_id=data.get("station_id"))
+        idempotency_key = idempotency_key_from_message(msg, data)
+
+        # Reject scans the trigger would ignore anyway, before they cost a
+        # connection, a trigger run and a history row.
+        if is_gating_enforced() and data.get("part_id") and data.get("station_id") is not None:
+            decision = await run_blocking(
+                can_enter,
+                conn_str,
+                data.get("part_id"),
+                data.get("station_id"),
+                data.get("status")
+            )
+            if not decision["allowed"]:
+                logging.warning(
+                    f"Scan rejected for code {data.get('part_id')} at station {data.get('station_id')}: "
+                    f"{decision['reason']}"
+                )
+                return
         
         # Process message asynchronously
-        await insert_traceability_log(data, conn_str)
+        await insert_traceability_log(data, conn_str, idempotency_key)
         
     except json.JSONDecodeError as e:
         logging.error(f"Invalid message format. Expected JSON. Error: {e}")
@@ -2,11 +2,25 @@ import logging
 import azure.functions as func
 import pyodbc
 import json
-import asyncio
-import concurrent.futures
 import datetime
-from typing import Dict, Any
-from shared_utils import get_connection_string
+from typing import Dict, Any, Optional
+from shared_utils import (
+    get_connection_string,
+    idempotency_key_from_request,
+    is_idempotency_key_processed,
+    remember_idempotency_key,
+    claim_idempotency_key,
+    serialization_keys,
+    run_serialized,
+    CircuitOpenError,
+    service_unavailable_response,
+    async_ingest_requested,
+    enqueue_ingest,
+    ingest_accepted_response,
+    db_connect,
+    timed_request,
+    log_event,
+)
 
 
 bp = func.Blueprint()
@@ -59,8 +73,12 @@ def _parse_timestamp(raw: Any) -> datetime.datetime:
     return dt.replace(microsecond=micro)
 
 
-async def insert_control_station(data: Dict[str, Any], conn_str: str) -> None:
-    """Insert control station data into database using a separate thread."""
+async def insert_control_station(data: Dict[str, Any], conn_str: str,
+                                 idempotency_key: Optional[str] = None) -> bool:
+    """Insert control station data into database using a separate thread.
+
+    Returns False when the write was skipped as a replay of `idempotency_key`.
+    """
     station_id = data.get("station_id")
     part_id = data.get("part_id")
     sample = data.get("sample", 1)
@@ -72,32 +90,43 @@ async def insert_control_station(data: Dict[str, Any], conn_str: str) -> None:
     control_group_id = data.get("control_group_id")
     status = _normalize_status(data.get("status"))
 
-    with concurrent.futures.ThreadPoolExecutor() as pool:
-        await asyncio.get_event_loop().run_in_executor(
-            pool,
-            execute_insert,
-            conn_str,
-            station_id,
-            part_id,
-            sample,
-            check_timestamp,
-            shipping_id,
-            operator_id,
-            part_type,
-            melt,
-            control_group_id,
-            status,
-        )
+    # trg_Control_Station_Complete updates the part's Control_check / Quality_check
+    return await run_serialized(
+        serialization_keys([part_id]),
+        execute_insert,
+        conn_str,
+        station_id,
+        part_id,
+        sample,
+        check_timestamp,
+        shipping_id,
+        operator_id,
+        part_type,
+        melt,
+        control_group_id,
+        status,
+        idempotency_key,
+        idempotent=idempotency_key is not None
+    )
 
 
 def execute_insert(conn_str: str, station_id: int, part_id: str, sample: int,
                    check_timestamp: datetime.datetime, shipping_id: str, operator_id: str,
                    part_type: int, melt: str, control_group_id: int,
-                   status: str) -> None:
+                   status: str, idempotency_key: str = None) -> bool:
     """Execute insert into Control_Station."""
+    if is_idempotency_key_processed(idempotency_key, "ControlStationInsert"):
+        log_event("ControlStationInsert", "Skipping replayed Control_Station insert", idempotency_key=idempotency_key,
+                  part_id=part_id)
+        return False
+
     try:
-        with pyodbc.connect(conn_str, timeout=30) as conn:
+        with db_connect(conn_str, timeout=30) as conn:
             cursor = conn.cursor()
+            if idempotency_key and not claim_idempotency_key(cursor, idempotency_key, "ControlStationInsert"):
+                conn.rollback()
+                remember_idempotency_key(idempotency_key, "ControlStationInsert")
+                return False
             cursor.execute(
                 """
                 INSERT INTO dbo.Control_Station (
@@ -126,10 +155,10 @@ def execute_insert(conn_str: str, station_id: int, part_id: str, sample: int,
                 status,
             )
             conn.commit()
-            logging.info(
-                f"Control_Station insert ok for part_id={part_id} "
-                f"station_id={station_id} status={status}"
-            )
+            remember_idempotency_key(idempotency_key, "ControlStationInsert")
+            log_event("ControlStationInsert", "Control_Station insert ok",
+                      part_id=part_id, station_id=station_id, status=status)
+            return True
     except Exception as exc:
         logging.error(f"Control_Station insert failed for part_id {part_id}: {exc}", exc_info=True)
         raise
@@ -137,10 +166,9 @@ def execute_insert(conn_str: str, station_id: int, part_id: str, sample: int,
 
 @bp.function_name(name="ControlStationInsertHttpFunc")
 @bp.route(route="ControlStationInsert", methods=["POST"], auth_level=func.AuthLevel.FUNCTION)
+@timed_request("ControlStationInsert")
 async def http_function(req: func.HttpRequest) -> func.HttpResponse:
     """HTTP endpoint to insert control station data."""
-    logging.info("ControlStationInsert Azure function triggered.")
-
     try:
         if not req.headers.get('content-type', '').startswith('application/json'):
             return func.HttpResponse(
@@ -181,11 +209,19 @@ async def http_function(req: func.HttpRequest) -> func.HttpResponse:
             except (ValueError, TypeError):
                 req_body["control_group_id"] = None
 
+        idempotency_key = idempotency_key_from_request(req, req_body)
+
+        if async_ingest_requested("ControlStationInsert", req):
+            # Timestamp the check on arrival, not when the queue consumer applies it.
+            req_body["check_timestamp"] = _parse_timestamp(req_body.get("check_timestamp")).isoformat()
+            tracking_id = await enqueue_ingest("ControlStationInsert", req_body, idempotency_key)
+            return ingest_accepted_response(tracking_id)
+
         conn_str = get_connection_string()
-        await insert_control_station(req_body, conn_str)
+        applied = await insert_control_station(req_body, conn_str, idempotency_key)
 
         return func.HttpResponse(
-            body=json.dumps({"message": "Control station data inserted successfully"}),
+            body=json.dumps({"message": "Control station data inserted successfully", "duplicate": not applied}),
             mimetype="application/json",
             status_code=200
         )
@@ -196,6 +232,9 @@ async def http_function(req: func.HttpRequest) -> func.HttpResponse:
             mimetype="application/json",
             status_code=400
         )
+    except CircuitOpenError as e:
+        logging.error(f"Database unavailable in ControlStationInsert: {e}")
+        return service_unavailable_response(e)
     except pyodbc.Error as db_error:
         logging.error(f"Database error in ControlStationInsert: {db_error}", exc_info=True)
         return func.HttpResponse(
@@ -0,0 +1,61 @@
+"""
+HTTP GET: process diagnostics of this worker for scraping (every few seconds is fine).
+Diagnostika workeru — latence, rozpracované požadavky, DB spojení, executor, cache.
+
+Everything is read from in-memory counters; no DB call is made. Values are
+per worker process, so with several instances scrape each or sum them.
+"""
+import json
+import time
+import azure.functions as func
+from shared_utils import (
+    cache_stats, connection_stats, executor_stats, get_histograms, get_metrics,
+    in_flight_requests, slow_query_report, sql_circuit_breaker
+)
+
+bp = func.Blueprint()
+
+_started = time.time()
+_CIRCUIT_STATES = {
+    sql_circuit_breaker.CLOSED: "closed",
+    sql_circuit_breaker.HALF_OPEN: "half_open",
+    sql_circuit_breaker.OPEN: "open",
+}
+
+
+def _by_route(prefix: str, include_buckets: bool) -> dict:
+    """{"<prefix>{route=X}": snapshot} -> {"X": snapshot}"""
+    result = {}
+    for name, snapshot in get_histograms(prefix + "{").items():
+        if not include_buckets:
+            snapshot.pop("buckets", None)
+        result[name[len(prefix) + len("{route="):-1]] = snapshot
+    return result
+
+
+@bp.function_name(name="Diagnostics")
+@bp.route(route="_diag", methods=["GET"], auth_level=func.AuthLevel.FUNCTION)
+def diagnostics(req: func.HttpRequest) -> func.HttpResponse:
+    include_buckets = (req.params.get("buckets") or "true").lower() != "false"
+    body = {
+        "uptime_seconds": round(time.time() - _started, 1),
+        "requests": {
+            "latency_ms": _by_route("request_ms", include_buckets),
+            "in_flight": in_flight_requests(),
+        },
+        "queue_lag_ms": _by_route("queue_lag_ms", include_buckets),
+        "db_connections": connection_stats(),
+        "executor": executor_stats(),
+        "caches": cache_stats(),
+        "circuit_breaker": _CIRCUIT_STATES.get(sql_circuit_breaker.state, sql_circuit_breaker.state),
+        "metrics": get_metrics(),
+        "slow_queries": slow_query_report(limit=10),
+    }
+    if not include_buckets:
+        body["db_connections"]["connect_ms"].pop("buckets", None)
+    return func.HttpResponse(
+        json.dumps(body, default=str),
+        status_code=200,
+        mimetype="application/json",
+        headers={"Cache-Control": "no-store"}
+    )
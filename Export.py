@@ -0,0 +1,178 @@
+"""
+HTTP GET: bulk NDJSON export of traceability_log / h_part_status by time range.
+Export událostí za období (audit, reklamace) — jeden JSON objekt na řádek.
+
+    GET /api/export/traceability_log?from=2026-03-02T00:00&to=2026-03-09T00:00&station_id=4
+    GET /api/export/h_part_status?from=...&to=...&watermark=<X-Export-Watermark of the previous page>
+
+`to` is exclusive; station_id, status and shipping_id filter exactly. Rows come
+ordered by (status_timestamp, part_id), read with fetchmany and encoded into
+the (gzip, if accepted) body of one page; the page is complete in memory
+before it is sent, so worker memory is bounded by one page of
+EXPORT_PAGE_ROWS rows however long the range is. When more rows remain
+the response carries X-Export-Complete: false and X-Export-Watermark; repeat
+the same request with watermark=<value> to continue (also after an
+interrupted download). Pages never split rows sharing a (status_timestamp,
+part_id) key, so resuming neither skips nor repeats rows.
+
+Indexes: database/export_indexes.sql
+"""
+import base64
+import datetime
+import gzip
+import io
+import json
+import logging
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import azure.functions as func
+from shared_utils import (
+    get_connection_string,
+    call_with_resilience,
+    CircuitOpenError,
+    service_unavailable_response,
+    db_connect,
+    timed_request,
+    add_log_fields,
+    negotiate_encoding,
+    GZIP_LEVEL,
+)
+
+bp = func.Blueprint()
+
+EXPORT_TABLES = ("traceability_log", "h_part_status")
+EXPORT_COLUMNS = ["part_id", "employee_id", "station_id", "status", "status_timestamp", "shipping_id"]
+EXPORT_FILTERS = ["station_id", "status", "shipping_id"]
+EXPORT_PAGE_ROWS = int(os.getenv("EXPORT_PAGE_ROWS", "50000"))
+EXPORT_FETCH_ROWS = int(os.getenv("EXPORT_FETCH_ROWS", "1000"))
+EXPORT_DEADLINE_SECONDS = float(os.getenv("EXPORT_DEADLINE_SECONDS", "60"))
+
+Watermark = Tuple[datetime.datetime, str]
+
+
+def encode_watermark(watermark: Watermark) -> str:
+    raw = json.dumps([watermark[0].isoformat(), watermark[1]]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_watermark(token: str) -> Watermark:
+    raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+    timestamp, part_id = json.loads(raw)
+    return datetime.datetime.fromisoformat(timestamp), str(part_id)
+
+
+def build_export_query(table: str, start: datetime.datetime, end: datetime.datetime,
+                       filters: Dict[str, str], watermark: Optional[Watermark]) -> Tuple[str, List[Any]]:
+    where = ["status_timestamp >= ?", "status_timestamp < ?"]
+    params: List[Any] = [start, end]
+    if watermark:
+        # status_timestamp is DATETIME (1/300 s ticks); a datetime2 parameter compares against
+        # its exact value under compatibility level >= 130, so the key goes back as DATETIME
+        where.append("(status_timestamp > CAST(? AS DATETIME) OR (status_timestamp = CAST(? AS DATETIME) AND part_id > ?))")
+        params += [watermark[0], watermark[0], watermark[1]]
+    for name in EXPORT_FILTERS:
+        if filters.get(name) is not None:
+            where.append(f"{name} = ?")
+            params.append(filters[name])
+    query = f"""
+        SELECT {", ".join(EXPORT_COLUMNS)}
+        FROM dbo.{table}
+        WHERE {" AND ".join(where)}
+        ORDER BY status_timestamp, part_id
+    """
+    return query, params
+
+
+def export_page(conn_str: str, query: str, params: List[Any], limit: int,
+                compress: bool) -> Tuple[bytes, int, Optional[Watermark]]:
+    """NDJSON body of up to `limit` rows (plus the rest of the last key), row count and
+    the watermark to continue from (None when the range is exhausted)."""
+    out = io.BytesIO()
+    sink = gzip.GzipFile(fileobj=out, mode="wb", compresslevel=GZIP_LEVEL, mtime=0) if compress else out
+    count = 0
+    last_key: Optional[Watermark] = None
+    next_watermark: Optional[Watermark] = None
+    with db_connect(conn_str) as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(query, params)
+            while next_watermark is None:
+                chunk = cursor.fetchmany(EXPORT_FETCH_ROWS)
+                if not chunk:
+                    break
+                for row in chunk:
+                    key = (row[4], row[0])
+                    if count >= limit and key != last_key:
+                        next_watermark = last_key
+                        break
+                    line = json.dumps(dict(zip(EXPORT_COLUMNS, row)), default=str, ensure_ascii=False)
+                    sink.write(line.encode("utf-8") + b"\n")
+                    count += 1
+                    last_key = key
+        finally:
+            # Closing with rows left unread cancels the rest of the result on the server.
+            cursor.close()
+    if compress:
+        sink.close()
+    return out.getvalue(), count, next_watermark
+
+
+def _error(message: str, status_code: int = 400) -> func.HttpResponse:
+    return func.HttpResponse(json.dumps({"error": message}), status_code=status_code, mimetype="application/json")
+
+
+def _parse_timestamp(value: Optional[str], name: str) -> datetime.datetime:
+    if not value:
+        raise ValueError(f"Missing {name}")
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid {name}: expected ISO 8601, e.g. 2026-03-02T06:00") from None
+
+
+@bp.function_name(name="ExportHttpFunc")
+@bp.route(route="export/{table}", methods=["GET"], auth_level=func.AuthLevel.FUNCTION)
+@timed_request("Export")
+def export(req: func.HttpRequest) -> func.HttpResponse:
+    table = req.route_params.get("table")
+    if table not in EXPORT_TABLES:
+        return _error(f"Unknown table {table!r}, expected one of {', '.join(EXPORT_TABLES)}", 404)
+
+    try:
+        start = _parse_timestamp(req.params.get("from"), "from")
+        end = _parse_timestamp(req.params.get("to"), "to")
+        watermark = decode_watermark(req.params["watermark"]) if req.params.get("watermark") else None
+        limit = min(int(req.params.get("limit") or EXPORT_PAGE_ROWS), EXPORT_PAGE_ROWS)
+    except (ValueError, TypeError) as e:
+        return _error(str(e))
+    if end <= start or limit <= 0:
+        return _error("Expected from < to and limit > 0")
+
+    filters = {name: req.params.get(name) for name in EXPORT_FILTERS}
+    add_log_fields(table=table, start=start, end=end, resumed=watermark is not None)
+    query, params = build_export_query(table, start, end, filters, watermark)
+    compress = negotiate_encoding(req.headers.get("Accept-Encoding"), codings=["gzip"]) == "gzip"
+
+    try:
+        body, count, next_watermark = call_with_resilience(
+            export_page, get_connection_string(), query, params, limit, compress,
+            deadline_seconds=EXPORT_DEADLINE_SECONDS
+        )
+    except CircuitOpenError as e:
+        return service_unavailable_response(e)
+    except Exception as e:
+        logging.error(f"Export of {table} failed: {e}")
+        return _error(str(e), 500)
+
+    add_log_fields(rows=count)
+    headers = {
+        "X-Export-Rows": str(count),
+        "X-Export-Complete": "false" if next_watermark else "true",
+        "Vary": "Accept-Encoding",
+    }
+    if next_watermark:
+        headers["X-Export-Watermark"] = encode_watermark(next_watermark)
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+    return func.HttpResponse(body, status_code=200, mimetype="application/x-ndjson", headers=headers)
@@ -0,0 +1,194 @@
+"""
+HTTP GET: temperature curve of a part's furnace run, downsampled for plotting.
+Průběh teploty v peci pro graf k FurnaceReport.
+
+    GET /api/FurnaceCurve?dmc=<DMC>&points=1000&method=lttb
+
+The window and furnace come from the part's furnace_temperature_report row
+(TempStartTime..TempEndTime, the row of `furnace` when that is passed); parts
+without one yet can pass furnace=<id>, the window then runs from the scan at
+the furnace's entry station (FURNACE_ENTRY_STATIONS; 400 for a furnace
+without one) to the next scan (or now). Raw samples are read from the
+ExportDbTeploty<furnace>_<date>_u exports and reduced server-side to at
+most `points` points:
+
+    lttb    Largest-Triangle-Three-Buckets, keeps the visual shape (default)
+    minmax  min and max sample of each bucket, keeps every peak
+
+Curves of finished runs don't change and are cached per worker.
+"""
+import json
+import logging
+import os
+from typing import Any, Dict, Optional
+
+import azure.functions as func
+import numpy as np
+
+import furnace_ingest
+from FurnaceReport import fetch_furnace_report
+from shared_utils import (
+    get_connection_string,
+    call_with_resilience,
+    CircuitOpenError,
+    service_unavailable_response,
+    db_connect,
+    timed_request,
+    requested_database,
+    add_log_fields,
+    payload_response,
+    LRUCache,
+)
+
+bp = func.Blueprint()
+
+FURNACE_CURVE_POINTS = int(os.getenv("FURNACE_CURVE_POINTS", "1000"))
+FURNACE_CURVE_MAX_POINTS = int(os.getenv("FURNACE_CURVE_MAX_POINTS", "5000"))
+FURNACE_CURVE_DEADLINE_SECONDS = float(os.getenv("FURNACE_CURVE_DEADLINE_SECONDS", "30"))
+FURNACE_CURVE_METHODS = ("lttb", "minmax")
+
+_curve_cache = LRUCache(maxsize=int(os.getenv("FURNACE_CURVE_CACHE_SIZE", "256")), name="furnace_curves")
+
+
+def lttb(x: np.ndarray, y: np.ndarray, points: int) -> np.ndarray:
+    """Indexes of the `points` samples LTTB keeps (first and last always)."""
+    n = len(x)
+    if points >= n or points < 3:
+        return np.arange(n)
+    # points - 2 buckets between the first and the last sample
+    edges = np.linspace(1, n - 1, points - 1).astype(np.int64)
+    next_lo = edges[1:]
+    next_hi = np.append(edges[2:], n)
+    cum_x = np.concatenate(([0.0], np.cumsum(x)))
+    cum_y = np.concatenate(([0.0], np.cumsum(y)))
+    sizes = next_hi - next_lo
+    avg_x = (cum_x[next_hi] - cum_x[next_lo]) / sizes
+    avg_y = (cum_y[next_hi] - cum_y[next_lo]) / sizes
+
+    selected = np.empty(points, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(points - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # Twice the triangle area (a, candidate, mean of the next bucket)
+        area = np.abs((x[a] - avg_x[i]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y[i] - y[a]))
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def minmax_buckets(y: np.ndarray, points: int) -> np.ndarray:
+    """Indexes of the min and max sample of each of points // 2 equal buckets, in time order."""
+    n = len(y)
+    buckets = points // 2
+    if points >= n or buckets < 1:
+        return np.arange(n)
+    edges = np.arange(buckets + 1) * n // buckets
+    sizes = np.diff(edges)
+    picked = []
+    for reduce in (np.minimum, np.maximum):
+        extreme = np.repeat(reduce.reduceat(y, edges[:-1]), sizes)
+        hits = np.flatnonzero(y == extreme)
+        # First hit of each bucket
+        _, first = np.unique(np.searchsorted(edges, hits, side="right") - 1, return_index=True)
+        picked.append(hits[first])
+    return np.unique(np.concatenate(picked))
+
+
+def downsample(timestamps: np.ndarray, values: np.ndarray, points: int, method: str) -> np.ndarray:
+    if method == "minmax":
+        return minmax_buckets(values, points)
+    x = (timestamps - timestamps[0]) / np.timedelta64(1, "s") if len(timestamps) else timestamps
+    return lttb(np.asarray(x, dtype=np.float64), values, points)
+
+
+def fetch_curve(conn_str: str, part_id: str, db: str, points: int, method: str,
+                furnace: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Downsampled curve payload, or None when the part has no known furnace window."""
+    db_name = "Traceability" if db == "prod" else "Traceability_TEST"
+    reports = fetch_furnace_report(conn_str, part_id, db)
+    if furnace:
+        reports = [r for r in reports if str(r["furnace"]) == furnace]
+    if reports:
+        report = reports[-1]
+        furnace = str(report["furnace"])
+        start, end, finished = report["temp_start_time"], report["temp_end_time"], True
+    elif furnace:
+        window = furnace_ingest.load_part_window(conn_str, furnace, part_id, db_name)
+        if window is None:
+            return None
+        start, end = window
+        finished = end is not None
+        if end is None:
+            with db_connect(conn_str) as conn:
+                end = conn.cursor().execute("SELECT GETDATE()").fetchone()[0]
+    else:
+        return None
+
+    timestamps, values = furnace_ingest.load_window_samples(conn_str, furnace, start, end, db_name)
+    keep = downsample(timestamps, values, points, method)
+    return {
+        "part_id": part_id,
+        "furnace": furnace,
+        "start": start,
+        "end": end,
+        "finished": finished,
+        "method": method,
+        "source_points": int(len(timestamps)),
+        "points": int(len(keep)),
+        "timestamps": timestamps[keep].astype("datetime64[ms]").tolist(),
+        "temperatures": values[keep].tolist(),
+    }
+
+
+def _error(message: str, status_code: int = 400) -> func.HttpResponse:
+    return func.HttpResponse(json.dumps({"error": message}), status_code=status_code, mimetype="application/json")
+
+
+@bp.function_name(name="GetFurnaceCurve")
+@bp.route(route="FurnaceCurve", methods=["GET"], auth_level=func.AuthLevel.ANONYMOUS)
+@timed_request("FurnaceCurve", db=requested_database)
+def furnace_curve(req: func.HttpRequest) -> func.HttpResponse:
+    part_id = (
+        req.params.get('value')
+        or req.params.get('dmc')
+        or req.params.get('part_id')
+        or req.params.get('partId')
+    )
+    if not part_id:
+        return _error("Please pass value/dmc/part_id in the query string")
+
+    method = req.params.get('method', 'lttb')
+    if method not in FURNACE_CURVE_METHODS:
+        return _error(f"Unknown method {method!r}, expected one of {', '.join(FURNACE_CURVE_METHODS)}")
+    try:
+        points = int(req.params.get('points') or FURNACE_CURVE_POINTS)
+    except ValueError:
+        return _error("points must be an integer")
+    points = max(3, min(points, FURNACE_CURVE_MAX_POINTS))
+    db = req.params.get('db', 'prod')
+    furnace = req.params.get('furnace')
+    add_log_fields(value=part_id, points=points, method=method)
+
+    key = (db, part_id, furnace, points, method)
+    curve = _curve_cache.get(key)
+    cached = curve is not None
+    if not cached:
+        try:
+            curve = call_with_resilience(
+                fetch_curve, get_connection_string(), part_id, db, points, method, furnace,
+                deadline_seconds=FURNACE_CURVE_DEADLINE_SECONDS
+            )
+        except CircuitOpenError as e:
+            return service_unavailable_response(e)
+        except ValueError as e:
+            return _error(str(e))  # furnace without an entry station
+        except Exception as e:
+            logging.error(f"Error building furnace curve: {str(e)}")
+            return _error(str(e), 500)
+        if curve is None:
+            return _error(f"No furnace run found for {part_id}", 404)
+        if curve["finished"]:
+            _curve_cache.set(key, curve)
+    add_log_fields(source_points=curve["source_points"], cached=cached)
+    return payload_response(req, curve)
@@ -1,18 +1,27 @@
 import json
 import logging
-import pyodbc
 import azure.functions as func
-from shared_utils import get_connection_string
-
-logging.basicConfig(level=logging.INFO)
+from typing import Any, Dict, List
+from shared_utils import (
+    get_connection_string,
+    call_with_resilience,
+    CircuitOpenError,
+    service_unavailable_response,
+    SQL_READ_DEADLINE_SECONDS,
+    db_connect,
+    timed_request,
+    requested_database,
+    add_log_fields,
+    payload_response,
+)
 
 bp = func.Blueprint()
 
 
 @bp.function_name(name="GetFurnaceReport")
 @bp.route(route="FurnaceReport", methods=["GET"], auth_level=func.AuthLevel.ANONYMOUS)
+@timed_request("FurnaceReport", db=requested_database)
 def furnace_report(req: func.HttpRequest) -> func.HttpResponse:
-    logging.info("FurnaceReport function processing a request")
     input_value = (
         req.params.get('value')
         or req.params.get('dmc')
@@ -25,11 +34,11 @@ def furnace_report(req: func.HttpRequest) -> func.HttpResponse:
             "Please pass value/dmc/part_id in the query string",
             status_code=400
         )
+    add_log_fields(value=input_value)
 
     db = req.params.get('db', 'prod')
     try:
         conn_str = get_connection_string()
-        logging.info(f"FurnaceReport using db={db}")
     except Exception as e:
         logging.error(f"Error building connection string: {str(e)}")
         return func.HttpResponse(
@@ -39,62 +48,14 @@ def furnace_report(req: func.HttpRequest) -> func.HttpResponse:
         )
 
     try:
-        db_name = "Traceability" if db == "prod" else "Traceability_TEST"
-        with pyodbc.connect(conn_str) as conn:
-            with conn.cursor() as cursor:
-                query = f"""
-                    SELECT
-                        [id],
-                        [DMC],
-                        [PartID],
-                        [Furnace],
-                        [MinTemp],
-                        [MaxTemp],
-                        [AvgTemp],
-                        [MeasurementCount],
-                        [InsertTime],
-                        [FurnaceTimeSeconds],
-                        [FurnaceTimeHours],
-                        [TempStartTime],
-                        [TempEndTime],
-                        [TempDifference],
-                        [MeasurementsPerMinute],
-                        [created_timestamp],
-                        [updated_timestamp]
-                    FROM [{db_name}].[dbo].[furnace_temperature_report]
-                    WHERE [DMC] = ? OR [PartID] = ?
-                    ORDER BY [InsertTime] ASC
-                """
-                cursor.execute(query, (input_value, input_value))
-                rows = cursor.fetchall()
-
-        result = []
-        for row in rows:
-            result.append({
-                "id": row[0],
-                "dmc": row[1],
-                "part_id": row[2],
-                "furnace": row[3],
-                "min_temp": row[4],
-                "max_temp": row[5],
-                "avg_temp": row[6],
-                "measurement_count": row[7],
-                "insert_time": row[8],
-                "furnace_time_seconds": row[9],
-                "furnace_time_hours": row[10],
-                "temp_start_time": row[11],
-                "temp_end_time": row[12],
-                "temp_difference": row[13],
-                "measurements_per_minute": row[14],
-                "created_timestamp": row[15],
-                "updated_timestamp": row[16]
-            })
-
-        return func.HttpResponse(
-            json.dumps({"rows": result}, default=str),
-            status_code=200,
-            mimetype="application/json"
+        result = call_with_resilience(
+            fetch_furnace_report, conn_str, input_value, db,
+            deadline_seconds=SQL_READ_DEADLINE_SECONDS
         )
+        return payload_response(req, {"rows": result})
+    except CircuitOpenError as e:
+        logging.error(f"Database unavailable for furnace report: {e}")
+        return service_unavailable_response(e)
     except Exception as e:
         logging.error(f"Error processing furnace report: {str(e)}")
         return func.HttpResponse(
@@ -102,3 +63,58 @@ def furnace_report(req: func.HttpRequest) -> func.HttpResponse:
             status_code=500,
             mimetype="application/json"
         )
+
+
+def fetch_furnace_report(conn_str: str, input_value: str, db: str = "prod") -> List[Dict[str, Any]]:
+    """Get furnace_temperature_report rows for a DMC / part id."""
+    db_name = "Traceability" if db == "prod" else "Traceability_TEST"
+    with db_connect(conn_str) as conn:
+        with conn.cursor() as cursor:
+            query = f"""
+                SELECT
+                    [id],
+                    [DMC],
+                    [PartID],
+                    [Furnace],
+                    [MinTemp],
+                    [MaxTemp],
+                    [AvgTemp],
+                    [MeasurementCount],
+                    [InsertTime],
+                    [FurnaceTimeSeconds],
+                    [FurnaceTimeHours],
+                    [TempStartTime],
+                    [TempEndTime],
+                    [TempDifference],
+                    [MeasurementsPerMinute],
+                    [created_timestamp],
+                    [updated_timestamp]
+                FROM [{db_name}].[dbo].[furnace_temperature_report]
+                WHERE [DMC] = ? OR [PartID] = ?
+                ORDER BY [InsertTime] ASC
+            """
+            cursor.execute(query, (input_value, input_value))
+            rows = cursor.fetchall()
+
+    result = []
+    for row in rows:
+        result.append({
+            "id": row[0],
+            "dmc": row[1],
+            "part_id": row[2],
+            "furnace": row[3],
+            "min_temp": row[4],
+            "max_temp": row[5],
+            "avg_temp": row[6],
+            "measurement_count": row[7],
+            "insert_time": row[8],
+            "furnace_time_seconds": row[9],
+            "furnace_time_hours": row[10],
+            "temp_start_time": row[11],
+            "temp_end_time": row[12],
+            "temp_difference": row[13],
+            "measurements_per_minute": row[14],
+            "created_timestamp": row[15],
+            "updated_timestamp": row[16]
+        })
+    return result
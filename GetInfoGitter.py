@@ -1,26 +1,35 @@
 import json
 import logging
-import pyodbc
 import azure.functions as func
 import concurrent.futures
+import contextvars
 from typing import Dict, Tuple, Any, Optional, List
-from shared_utils import get_connection_string
-
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+from shared_utils import (
+    get_connection_string,
+    call_with_resilience,
+    CircuitOpenError,
+    service_unavailable_response,
+    SQL_READ_DEADLINE_SECONDS,
+    db_connect,
+    timed_request,
+    add_log_fields,
+    payload_response,
+    wants_columnar,
+    columnarize,
+)
+import gitter_summary
 
 bp = func.Blueprint()
 
 @bp.function_name(name="GetInfoGitter")
 @bp.route(route="GetInfoGitter", methods=["GET"], auth_level=func.AuthLevel.ANONYMOUS)
+@timed_request("GetInfoGitter")
 def GetInfoGitter(req: func.HttpRequest) -> func.HttpResponse:
-    logging.info("GetInfoGitter function processing a request")
     shipping_id = req.params.get('shipping_id')
     
     if not shipping_id:
         try:
             req_body = req.get_json()
-            logging.info(f"Attempting to get shipping_id from request body: {req_body}")
         except ValueError:
             logging.warning("No JSON body in request")
             pass
@@ -35,12 +44,12 @@ def GetInfoGitter(req: func.HttpRequest) -> func.HttpResponse:
             mimetype="application/json"
         )
 
-    logging.info(f"Processing request for shipping_id: {shipping_id}")
+    summary_only = req.params.get('summary_only', '').strip().lower() in ('1', 'true', 'yes')
+    add_log_fields(shipping_id=shipping_id, summary_only=summary_only)
     
     # Get the connection string from environment variables
     try:
         conn_str = get_connection_string()
-        logging.info("Successfully built connection string")
     except Exception as e:
         logging.error(f"Error building connection string: {str(e)}")
         return func.HttpResponse(
@@ -50,10 +59,12 @@ def GetInfoGitter(req: func.HttpRequest) -> func.HttpResponse:
         )
     
     try:
-        # Process request with concurrent database operations
-        logging.info("Starting database query")
-        response_data, status_code = process_request(shipping_id, conn_str)
-        logging.info(f"Query completed with status code: {status_code}")
+        if summary_only:
+            # Box composition only: from the in-memory aggregate, no part rows
+            response_data, status_code = process_summary_request(shipping_id, conn_str)
+        else:
+            # Process request with concurrent database operations
+            response_data, status_code = process_request(shipping_id, conn_str)
         
         if status_code != 200:
             return func.HttpResponse(
@@ -62,9 +73,12 @@ def GetInfoGitter(req: func.HttpRequest) -> func.HttpResponse:
                 mimetype="application/json"
             )
             
-        response = json.dumps(response_data, default=str)
-        logging.info("Successfully processed request")
+        if wants_columnar(req) and not summary_only:
+            response_data = columnarize(response_data, "gitter_history")
+        response = payload_response(req, response_data)
         
+    except CircuitOpenError as e:
+        return service_unavailable_response(e)
     except Exception as e:
         logging.error(f"Error processing request: {e}")
         return func.HttpResponse(
@@ -73,15 +87,11 @@ def GetInfoGitter(req: func.HttpRequest) -> func.HttpResponse:
             mimetype="application/json"
         )
 
-    return func.HttpResponse(
-        response,
-        status_code=200,
-        mimetype="application/json"
-    )
+    return response
 
 def fetch_gitter_parts(conn_str: str, shipping_id: str) -> Optional[List[Dict[str, Any]]]:
     """Get all parts in the specified gitterbox (shipping_id)."""
-    with pyodbc.connect(conn_str) as conn:
+    with db_connect(conn_str) as conn:
         with conn.cursor() as cursor:
             # Query to get all parts in the gitterbox from part_status
             gitter_query = """
@@ -129,30 +139,23 @@ def process_request(shipping_id: str, conn_str: str) -> Tuple[Dict[str, Any], in
     try:
         # Run database operation
         with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
-            gitter_parts_future = executor.submit(fetch_gitter_parts, conn_str, shipping_id)
+            gitter_parts_future = executor.submit(
+                contextvars.copy_context().run, call_with_resilience, fetch_gitter_parts, conn_str, shipping_id,
+                deadline_seconds=SQL_READ_DEADLINE_SECONDS
+            )
             
             # Get result
             gitter_parts = gitter_parts_future.result()
             
             # Create response data structure (match production format exactly)
             if gitter_parts:
-                melt_values = sorted({
-                    str(part.get('melt')).strip()
-                    for part in gitter_parts
-                    if part.get('melt') not in (None, "")
-                })
-                part_type_values = sorted({
-                    str(part.get('part_type')).strip()
-                    for part in gitter_parts
-                    if part.get('part_type') not in (None, "")
-                })
+                # The rows are at hand anyway: refresh the box aggregate from them
+                summary = gitter_summary.remember_parts(
+                    shipping_id, ((p['part_id'], p.get('melt'), p.get('part_type')) for p in gitter_parts)
+                )
                 response_data = {
                     'gitter_history': gitter_parts,
-                    'gitter_summary': {
-                        'parts_count': len(gitter_parts),
-                        'melts': melt_values,
-                        'part_types': part_type_values
-                    }
+                    'gitter_summary': summary
                 }
             else:
                 response_data = {
@@ -165,7 +168,27 @@ def process_request(shipping_id: str, conn_str: str) -> Tuple[Dict[str, Any], in
                 }
                 
             return response_data, 200
+    except CircuitOpenError as e:
+        logging.error(f"Database unavailable in process_request: {e}")
+        raise  # the handler answers 503 with Retry-After
     except Exception as e:
         logging.error(f"Error in process_request: {e}")
         return {"error": str(e)}, 500
 
+def process_summary_request(shipping_id: str, conn_str: str) -> Tuple[Dict[str, Any], int]:
+    """gitter_summary of the box from the aggregate, read from the DB only on a miss."""
+    summary = gitter_summary.cached_summary(shipping_id)
+    add_log_fields(summary_cached=summary is not None)
+    if summary is None:
+        try:
+            summary = call_with_resilience(
+                gitter_summary.load_summary, conn_str, shipping_id,
+                deadline_seconds=SQL_READ_DEADLINE_SECONDS
+            )
+        except CircuitOpenError as e:
+            logging.error(f"Database unavailable in process_summary_request: {e}")
+            raise  # the handler answers 503 with Retry-After
+        except Exception as e:
+            logging.error(f"Error in process_summary_request: {e}")
+            return {"error": str(e)}, 500
+    return {'gitter_summary': summary}, 200
@@ -5,8 +5,16 @@ Použití pro stránku „Info režim kontrol“ ve WebApp.
 import json
 import logging
 import azure.functions as func
-import pyodbc
-from shared_utils import get_connection_string
+from shared_utils import (
+    get_connection_string,
+    call_with_resilience,
+    CircuitOpenError,
+    service_unavailable_response,
+    SQL_READ_DEADLINE_SECONDS,
+    db_connect,
+    timed_request,
+    payload_response,
+)
 
 bp = func.Blueprint()
 
@@ -23,7 +31,7 @@ STATION_DEFS = [
 
 def fetch_info(part_id: str) -> dict:
     conn_str = get_connection_string()
-    with pyodbc.connect(conn_str) as conn:
+    with db_connect(conn_str) as conn:
         with conn.cursor() as cur:
             cur.execute(
                 """
@@ -127,6 +135,7 @@ def fetch_info(part_id: str) -> dict:
 
 @bp.function_name(name="InfoKontrol")
 @bp.route(route="InfoKontrol", methods=["GET"], auth_level=func.AuthLevel.ANONYMOUS)
+@timed_request("InfoKontrol")
 def info_kontrol(req: func.HttpRequest) -> func.HttpResponse:
     part_id = req.params.get("part_id")
     if not part_id:
@@ -144,12 +153,11 @@ def info_kontrol(req: func.HttpRequest) -> func.HttpResponse:
             mimetype="application/json",
         )
     try:
-        payload = fetch_info(part_id)
-        return func.HttpResponse(
-            json.dumps(payload, default=str),
-            status_code=200,
-            mimetype="application/json",
-        )
+        payload = call_with_resilience(fetch_info, part_id, deadline_seconds=SQL_READ_DEADLINE_SECONDS)
+        return payload_response(req, payload)
+    except CircuitOpenError as e:
+        logging.error(f"InfoKontrol: database unavailable: {e}")
+        return service_unavailable_response(e)
     except Exception as e:
         logging.exception("InfoKontrol failed")
         return func.HttpResponse(
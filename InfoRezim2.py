@@ -1,22 +1,30 @@
 import json
 import logging
-import pyodbc
 import azure.functions as func
 import concurrent.futures
+import contextvars
 from typing import Dict, Tuple, Any, Optional, List
-from shared_utils import get_connection_string
-
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+from shared_utils import (
+    get_connection_string,
+    call_with_resilience,
+    CircuitOpenError,
+    service_unavailable_response,
+    SQL_READ_DEADLINE_SECONDS,
+    db_connect,
+    timed_request,
+    add_log_fields,
+    payload_response,
+    wants_columnar,
+    columnarize,
+)
 
 bp = func.Blueprint()
 
 
 @bp.function_name(name="GetInfoRezim2")
 @bp.route(route="InfoRezim2", methods=["GET"], auth_level=func.AuthLevel.ANONYMOUS)
+@timed_request("InfoRezim2")
 def InfoRezim2(req: func.HttpRequest) -> func.HttpResponse:
-    logging.info("InfoRezim2 function processing a request")
-
     input_value = (
         req.params.get("value")
         or req.params.get("input")
@@ -28,7 +36,6 @@ def InfoRezim2(req: func.HttpRequest) -> func.HttpResponse:
     if not input_value:
         try:
             req_body = req.get_json()
-            logging.info(f"Attempting to get value from request body: {req_body}")
         except ValueError:
             logging.warning("No JSON body in request")
         else:
@@ -47,11 +54,10 @@ def InfoRezim2(req: func.HttpRequest) -> func.HttpResponse:
             status_code=400
         )
 
-    logging.info(f"Processing request for value: {input_value}")
+    add_log_fields(value=input_value)
 
     try:
         conn_str = get_connection_string()
-        logging.info("Successfully built connection string")
     except Exception as e:
         logging.error(f"Error building connection string: {str(e)}")
         return func.HttpResponse(
@@ -70,7 +76,11 @@ def InfoRezim2(req: func.HttpRequest) -> func.HttpResponse:
                 mimetype="application/json"
             )
 
-        response = json.dumps(response_data, default=str)
+        if wants_columnar(req):
+            response_data = columnarize(response_data, "parts")
+        response = payload_response(req, response_data)
+    except CircuitOpenError as e:
+        return service_unavailable_response(e)
     except Exception as e:
         logging.error(f"Error processing request: {e}")
         return func.HttpResponse(
@@ -79,11 +89,7 @@ def InfoRezim2(req: func.HttpRequest) -> func.HttpResponse:
             mimetype="application/json"
         )
 
-    return func.HttpResponse(
-        response,
-        status_code=200,
-        mimetype="application/json"
-    )
+    return response
 
 
 def fetch_parts_by_shipping(conn_str: str, input_value: str) -> Optional[List[Dict[str, Any]]]:
@@ -124,7 +130,7 @@ def fetch_parts_by_shipping(conn_str: str, input_value: str) -> Optional[List[Di
         ORDER BY p.part_id;
     """
 
-    with pyodbc.connect(conn_str) as conn:
+    with db_connect(conn_str) as conn:
         with conn.cursor() as cursor:
             cursor.execute(query, (input_value, input_value))
             rows = cursor.fetchall()
@@ -154,12 +160,18 @@ def process_request(input_value: str, conn_str: str) -> Tuple[Dict[str, Any], in
     """Process the request using a thread pool."""
     try:
         with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
-            parts_future = executor.submit(fetch_parts_by_shipping, conn_str, input_value)
+            parts_future = executor.submit(
+                contextvars.copy_context().run, call_with_resilience, fetch_parts_by_shipping, conn_str, input_value,
+                deadline_seconds=SQL_READ_DEADLINE_SECONDS
+            )
             parts = parts_future.result()
 
         if parts:
             return {"parts": parts}, 200
         return {"message": "No records found for input value: " + input_value}, 200
+    except CircuitOpenError as e:
+        logging.error(f"Database unavailable in process_request: {e}")
+        raise  # the handler answers 503 with Retry-After
     except Exception as e:
         logging.error(f"Error in process_request: {e}")
         return {"error": str(e)}, 500
@@ -1,27 +1,36 @@
 import json
 import logging
-import pyodbc
 import azure.functions as func
 import concurrent.futures
+import contextvars
 from typing import Dict, Tuple, Any, Optional
-from shared_utils import get_connection_string
-
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+from shared_utils import (
+    get_connection_string,
+    call_with_resilience,
+    CircuitOpenError,
+    service_unavailable_response,
+    SQL_READ_DEADLINE_SECONDS,
+    db_connect,
+    timed_request,
+    requested_database,
+    add_log_fields,
+    payload_response,
+    wants_columnar,
+    columnarize,
+)
 
 bp = func.Blueprint()
 
 
 @bp.function_name(name="GetInfoStatus")
 @bp.route(route="InfoStatus", methods=["GET"], auth_level=func.AuthLevel.ANONYMOUS)
+@timed_request("InfoStatus", db=requested_database)
 def InfoStatus(req: func.HttpRequest) -> func.HttpResponse:
-    logging.info("InfoStatus function processing a request")
     part_id = req.params.get('part_id')
     
     if not part_id:
         try:
             req_body = req.get_json()
-            logging.info(f"Attempting to get part_id from request body: {req_body}")
         except ValueError:
             logging.warning("No JSON body in request")
             pass
@@ -35,13 +44,12 @@ def InfoStatus(req: func.HttpRequest) -> func.HttpResponse:
             status_code=400
         )
 
-    logging.info(f"Processing request for part_id: {part_id}")
+    add_log_fields(part_id=part_id)
     
     # Get the connection string from environment variables
     db = req.params.get('db', 'prod')
     try:
         conn_str = get_connection_string()
-        logging.info(f"Successfully built connection string (db={db})")
     except Exception as e:
         logging.error(f"Error building connection string: {str(e)}")
         return func.HttpResponse(
@@ -52,9 +60,7 @@ def InfoStatus(req: func.HttpRequest) -> func.HttpResponse:
     
     try:
         # Process request with concurrent database operations
-        logging.info("Starting database query")
         response_data, status_code = process_request(part_id, conn_str, db)
-        logging.info(f"Query completed with status code: {status_code}")
         
         if status_code != 200:
             return func.HttpResponse(
@@ -63,9 +69,12 @@ def InfoStatus(req: func.HttpRequest) -> func.HttpResponse:
                 mimetype="application/json"
             )
             
-        response = json.dumps(response_data, default=str)
-        logging.info("Successfully processed request")
+        if wants_columnar(req):
+            response_data = columnarize(response_data, "part_history")
+        response = payload_response(req, response_data)
         
+    except CircuitOpenError as e:
+        return service_unavailable_response(e)
     except Exception as e:
         logging.error(f"Error processing request: {e}")
         return func.HttpResponse(
@@ -74,15 +83,11 @@ def InfoStatus(req: func.HttpRequest) -> func.HttpResponse:
             mimetype="application/json"
         )
 
-    return func.HttpResponse(
-        response,
-        status_code=200,
-        mimetype="application/json"
-    )
+    return response
 
 def fetch_part_info(conn_str: str, part_id: str, db: str = "prod") -> Optional[Dict[str, Any]]:
     """Get the detailed status information for the given part from transaction_log."""
-    with pyodbc.connect(conn_str) as conn:
+    with db_connect(conn_str) as conn:
         with conn.cursor() as cursor:
             # Query from transaction_log table with history
             db_name = "Traceability" if db == "prod" else "Traceability_TEST"
@@ -146,7 +151,10 @@ def process_request(part_id: str, conn_str: str, db: str = "prod") -> Tuple[Dict
     try:
         # Run info operations
         with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
-            part_info_future = executor.submit(fetch_part_info, conn_str, part_id, db)
+            part_info_future = executor.submit(
+                contextvars.copy_context().run, call_with_resilience, fetch_part_info, conn_str, part_id, db,
+                deadline_seconds=SQL_READ_DEADLINE_SECONDS
+            )
             
             # Get info data result
             part_info = part_info_future.result()
@@ -159,6 +167,9 @@ def process_request(part_id: str, conn_str: str, db: str = "prod") -> Tuple[Dict
                 response_data = {"message": "No record found for part ID: " + part_id}
                 
             return response_data, 200
+    except CircuitOpenError as e:
+        logging.error(f"Database unavailable in process_request: {e}")
+        raise  # the handler answers 503 with Retry-After
     except Exception as e:
         logging.error(f"Error in process_request: {e}")
         return {"error": str(e)}, 500
\ No newline at end of file
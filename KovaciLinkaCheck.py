@@ -1,11 +1,21 @@
 import logging
 import azure.functions as func
-import pyodbc
 import json
 import asyncio
 import concurrent.futures
+import contextvars
+import functools
 from typing import Dict, Any, Optional
-from shared_utils import get_connection_string
+from shared_utils import (
+    get_connection_string,
+    call_with_resilience,
+    CircuitOpenError,
+    SQL_READ_DEADLINE_SECONDS,
+    service_unavailable_response,
+    db_connect,
+    timed_request,
+    add_log_fields,
+)
 
 # Create a Blueprint for registering with the Functions host
 bp = func.Blueprint()
@@ -15,15 +25,17 @@ async def check_gitter_id_exists(gitter_id: str, conn_str: str) -> Optional[Dict
     with concurrent.futures.ThreadPoolExecutor() as pool:
         return await asyncio.get_event_loop().run_in_executor(
             pool,
-            execute_gitter_id_check,
-            conn_str,
-            gitter_id
+            functools.partial(
+                contextvars.copy_context().run,
+                call_with_resilience, execute_gitter_id_check, conn_str, gitter_id,
+                deadline_seconds=SQL_READ_DEADLINE_SECONDS
+            )
         )
 
 def execute_gitter_id_check(conn_str: str, gitter_id: str) -> Optional[Dict[str, Any]]:
     """Execute the query to check gitter_id existence in a separate thread."""
     try:
-        conn = pyodbc.connect(conn_str)
+        conn = db_connect(conn_str)
         cursor = conn.cursor()
 
         # Query to check if gitter_id exists
@@ -66,6 +78,7 @@ def execute_gitter_id_check(conn_str: str, gitter_id: str) -> Optional[Dict[str,
 
 @bp.function_name(name="KovaciLinkaCheckHttpFunc")
 @bp.route(route="KovaciLinkaCheck", methods=["POST"], auth_level=func.AuthLevel.FUNCTION)
+@timed_request("KovaciLinkaCheck")
 async def http_function(req: func.HttpRequest) -> func.HttpResponse:
     """Check if gitter_id exists in kovaci_linka_scans table."""
     try:
@@ -81,7 +94,7 @@ async def http_function(req: func.HttpRequest) -> func.HttpResponse:
         # Parse the request body
         try:
             req_body = req.get_json()
-            logging.info(f"Processing kovaci linka check request: {req_body}")
+            add_log_fields(gitter_id=req_body.get("gitter_id"))
         except ValueError as e:
             logging.error(f"Invalid JSON in request body: {e}")
             return func.HttpResponse(
@@ -129,6 +142,9 @@ async def http_function(req: func.HttpRequest) -> func.HttpResponse:
                     status_code=200
                 )
                 
+        except CircuitOpenError as e:
+            logging.error(f"Database unavailable, cannot check gitter_id: {e}")
+            return service_unavailable_response(e)
         except Exception as e:
             logging.error(f"Error checking gitter_id: {e}")
             return func.HttpResponse(
@@ -1,44 +1,79 @@
 import logging
 import azure.functions as func
-import pyodbc
 import json
-import asyncio
-import concurrent.futures
-from typing import Dict, Any
-from shared_utils import get_connection_string
+from typing import Dict, Any, Optional
+from shared_utils import (
+    get_connection_string,
+    idempotency_key_from_request,
+    is_idempotency_key_processed,
+    remember_idempotency_key,
+    claim_idempotency_key,
+    serialization_keys,
+    run_serialized,
+    CircuitOpenError,
+    service_unavailable_response,
+    async_ingest_requested,
+    enqueue_ingest,
+    ingest_accepted_response,
+    db_connect,
+    timed_request,
+    add_log_fields,
+    log_event,
+)
 
 # Create a Blueprint for registering with the Functions host
 bp = func.Blueprint()
 
-async def process_kovaci_linka_scan(data: Dict[str, Any], conn_str: str) -> None:
-    """Process kovaci linka scan using a separate thread."""
-    gitter_id = data.get("gitter_id")
-    employee_id = data.get("employee_id")
-    position = data.get("position")
-    
-    if not all([gitter_id, employee_id, position]):
+def validate_kovaci_linka_scan(data: Dict[str, Any]) -> None:
+    """Raise ValueError if the scan payload can't be written."""
+    if not all([data.get("gitter_id"), data.get("employee_id"), data.get("position")]):
         raise ValueError("Missing required fields: gitter_id, employee_id, or position")
     
-    if position not in ['A', 'B']:
+    if data.get("position") not in ['A', 'B']:
         raise ValueError("Position must be either 'A' or 'B'")
+
+async def process_kovaci_linka_scan(data: Dict[str, Any], conn_str: str,
+                                    idempotency_key: Optional[str] = None) -> bool:
+    """Process kovaci linka scan using a separate thread.
+
+    Returns False when the write was skipped as a replay of `idempotency_key`.
+    """
+    validate_kovaci_linka_scan(data)
+    gitter_id = data.get("gitter_id")
+    employee_id = data.get("employee_id")
+    position = data.get("position")
     
-    # Use thread pool for database operations
-    with concurrent.futures.ThreadPoolExecutor() as pool:
-        await asyncio.get_event_loop().run_in_executor(
-            pool,
-            execute_kovaci_linka_procedure,
-            conn_str,
-            gitter_id,
-            employee_id,
-            position
-        )
+    # Runs on the shared DB executor with transient-fault retry
+    return await run_serialized(
+        serialization_keys(shipping_ids=[gitter_id]),
+        execute_kovaci_linka_procedure,
+        conn_str,
+        gitter_id,
+        employee_id,
+        position,
+        idempotency_key,
+        idempotent=idempotency_key is not None
+    )
 
-def execute_kovaci_linka_procedure(conn_str: str, gitter_id: str, employee_id: str, position: str) -> None:
+def execute_kovaci_linka_procedure(conn_str: str, gitter_id: str, employee_id: str, position: str,
+                                   idempotency_key: str = None) -> bool:
     """Execute the stored procedure for kovaci linka scans in a separate thread."""
+    if is_idempotency_key_processed(idempotency_key, "KovaciLinkaScan"):
+        log_event("KovaciLinkaScan", "Skipping replayed kovaci linka scan", idempotency_key=idempotency_key,
+                  gitter_id=gitter_id)
+        return False
+
+    conn = None
+    cursor = None
     try:
-        conn = pyodbc.connect(conn_str)
+        conn = db_connect(conn_str)
         cursor = conn.cursor()
 
+        if idempotency_key and not claim_idempotency_key(cursor, idempotency_key, "KovaciLinkaScan"):
+            conn.rollback()
+            remember_idempotency_key(idempotency_key, "KovaciLinkaScan")
+            return False
+
         cursor.execute(
             """
             EXEC InsertKovaciLinkaScan 
@@ -49,18 +84,23 @@ def execute_kovaci_linka_procedure(conn_str: str, gitter_id: str, employee_id: s
             (gitter_id, employee_id, position)
         )
         conn.commit()
-        logging.info(f"Kovaci linka scan saved successfully for gitter: {gitter_id}")
+        remember_idempotency_key(idempotency_key, "KovaciLinkaScan")
+        log_event("KovaciLinkaScan", "Kovaci linka scan saved", gitter_id=gitter_id, position=position)
+        return True
 
     except Exception as e:
         logging.error(f"Error saving kovaci linka scan for gitter {gitter_id}: {e}")
         raise e
 
     finally:
-        cursor.close()
-        conn.close()
+        if cursor is not None:
+            cursor.close()
+        if conn is not None:
+            conn.close()
 
 @bp.function_name(name="KovaciLinkaScanHttpFunc")
 @bp.route(route="KovaciLinkaScan", methods=["POST"], auth_level=func.AuthLevel.FUNCTION)
+@timed_request("KovaciLinkaScan")
 async def http_function(req: func.HttpRequest) -> func.HttpResponse:
     """Process HTTP request for kovaci linka scan."""
     try:
@@ -76,7 +116,7 @@ async def http_function(req: func.HttpRequest) -> func.HttpResponse:
         # Parse the request body
         try:
             req_body = req.get_json()
-            logging.info(f"Processing kovaci linka scan request: {req_body}")
+            add_log_fields(gitter_id=req_body.get("gitter_id"))
         except ValueError as e:
             logging.error(f"Invalid JSON in request body: {e}")
             return func.HttpResponse(
@@ -99,9 +139,15 @@ async def http_function(req: func.HttpRequest) -> func.HttpResponse:
         
         # Process request asynchronously
         try:
-            await process_kovaci_linka_scan(req_body, conn_str)
+            idempotency_key = idempotency_key_from_request(req, req_body)
+            if async_ingest_requested("KovaciLinkaScan", req):
+                validate_kovaci_linka_scan(req_body)
+                tracking_id = await enqueue_ingest("KovaciLinkaScan", req_body, idempotency_key)
+                return ingest_accepted_response(tracking_id)
+
+            applied = await process_kovaci_linka_scan(req_body, conn_str, idempotency_key)
             return func.HttpResponse(
-                body=json.dumps({"message": "Scan saved successfully"}),
+                body=json.dumps({"message": "Scan saved successfully", "duplicate": not applied}),
                 mimetype="application/json",
                 status_code=200
             )
@@ -112,6 +158,9 @@ async def http_function(req: func.HttpRequest) -> func.HttpResponse:
                 mimetype="application/json",
                 status_code=400
             )
+        except CircuitOpenError as e:
+            logging.error(f"Database unavailable, rejecting scan: {e}")
+            return service_unavailable_response(e)
         except Exception as e:
             logging.error(f"Error processing scan: {e}")
             return func.HttpResponse(
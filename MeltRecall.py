@@ -0,0 +1,159 @@
+"""
+HTTP GET: every part of a melt with its current station, status and gitterbox.
+Stažení tavby — kde jsou teď všechny díly z jedné tavby (odchylka ICE_data).
+
+    GET /api/MeltRecall?melt=A1203
+    GET /api/MeltRecall?melt=A1203&after=<next_after of the previous page>&db=test
+
+Reads part_status through IX_part_status_melt (database/melt_index.sql):
+parts come ordered by part_id in pages of at most MELT_RECALL_PAGE_ROWS,
+fetched with fetchmany, so a melt of any size is a series of short range
+seeks instead of one long query. `next_after` is set while more parts
+remain; pass it as `after` to get the next page. The first page also
+carries `totals`, the melt's part count per station and status.
+"""
+import json
+import logging
+import os
+from typing import Any, Dict, List, Optional
+
+import azure.functions as func
+from shared_utils import (
+    get_connection_string,
+    call_with_resilience,
+    CircuitOpenError,
+    service_unavailable_response,
+    db_connect,
+    timed_request,
+    requested_database,
+    add_log_fields,
+    payload_response,
+    wants_columnar,
+    columnarize,
+)
+from station_rules import STATION_NAMES
+
+bp = func.Blueprint()
+
+MELT_RECALL_PAGE_ROWS = int(os.getenv("MELT_RECALL_PAGE_ROWS", "5000"))
+MELT_RECALL_FETCH_ROWS = int(os.getenv("MELT_RECALL_FETCH_ROWS", "1000"))
+MELT_RECALL_DEADLINE_SECONDS = float(os.getenv("MELT_RECALL_DEADLINE_SECONDS", "30"))
+
+
+def _station(value: Any) -> Optional[str]:
+    return str(value).strip() if value is not None else None
+
+
+def fetch_melt_page(conn_str: str, database: str, melt: str, after: Optional[str],
+                    limit: int) -> Dict[str, Any]:
+    where, params = ["melt = ?"], [limit + 1, melt]
+    if after is not None:
+        where.append("part_id > ?")
+        params.append(after)
+
+    parts: List[Dict[str, Any]] = []
+    more = False
+    with db_connect(conn_str) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                f"""
+                SELECT TOP (?) part_id, part_type, station_id, last_status, status_timestamp,
+                       shipping_id, Control_check, Quality_check
+                FROM [{database}].dbo.part_status
+                WHERE {" AND ".join(where)}
+                ORDER BY part_id
+                """,
+                params
+            )
+            while True:
+                rows = cursor.fetchmany(MELT_RECALL_FETCH_ROWS)
+                if not rows:
+                    break
+                for row in rows:
+                    if len(parts) == limit:
+                        more = True
+                        break
+                    station_id = _station(row[2])
+                    parts.append({
+                        "part_id": row[0],
+                        "part_type": row[1],
+                        "station_id": station_id,
+                        "station_name": STATION_NAMES.get(station_id),
+                        "last_status": row[3],
+                        "status_timestamp": row[4],
+                        "shipping_id": row[5],
+                        "control_check": bool(row[6]) if row[6] is not None else False,
+                        "quality_check": bool(row[7]) if row[7] is not None else False,
+                    })
+
+            totals = None
+            if after is None:
+                cursor.execute(
+                    f"""
+                    SELECT station_id, last_status, COUNT(*)
+                    FROM [{database}].dbo.part_status
+                    WHERE melt = ?
+                    GROUP BY station_id, last_status
+                    ORDER BY station_id, last_status
+                    """,
+                    (melt,)
+                )
+                totals = [
+                    {
+                        "station_id": _station(row[0]),
+                        "station_name": STATION_NAMES.get(_station(row[0])),
+                        "last_status": row[1],
+                        "parts": row[2],
+                    }
+                    for row in cursor.fetchall()
+                ]
+
+    result: Dict[str, Any] = {
+        "melt": melt,
+        "parts": parts,
+        "next_after": parts[-1]["part_id"] if more else None,
+    }
+    if totals is not None:
+        result["totals"] = totals
+        result["total_parts"] = sum(t["parts"] for t in totals)
+    return result
+
+
+def _error(message: str, status_code: int = 400) -> func.HttpResponse:
+    return func.HttpResponse(json.dumps({"error": message}), status_code=status_code, mimetype="application/json")
+
+
+@bp.function_name(name="GetMeltRecall")
+@bp.route(route="MeltRecall", methods=["GET"], auth_level=func.AuthLevel.ANONYMOUS)
+@timed_request("MeltRecall", db=requested_database)
+def melt_recall(req: func.HttpRequest) -> func.HttpResponse:
+    melt = (req.params.get("melt") or "").strip()
+    if not melt:
+        return _error("Please pass melt in the query string")
+    after = req.params.get("after") or None
+    try:
+        limit = min(int(req.params.get("limit") or MELT_RECALL_PAGE_ROWS), MELT_RECALL_PAGE_ROWS)
+    except ValueError:
+        return _error("limit must be an integer")
+    if limit <= 0:
+        return _error("Expected limit > 0")
+    add_log_fields(melt=melt, resumed=after is not None)
+
+    try:
+        result = call_with_resilience(
+            fetch_melt_page, get_connection_string(), requested_database(req), melt, after, limit,
+            deadline_seconds=MELT_RECALL_DEADLINE_SECONDS
+        )
+    except CircuitOpenError as e:
+        return service_unavailable_response(e)
+    except Exception as e:
+        logging.error(f"Error reading melt {melt}: {str(e)}")
+        return _error(str(e), 500)
+
+    if not result["parts"] and after is None:
+        return _error(f"No parts found for melt {melt}", 404)
+
+    add_log_fields(rows=len(result["parts"]), complete=result["next_after"] is None)
+    if wants_columnar(req):
+        result = columnarize(result, "parts")
+    return payload_response(req, result)
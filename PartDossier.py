@@ -0,0 +1,169 @@
+"""
+HTTP GET: everything known about one part, from all sources at once.
+Karta dílu pro reklamace — historie, kontroly, stav, pec a RockQ v jednom volání.
+
+    GET /api/PartDossier?part_id=P000456
+    GET /api/PartDossier?part_id=P000456&sources=info_status,rqt_report&db=test
+
+Runs the lookups behind InfoStatus, InfoKontrol, readstatus, FurnaceReport and
+RqtReport concurrently, so the response takes as long as the slowest source,
+not the sum. The sources never run on DB_EXECUTOR, which the scan writes
+share: the Traceability sources run on DOSSIER_WORKERS threads of their own,
+RockQ on DOSSIER_RQT_WORKERS, so slow dossiers only ever hold those. Each
+source has its own deadline (DOSSIER_DEADLINE_SECONDS,
+DOSSIER_RQT_DEADLINE_SECONDS for RockQ); a source that misses it or fails is
+reported in `sources` with status timeout / error / unavailable, its data is
+null and `complete` is false. A late source that has not started yet is
+cancelled. One already running keeps its thread until the query returns
+(pyodbc sets no query timeout; RockQ's pymssql login and query timeouts are
+the RockQ deadline), the response does not wait for it. `db` applies to the
+sources that take it (InfoStatus, FurnaceReport), as on their own endpoints.
+"""
+import concurrent.futures
+import contextvars
+import json
+import logging
+import math
+import os
+import time
+from typing import Any, Callable, Dict, List
+
+import azure.functions as func
+from shared_utils import (
+    get_connection_string,
+    call_with_resilience,
+    CircuitOpenError,
+    timed_request,
+    requested_database,
+    add_log_fields,
+    increment_metric,
+    payload_response,
+)
+from FurnaceReport import fetch_furnace_report
+from InfoKontrol import fetch_info
+from InfoStatus import fetch_part_info
+from ReadStatus import fetch_part_status
+from RqtReport import _get_rockq_connection, fetch_rqt_report
+
+bp = func.Blueprint()
+
+DOSSIER_DEADLINE_SECONDS = float(os.getenv("DOSSIER_DEADLINE_SECONDS", "5"))
+DOSSIER_RQT_DEADLINE_SECONDS = float(os.getenv("DOSSIER_RQT_DEADLINE_SECONDS", "3"))
+
+# Own bounded pools: a slow source may hold these threads, never DB_EXECUTOR's (scan writes)
+DOSSIER_EXECUTOR = concurrent.futures.ThreadPoolExecutor(
+    max_workers=int(os.getenv("DOSSIER_WORKERS", "8")),
+    thread_name_prefix="dossier"
+)
+# RockQ is a different server without a pool
+RQT_EXECUTOR = concurrent.futures.ThreadPoolExecutor(
+    max_workers=int(os.getenv("DOSSIER_RQT_WORKERS", "2")),
+    thread_name_prefix="rockq"
+)
+
+
+def _info_status(conn_str: str, part_id: str, db: str) -> Any:
+    return call_with_resilience(fetch_part_info, conn_str, part_id, db, deadline_seconds=DOSSIER_DEADLINE_SECONDS)
+
+
+def _info_kontrol(conn_str: str, part_id: str, db: str) -> Any:
+    return call_with_resilience(fetch_info, part_id, deadline_seconds=DOSSIER_DEADLINE_SECONDS)
+
+
+def _read_status(conn_str: str, part_id: str, db: str) -> Any:
+    return call_with_resilience(fetch_part_status, conn_str, part_id, deadline_seconds=DOSSIER_DEADLINE_SECONDS)
+
+
+def _furnace_report(conn_str: str, part_id: str, db: str) -> Any:
+    return call_with_resilience(fetch_furnace_report, conn_str, part_id, db, deadline_seconds=DOSSIER_DEADLINE_SECONDS)
+
+
+def _rqt_report(conn_str: str, part_id: str, db: str) -> Any:
+    # RockQ is not behind the Traceability circuit breaker; pymssql's timeouts are whole seconds
+    seconds = max(1, math.ceil(DOSSIER_RQT_DEADLINE_SECONDS))
+    return fetch_rqt_report(_get_rockq_connection(login_timeout=seconds, timeout=seconds), part_id)
+
+
+# name -> (lookup, deadline in seconds)
+DOSSIER_SOURCES: Dict[str, Any] = {
+    "info_status": (_info_status, DOSSIER_DEADLINE_SECONDS),
+    "info_kontrol": (_info_kontrol, DOSSIER_DEADLINE_SECONDS),
+    "read_status": (_read_status, DOSSIER_DEADLINE_SECONDS),
+    "furnace_report": (_furnace_report, DOSSIER_DEADLINE_SECONDS),
+    "rqt_report": (_rqt_report, DOSSIER_RQT_DEADLINE_SECONDS),
+}
+
+
+def collect_dossier(conn_str: str, part_id: str, db: str, names: List[str]) -> Dict[str, Any]:
+    """Run the named sources concurrently and wait for each until its own deadline."""
+    started = time.monotonic()
+    futures: Dict[str, concurrent.futures.Future] = {}
+    finished: Dict[str, float] = {}
+    for name in names:
+        lookup: Callable[..., Any] = DOSSIER_SOURCES[name][0]
+        executor = RQT_EXECUTOR if name == "rqt_report" else DOSSIER_EXECUTOR
+        futures[name] = executor.submit(contextvars.copy_context().run, lookup, conn_str, part_id, db)
+        futures[name].add_done_callback(lambda _, name=name: finished.setdefault(name, time.monotonic()))
+
+    data: Dict[str, Any] = {}
+    sources: Dict[str, Dict[str, Any]] = {}
+    # Waiting in deadline order means no source is waited for past its own deadline
+    for name in sorted(names, key=lambda n: DOSSIER_SOURCES[n][1]):
+        remaining = max(0.0, started + DOSSIER_SOURCES[name][1] - time.monotonic())
+        future = futures[name]
+        try:
+            data[name] = future.result(timeout=remaining)
+            status, error = "ok", None
+        except concurrent.futures.TimeoutError:
+            data[name], status, error = None, "timeout", f"No answer within {DOSSIER_SOURCES[name][1]:g} s"
+            increment_metric(f"dossier_timeouts_{name}")
+            # Still queued behind busy threads: drop it instead of running it for nobody
+            if future.cancel():
+                increment_metric(f"dossier_cancelled_{name}")
+        except CircuitOpenError as e:
+            data[name], status, error = None, "unavailable", str(e)
+        except Exception as e:
+            logging.warning(f"Dossier source {name} failed for {part_id}: {e}")
+            data[name], status, error = None, "error", str(e)
+        sources[name] = {
+            "status": status,
+            "error": error,
+            "elapsed_ms": round(1000 * (finished[name] - started)) if name in finished else None,
+        }
+
+    incomplete = [name for name in names if sources[name]["status"] != "ok"]
+    return {
+        "part_id": part_id,
+        "complete": not incomplete,
+        "incomplete_sources": incomplete,
+        "sources": {name: sources[name] for name in names},
+        **{name: data[name] for name in names},
+    }
+
+
+def _error(message: str, status_code: int = 400) -> func.HttpResponse:
+    return func.HttpResponse(json.dumps({"error": message}), status_code=status_code, mimetype="application/json")
+
+
+@bp.function_name(name="GetPartDossier")
+@bp.route(route="PartDossier", methods=["GET"], auth_level=func.AuthLevel.ANONYMOUS)
+@timed_request("PartDossier", db=requested_database)
+def part_dossier(req: func.HttpRequest) -> func.HttpResponse:
+    part_id = (req.params.get("part_id") or "").strip()
+    if not part_id:
+        return _error("Please pass part_id in the query string")
+    names = [n.strip() for n in req.params.get("sources", ",".join(DOSSIER_SOURCES)).split(",") if n.strip()]
+    unknown = [n for n in names if n not in DOSSIER_SOURCES]
+    if unknown or not names:
+        return _error(f"Unknown sources {', '.join(unknown)}, expected some of {', '.join(DOSSIER_SOURCES)}")
+    add_log_fields(part_id=part_id, sources=len(names))
+
+    try:
+        conn_str = get_connection_string()
+    except Exception as e:
+        logging.error(f"Error building connection string: {str(e)}")
+        return _error("Database configuration error", 500)
+
+    result = collect_dossier(conn_str, part_id, req.params.get("db", "prod"), names)
+    add_log_fields(complete=result["complete"], incomplete=",".join(result["incomplete_sources"]) or None)
+    return payload_response(req, result)
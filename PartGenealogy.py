@@ -0,0 +1,81 @@
+"""
+HTTP GET: parts and gitterboxes reachable from a part or a box within N hops.
+Rodokmen — kam se díly z boxu dostaly a s jakými dalšími díly sdílely boxy.
+
+    GET /api/Genealogy?shipping_id=GB000123&hops=3
+    GET /api/Genealogy?part_id=P000456&hops=2&db=prod
+
+A hop is one part <-> gitterbox edge of h_part_status history, so from a box
+hops=1 gives its parts, hops=2 every box those parts were ever in and hops=3
+the parts that shared those boxes. Served from the in-memory graph of
+genealogy_graph.py (the first request of a worker loads it); `graph` tells how
+fresh it is. At most GENEALOGY_MAX_NODES nodes are returned, `truncated`
+says the limit was hit.
+"""
+import json
+import logging
+import os
+
+import azure.functions as func
+from shared_utils import (
+    get_connection_string,
+    CircuitOpenError,
+    service_unavailable_response,
+    timed_request,
+    requested_database,
+    add_log_fields,
+    payload_response,
+)
+import genealogy_graph
+
+bp = func.Blueprint()
+
+GENEALOGY_DEFAULT_HOPS = int(os.getenv("GENEALOGY_DEFAULT_HOPS", "3"))
+GENEALOGY_MAX_HOPS = int(os.getenv("GENEALOGY_MAX_HOPS", "8"))
+GENEALOGY_MAX_NODES = int(os.getenv("GENEALOGY_MAX_NODES", "20000"))
+
+
+def _error(message: str, status_code: int = 400) -> func.HttpResponse:
+    return func.HttpResponse(json.dumps({"error": message}), status_code=status_code, mimetype="application/json")
+
+
+@bp.function_name(name="GetGenealogy")
+@bp.route(route="Genealogy", methods=["GET"], auth_level=func.AuthLevel.ANONYMOUS)
+@timed_request("Genealogy", db=requested_database)
+def genealogy(req: func.HttpRequest) -> func.HttpResponse:
+    part_id = (req.params.get("part_id") or "").strip() or None
+    shipping_id = (req.params.get("shipping_id") or "").strip() or None
+    if bool(part_id) == bool(shipping_id):
+        return _error("Pass exactly one of part_id or shipping_id")
+    try:
+        hops = int(req.params.get("hops", GENEALOGY_DEFAULT_HOPS))
+    except ValueError:
+        return _error("hops must be an integer")
+    if not 1 <= hops <= GENEALOGY_MAX_HOPS:
+        return _error(f"hops must be between 1 and {GENEALOGY_MAX_HOPS}")
+    include_edges = req.params.get("edges", "false").lower() == "true"
+    add_log_fields(part_id=part_id, shipping_id=shipping_id, hops=hops)
+
+    try:
+        graph = genealogy_graph.get_graph(get_connection_string(), requested_database(req))
+    except CircuitOpenError as e:
+        return service_unavailable_response(e)
+    except Exception as e:
+        logging.error(f"Error loading genealogy graph: {str(e)}")
+        return _error(str(e), 500)
+
+    result = graph.traverse(part_id, shipping_id, hops, GENEALOGY_MAX_NODES)
+    if result is None:
+        what = f"part {part_id}" if part_id else f"gitterbox {shipping_id}"
+        return _error(f"No history for {what}", 404)
+
+    add_log_fields(parts=len(result["parts"]), boxes=len(result["boxes"]), truncated=result["truncated"])
+    if not include_edges:
+        del result["edges"]
+    return payload_response(req, {
+        "part_id": part_id,
+        "shipping_id": shipping_id,
+        "hops": hops,
+        **result,
+        "graph": graph.stats(),
+    })
@@ -0,0 +1,168 @@
+"""
+HTTP GET: parts processed per station and hour / shift / day, from the rollups.
+Přehled výroby — počty dílů po stanicích za hodinu, směnu nebo den.
+
+    GET /api/ProductionDashboard?from=2026-03-02&to=2026-03-09&group=shift
+    GET /api/ProductionDashboard?from=2026-03-02T06:00&group=hour&station_id=4&source=all
+
+Reads only station_hourly_rollup (maintained by StationRollup.py), never the
+scan tables, so any range costs one clustered index range seek. `to` is
+exclusive and defaults to now; `source` is traceability_log (default),
+Control_Station or all. Shifts are SHIFT_LENGTH_HOURS long starting at
+SHIFT_START_HOUR; days are calendar days. `parts` sums the distinct parts of
+each hour, so a part scanned at one station in two hours counts twice.
+`rolled_up_to` is the rollup watermark per source: later scans are not in
+the numbers yet. Databases StationRollup does not maintain
+(STATION_ROLLUP_DATABASES) answer 404.
+"""
+import datetime
+import json
+import logging
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import azure.functions as func
+from shared_utils import (
+    get_connection_string,
+    call_with_resilience,
+    CircuitOpenError,
+    service_unavailable_response,
+    SQL_READ_DEADLINE_SECONDS,
+    db_connect,
+    timed_request,
+    requested_database,
+    add_log_fields,
+    payload_response,
+    wants_columnar,
+    columnarize,
+)
+from station_rules import STATION_NAMES
+from StationRollup import ROLLUP_SOURCES, STATION_ROLLUP_DATABASES, watermark_name
+
+bp = func.Blueprint()
+
+SHIFT_START_HOUR = int(os.getenv("SHIFT_START_HOUR", "6"))
+SHIFT_LENGTH_HOURS = int(os.getenv("SHIFT_LENGTH_HOURS", "8"))
+DASHBOARD_MAX_HOURLY_DAYS = int(os.getenv("DASHBOARD_MAX_HOURLY_DAYS", "62"))
+
+# group -> (bucket size in hours, offset of the first bucket from midnight)
+GROUPS: Dict[str, Tuple[int, int]] = {
+    "hour": (1, 0),
+    "shift": (SHIFT_LENGTH_HOURS, SHIFT_START_HOUR % SHIFT_LENGTH_HOURS),
+    "day": (24, 0),
+}
+
+
+def fetch_dashboard(conn_str: str, database: str, start: datetime.datetime, end: datetime.datetime,
+                    group: str, source: Optional[str], station_id: Optional[str]) -> Dict[str, Any]:
+    size, offset = GROUPS[group]
+    where = ["r.hour_start >= ?", "r.hour_start < ?"]
+    params: List[Any] = [offset, size, size, offset, start, end]
+    if source:
+        where.append("r.source = ?")
+        params.append(source)
+    if station_id:
+        where.append("r.station_id = ?")
+        params.append(station_id)
+
+    with db_connect(conn_str) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                f"""
+                SELECT p.period_start, r.source, r.station_id, r.status,
+                       SUM(r.scan_count), SUM(r.part_count)
+                FROM [{database}].dbo.station_hourly_rollup r
+                CROSS APPLY (
+                    SELECT DATEADD(HOUR, ((DATEDIFF(HOUR, 0, r.hour_start) - ?) / ?) * ? + ?, 0) AS period_start
+                ) p
+                WHERE {" AND ".join(where)}
+                GROUP BY p.period_start, r.source, r.station_id, r.status
+                ORDER BY p.period_start, r.source, r.station_id, r.status
+                """,
+                params
+            )
+            rows = cursor.fetchall()
+            cursor.execute(f"SELECT name, watermark FROM [{database}].dbo.rollup_watermarks")
+            watermarks = {row[0]: row[1] for row in cursor.fetchall()}
+
+    return {
+        "from": start,
+        "to": end,
+        "group": group,
+        "rolled_up_to": {
+            name: watermarks.get(watermark_name(name))
+            for name in ROLLUP_SOURCES if not source or source == name
+        },
+        "rows": [
+            {
+                "period_start": row[0],
+                "source": row[1],
+                "station_id": row[2],
+                "station_name": STATION_NAMES.get(row[2]),
+                "status": row[3],
+                "scans": row[4],
+                "parts": row[5],
+            }
+            for row in rows
+        ],
+    }
+
+
+def _error(message: str, status_code: int = 400) -> func.HttpResponse:
+    return func.HttpResponse(json.dumps({"error": message}), status_code=status_code, mimetype="application/json")
+
+
+def _parse_timestamp(value: str, name: str) -> datetime.datetime:
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid {name}: expected ISO 8601, e.g. 2026-03-02 or 2026-03-02T06:00") from None
+
+
+@bp.function_name(name="GetProductionDashboard")
+@bp.route(route="ProductionDashboard", methods=["GET"], auth_level=func.AuthLevel.ANONYMOUS)
+@timed_request("ProductionDashboard", db=requested_database)
+def production_dashboard(req: func.HttpRequest) -> func.HttpResponse:
+    group = req.params.get("group", "hour")
+    if group not in GROUPS:
+        return _error(f"Unknown group {group!r}, expected one of {', '.join(GROUPS)}")
+    source = req.params.get("source", "traceability_log")
+    if source == "all":
+        source = None
+    elif source not in ROLLUP_SOURCES:
+        return _error(f"Unknown source {source!r}, expected one of {', '.join(ROLLUP_SOURCES)} or all")
+
+    now = datetime.datetime.now()
+    try:
+        start = _parse_timestamp(req.params["from"], "from") if req.params.get("from") else \
+            now.replace(hour=0, minute=0, second=0, microsecond=0)
+        end = _parse_timestamp(req.params["to"], "to") if req.params.get("to") else now
+    except ValueError as e:
+        return _error(str(e))
+    if end <= start:
+        return _error("Expected from < to")
+    if group == "hour" and end - start > datetime.timedelta(days=DASHBOARD_MAX_HOURLY_DAYS):
+        return _error(f"Hourly data for at most {DASHBOARD_MAX_HOURLY_DAYS} days, use group=shift or group=day")
+
+    database = requested_database(req)
+    if database not in STATION_ROLLUP_DATABASES:
+        return _error(f"No rollups are kept for {database} (STATION_ROLLUP_DATABASES)", 404)
+
+    station_id = req.params.get("station_id")
+    add_log_fields(start=start, end=end, group=group, source=source, station_id=station_id)
+
+    try:
+        result = call_with_resilience(
+            fetch_dashboard, get_connection_string(), database, start, end, group, source, station_id,
+            deadline_seconds=SQL_READ_DEADLINE_SECONDS
+        )
+    except CircuitOpenError as e:
+        return service_unavailable_response(e)
+    except Exception as e:
+        logging.error(f"Error reading production dashboard: {str(e)}")
+        return _error(str(e), 500)
+
+    add_log_fields(rows=len(result["rows"]))
+    if wants_columnar(req):
+        result = columnarize(result, "rows")
+    return payload_response(req, result)
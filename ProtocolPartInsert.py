@@ -2,16 +2,35 @@ import logging
 import azure.functions as func
 import pyodbc
 import json
-import asyncio
-import concurrent.futures
-from typing import Dict, Any
-from shared_utils import get_connection_string
+from typing import Dict, Any, Optional
+from shared_utils import (
+    get_connection_string,
+    idempotency_key_from_request,
+    idempotency_key_from_message,
+    is_idempotency_key_processed,
+    remember_idempotency_key,
+    claim_idempotency_key,
+    serialization_keys,
+    run_serialized,
+    CircuitOpenError,
+    service_unavailable_response,
+    db_connect,
+    timed_request,
+    add_log_fields,
+    log_event,
+    notify_write,
+)
+from station_rules import forget_part_state, peek_part_state
 
 # Create a Blueprint for registering with the Functions host
 bp = func.Blueprint()
 
-async def insert_protocol_part(data: Dict[str, Any], conn_str: str) -> None:
-    """Insert protocol part data into database using a separate thread."""
+async def insert_protocol_part(data: Dict[str, Any], conn_str: str,
+                               idempotency_key: Optional[str] = None) -> bool:
+    """Insert protocol part data into database using a separate thread.
+
+    Returns False when the write was skipped as a replay of `idempotency_key`.
+    """
     part_id = data.get("part_id")
     employee_id = data.get("employee_id")
     station_id = data.get("station_id")
@@ -20,32 +39,40 @@ async def insert_protocol_part(data: Dict[str, Any], conn_str: str) -> None:
     shipping_id = data.get("shipping_id")
     protocol_id = data.get("protocol_id")
     
-    # Use thread pool for database operations
-    with concurrent.futures.ThreadPoolExecutor() as pool:
-        await asyncio.get_event_loop().run_in_executor(
-            pool,
-            execute_stored_procedure,
-            conn_str,
-            part_id,
-            employee_id,
-            station_id,
-            status,
-            status_timestamp,
-            shipping_id,
-            protocol_id
-        )
+    # Serialize with other writes to the same part / gitterbox (part_status trigger)
+    return await run_serialized(
+        serialization_keys([part_id], [shipping_id]),
+        execute_stored_procedure,
+        conn_str,
+        part_id,
+        employee_id,
+        station_id,
+        status,
+        status_timestamp,
+        shipping_id,
+        protocol_id,
+        idempotency_key,
+        idempotent=idempotency_key is not None
+    )
 
 def execute_stored_procedure(conn_str: str, part_id: str, employee_id: str, station_id: str, 
                             status: str, status_timestamp: str, shipping_id: str = None, 
-                            protocol_id: str = None) -> None:
+                            protocol_id: str = None, idempotency_key: str = None) -> bool:
     """Execute the stored procedure with detailed logging."""
-    logging.info(f"Attempting to execute stored procedure 'insert_protocol_part' for part_id: {part_id}")
+    if is_idempotency_key_processed(idempotency_key, "ProtocolPartInsert"):
+        log_event("ProtocolPartInsert", "Skipping replayed protocol part write", idempotency_key=idempotency_key,
+                  part_id=part_id)
+        return False
+
     try:
-        with pyodbc.connect(conn_str, timeout=30) as conn:
-            logging.info(f"DB connection successful for part_id: {part_id}.")
+        with db_connect(conn_str, timeout=30) as conn:
             cursor = conn.cursor()
+
+            if idempotency_key and not claim_idempotency_key(cursor, idempotency_key, "ProtocolPartInsert"):
+                conn.rollback()
+                remember_idempotency_key(idempotency_key, "ProtocolPartInsert")
+                return False
             
-            logging.info(f"Executing stored procedure with params: part_id={part_id}, protocol_id={protocol_id}, status={status}")
             cursor.execute(
                 "{CALL insert_protocol_part (?, ?, ?, ?, ?, ?, ?)}",
                 part_id,
@@ -57,7 +84,12 @@ def execute_stored_procedure(conn_str: str, part_id: str, employee_id: str, stat
                 protocol_id
             )
             conn.commit()
-            logging.info(f"Stored procedure executed and committed successfully for part_id: {part_id}")
+            remember_idempotency_key(idempotency_key, "ProtocolPartInsert")
+            cached, previous = peek_part_state(part_id)
+            forget_part_state(part_id)
+            notify_write("part", part_id=part_id, station_id=station_id, status=status, shipping_id=shipping_id,
+                         **({"previous": previous} if cached else {}))
+            return True
 
     except pyodbc.Error as db_error:
         logging.error(f"DATABASE ERROR executing stored procedure for part_id {part_id}: {db_error}", exc_info=True)
@@ -68,10 +100,9 @@ def execute_stored_procedure(conn_str: str, part_id: str, employee_id: str, stat
 
 @bp.function_name(name="ProtocolPartInsertHttpFunc")
 @bp.route(route="ProtocolPartInsert", methods=["POST"], auth_level=func.AuthLevel.FUNCTION)
+@timed_request("ProtocolPartInsert")
 async def http_function(req: func.HttpRequest) -> func.HttpResponse:
     """Process HTTP request to insert protocol part data with detailed logging."""
-    logging.info("ProtocolPartInsert Azure function triggered.")
-    
     try:
         # Zkontroluj, zda je request JSON
         if not req.headers.get('content-type', '').startswith('application/json'):
@@ -83,7 +114,6 @@ async def http_function(req: func.HttpRequest) -> func.HttpResponse:
             )
         
         req_body = req.get_json()
-        logging.info(f"Received request body: {req_body}")
         
         part_id = req_body.get("part_id")
         protocol_id = req_body.get("protocol_id")
@@ -95,14 +125,15 @@ async def http_function(req: func.HttpRequest) -> func.HttpResponse:
                 status_code=400
             )
 
+        add_log_fields(part_id=part_id, protocol_id=protocol_id)
+        idempotency_key = idempotency_key_from_request(req, req_body)
         conn_str = get_connection_string()
 
         # Process request using the same async function as queue
-        await insert_protocol_part(req_body, conn_str)
-        
-        logging.info(f"Successfully processed request for part_id: {part_id}, protocol_id: {protocol_id}")
+        applied = await insert_protocol_part(req_body, conn_str, idempotency_key)
+
         return func.HttpResponse(
-            body=json.dumps({"message": "Protocol part data inserted successfully"}),
+            body=json.dumps({"message": "Protocol part data inserted successfully", "duplicate": not applied}),
             mimetype="application/json",
             status_code=200
         )
@@ -115,6 +146,9 @@ async def http_function(req: func.HttpRequest) -> func.HttpResponse:
             mimetype="application/json",
             status_code=400
         )
+    except CircuitOpenError as e:
+        logging.error(f"Database unavailable in ProtocolPartInsert: {e}")
+        return service_unavailable_response(e)
     except pyodbc.Error as db_error:
         logging.error(f"Database error in ProtocolPartInsert: {db_error}", exc_info=True)
         return func.HttpResponse(
@@ -136,6 +170,7 @@ async def http_function(req: func.HttpRequest) -> func.HttpResponse:
     queue_name="protocol-part-insert-test",
     connection="AzureWebJobsStorage"
 )
+@timed_request("ProtocolPartInsertQueue")
 async def queue_function(msg: func.QueueMessage) -> None:
     """Process queue message for protocol part insert."""
     conn_str = get_connection_string()
@@ -143,7 +178,6 @@ async def queue_function(msg: func.QueueMessage) -> None:
     try:
         # Decode and parse the queue message
         message_body = msg.get_body().decode("utf-8")
-        logging.info(f"Processing protocol part queue message: {message_body}")
         
         data = json.loads(message_body)
         
@@ -153,10 +187,11 @@ async def queue_function(msg: func.QueueMessage) -> None:
         if not part_id or not protocol_id:
             logging.error(f"Invalid queue message. Missing part_id or protocol_id. Data: {data}")
             raise ValueError("Queue message must contain 'part_id' and 'protocol_id'")
+        add_log_fields(part_id=part_id, protocol_id=protocol_id)
+        idempotency_key = idempotency_key_from_message(msg, data)
         
         # Process message asynchronously
-        await insert_protocol_part(data, conn_str)
-        logging.info(f"Successfully processed protocol part queue message for part_id: {part_id}, protocol_id: {protocol_id}")
+        await insert_protocol_part(data, conn_str, idempotency_key)
         
     except json.JSONDecodeError as e:
         logging.error(f"Invalid message format. Expected JSON. Error: {e}")
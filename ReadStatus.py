@@ -1,16 +1,26 @@
 import json
 import logging
-import pyodbc
 import azure.functions as func
 import concurrent.futures
+import contextvars
 from typing import Dict, Tuple, Any, Optional
-from shared_utils import get_connection_string
+from shared_utils import (
+    get_connection_string,
+    call_with_resilience,
+    CircuitOpenError,
+    service_unavailable_response,
+    SQL_READ_DEADLINE_SECONDS,
+    db_connect,
+    timed_request,
+    payload_response,
+)
+from station_rules import part_state_from_row, remember_part_state
 
 bp = func.Blueprint()
 
 def fetch_part_status(conn_str: str, part_id: str) -> Optional[Dict[str, Any]]:
     """Get the status data for the given part."""
-    with pyodbc.connect(conn_str) as conn:
+    with db_connect(conn_str) as conn:
         with conn.cursor() as cursor:
             # Get the current status from part_status table.
             # Control_check (BIT, od 2026-04-27): povoluje vstup na Tryskani (st.4)
@@ -27,8 +37,14 @@ def fetch_part_status(conn_str: str, part_id: str) -> Optional[Dict[str, Any]]:
             status_row = cursor.fetchone()
 
             if not status_row:
+                remember_part_state(part_id, None)
                 return None
 
+            # A status read usually precedes the scan insert; warm the gating cache.
+            remember_part_state(part_id, part_state_from_row(
+                (status_row[0], status_row[1], status_row[5], status_row[6], status_row[7])
+            ))
+
             station_id = str(status_row[1]) if status_row[1] is not None else None
             control_check_raw = status_row[6]
             control_check_bool = bool(control_check_raw) if control_check_raw is not None else False
@@ -54,7 +70,10 @@ def process_request(part_id: str, conn_str: str) -> Tuple[Dict[str, Any], int]:
     try:
         # Run constraint and status operations
         with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
-            part_status_future = executor.submit(fetch_part_status, conn_str, part_id)
+            part_status_future = executor.submit(
+                contextvars.copy_context().run, call_with_resilience, fetch_part_status, conn_str, part_id,
+                deadline_seconds=SQL_READ_DEADLINE_SECONDS
+            )
             
             # Get status data result
             part_status = part_status_future.result()
@@ -67,12 +86,16 @@ def process_request(part_id: str, conn_str: str) -> Tuple[Dict[str, Any], int]:
                 response_data = {"message": "No record found for part ID: " + part_id}
                 
             return response_data, 200
+    except CircuitOpenError as e:
+        logging.error(f"Database unavailable in process_request: {e}")
+        raise  # the handler answers 503 with Retry-After
     except Exception as e:
         logging.error(f"Error in process_request: {e}")
         return {"error": str(e)}, 500
 
 @bp.function_name(name="ReadStatus")
 @bp.route(route="readstatus", methods=["GET"], auth_level=func.AuthLevel.ANONYMOUS)
+@timed_request("readstatus")
 def read_status(req: func.HttpRequest) -> func.HttpResponse:
     part_id = req.params.get('part_id')
     
@@ -103,8 +126,10 @@ def read_status(req: func.HttpRequest) -> func.HttpResponse:
                 mimetype="application/json"
             )
             
-        response = json.dumps(response_data, default=str)
+        response = payload_response(req, response_data)
         
+    except CircuitOpenError as e:
+        return service_unavailable_response(e)
     except Exception as e:
         logging.error(f"Error processing request: {e}")
         return func.HttpResponse(
@@ -113,8 +138,4 @@ def read_status(req: func.HttpRequest) -> func.HttpResponse:
             mimetype="application/json"
         )
 
-    return func.HttpResponse(
-        response,
-        status_code=200,
-        mimetype="application/json"
-    )
\ No newline at end of file
+    return response
\ No newline at end of file
@@ -1,28 +1,81 @@
 import json
 import logging
 import os
+from typing import Any, Dict, List
 
 import azure.functions as func
 import pymssql
 
-logging.basicConfig(level=logging.INFO)
+from shared_utils import add_log_fields, db_connect, payload_response, timed_request
 
 bp = func.Blueprint()
 
 
-def _get_rockq_connection():
+def _get_rockq_connection(login_timeout: int = 15, timeout: int = 0):
+    """pymssql connection to RockQ; timeout (seconds, 0 = none) bounds each query."""
     server = os.environ["ROCKQ_DB_SERVER"]
     user = os.environ["ROCKQ_DB_USER"]
     password = os.environ["ROCKQ_DB_PASSWORD"]
     database = os.environ["ROCKQ_DB_NAME"]
-    return pymssql.connect(server=server, user=user, password=password, database=database, login_timeout=15)
+    return db_connect(server=server, user=user, password=password, database=database, login_timeout=login_timeout,
+                      timeout=timeout, driver=pymssql)
+
+
+def fetch_rqt_report(conn, dpm: str) -> List[Dict[str, Any]]:
+    """RockQ route of a part (one row per work-station visited), read over `conn`."""
+    # One result row per (unique_trace_id, pos_workplace) — i.e. one row per
+    # work-station the part actually visited (SW3-Laser, SW3-CNC, Quality
+    # control, Packaging Kamenice, Relocation, ...). Laser fields are only
+    # populated on the SW3-Laser row; for every other station they are NULL.
+    query = """
+        SELECT
+            MAX(CASE WHEN v.header_attribute_id = 2131 THEN v.header_value_string END) AS dpm,
+            v.pos_workplace                                                              AS station,
+            MAX(CASE WHEN v.header_attribute_id = 2140 THEN v.header_value_string END) AS operator,
+            MIN(v.header_creation_time)                                                  AS date_in,
+            MAX(v.header_creation_time)                                                  AS date_out,
+            CASE WHEN v.pos_workplace = 'SW3-Laser' THEN
+                COALESCE(
+                    MAX(CASE WHEN v.header_attribute_id = 10001 THEN v.header_value_string END),
+                    MAX(CASE WHEN v.header_attribute_id = 2132  THEN v.header_value_string END)
+                )
+            END AS laser_data,
+            CASE WHEN v.pos_workplace = 'SW3-Laser' THEN
+                COALESCE(
+                    MAX(CASE WHEN v.header_attribute_id = 10101 THEN v.header_value_string END),
+                    MAX(CASE WHEN v.header_attribute_id = 2134  THEN v.header_value_string END)
+                )
+            END AS laser_quality
+        FROM v_traceability_report v
+        WHERE v.pos_workplace IS NOT NULL
+        GROUP BY v.unique_trace_id, v.pos_workplace
+        HAVING MAX(CASE WHEN v.header_attribute_id = 2131 THEN v.header_value_string END) = %s
+        ORDER BY MIN(v.header_creation_time)
+    """
+
+    with conn:
+        cursor = conn.cursor(as_dict=True)
+        cursor.execute(query, (dpm,))
+        rows = cursor.fetchall()
+
+    return [
+        {
+            "dpm": row["dpm"],
+            "station": row["station"],
+            "operator": row["operator"],
+            "date_in": row["date_in"],
+            "date_out": row["date_out"],
+            "laser_data": row["laser_data"],
+            "laser_quality": row["laser_quality"],
+        }
+        for row in rows
+    ]
 
 
 @bp.function_name(name="GetRqtReport")
 @bp.route(route="RqtReport", methods=["GET"], auth_level=func.AuthLevel.ANONYMOUS)
+@timed_request("RqtReport", db="RockQ")
 def rqt_report(req: func.HttpRequest) -> func.HttpResponse:
-    logging.info("RqtReport function processing a request")
-
     dpm = (
         req.params.get("dpm")
         or req.params.get("part_id")
@@ -34,6 +87,7 @@ def rqt_report(req: func.HttpRequest) -> func.HttpResponse:
             "Please pass dpm/part_id/value in the query string",
             status_code=400,
         )
+    add_log_fields(dpm=dpm)
 
     try:
         conn = _get_rockq_connection()
@@ -53,60 +107,7 @@ def rqt_report(req: func.HttpRequest) -> func.HttpResponse:
         )
 
     try:
-        # One result row per (unique_trace_id, pos_workplace) — i.e. one row per
-        # work-station the part actually visited (SW3-Laser, SW3-CNC, Quality
-        # control, Packaging Kamenice, Relocation, ...). Laser fields are only
-        # populated on the SW3-Laser row; for every other station they are NULL.
-        query = """
-            SELECT
-                MAX(CASE WHEN v.header_attribute_id = 2131 THEN v.header_value_string END) AS dpm,
-                v.pos_workplace                                                              AS station,
-                MAX(CASE WHEN v.header_attribute_id = 2140 THEN v.header_value_string END) AS operator,
-                MIN(v.header_creation_time)                                                  AS date_in,
-                MAX(v.header_creation_time)                                                  AS date_out,
-                CASE WHEN v.pos_workplace = 'SW3-Laser' THEN
-                    COALESCE(
-                        MAX(CASE WHEN v.header_attribute_id = 10001 THEN v.header_value_string END),
-                        MAX(CASE WHEN v.header_attribute_id = 2132  THEN v.header_value_string END)
-                    )
-                END AS laser_data,
-                CASE WHEN v.pos_workplace = 'SW3-Laser' THEN
-                    COALESCE(
-                        MAX(CASE WHEN v.header_attribute_id = 10101 THEN v.header_value_string END),
-                        MAX(CASE WHEN v.header_attribute_id = 2134  THEN v.header_value_string END)
-                    )
-                END AS laser_quality
-            FROM v_traceability_report v
-            WHERE v.pos_workplace IS NOT NULL
-            GROUP BY v.unique_trace_id, v.pos_workplace
-            HAVING MAX(CASE WHEN v.header_attribute_id = 2131 THEN v.header_value_string END) = %s
-            ORDER BY MIN(v.header_creation_time)
-        """
-
-        with conn:
-            cursor = conn.cursor(as_dict=True)
-            cursor.execute(query, (dpm,))
-            rows = cursor.fetchall()
-
-        result = [
-            {
-                "dpm": row["dpm"],
-                "station": row["station"],
-                "operator": row["operator"],
-                "date_in": row["date_in"],
-                "date_out": row["date_out"],
-                "laser_data": row["laser_data"],
-                "laser_quality": row["laser_quality"],
-            }
-            for row in rows
-        ]
-
-        return func.HttpResponse(
-            json.dumps({"rows": result}, default=str),
-            status_code=200,
-            mimetype="application/json",
-        )
-
+        return payload_response(req, {"rows": fetch_rqt_report(conn, dpm)})
     except Exception as e:
         logging.error(f"Error processing RQT report: {e}")
         return func.HttpResponse(
@@ -0,0 +1,147 @@
+"""
+Timer: hourly throughput rollups per station for the production dashboard.
+Hodinové souhrny průchodu dílů po stanicích (database/station_rollups.sql).
+
+Every run recomputes whole hours of station_hourly_rollup from
+traceability_log (scans) and Control_Station (checks) in each database:
+
+    [watermark - STATION_ROLLUP_OVERLAP_HOURS, + STATION_ROLLUP_MAX_HOURS)
+
+The hours in that range are deleted and re-inserted from one GROUP BY in a
+single transaction, so re-running a range is harmless. The overlap picks up
+scans that arrive late (status_timestamp is the scanner's time, queued
+writes land minutes later). The watermark then moves to the hour of the
+newest row rolled up, never past the server's current hour (a scanner with
+a clock ahead must not make the watermark skip hours), or to the end of the
+range when the whole range is history, so a first run backfills from
+STATION_ROLLUP_START gradually.
+
+The rollups are written into the database they summarise. Like every other
+writer, the timer only writes Traceability_TEST by default; adding
+Traceability to STATION_ROLLUP_DATABASES needs database/station_rollups.sql
+run in production and INSERT / UPDATE / DELETE on its two tables for the app.
+"""
+import datetime
+import logging
+import os
+from typing import Any, Dict, Tuple
+
+import azure.functions as func
+from shared_utils import get_connection_string, call_with_resilience, db_connect, timed_request
+
+bp = func.Blueprint()
+
+STATION_ROLLUP_DATABASES = [
+    name.strip() for name in os.getenv("STATION_ROLLUP_DATABASES", "Traceability_TEST").split(",")
+    if name.strip()
+]
+STATION_ROLLUP_START = os.getenv("STATION_ROLLUP_START", "2025-01-01T00:00:00")
+STATION_ROLLUP_OVERLAP_HOURS = int(os.getenv("STATION_ROLLUP_OVERLAP_HOURS", "3"))
+STATION_ROLLUP_MAX_HOURS = int(os.getenv("STATION_ROLLUP_MAX_HOURS", "168"))
+STATION_ROLLUP_DEADLINE_SECONDS = float(os.getenv("STATION_ROLLUP_DEADLINE_SECONDS", "120"))
+
+# source table -> (timestamp column, station_id expression)
+ROLLUP_SOURCES: Dict[str, Tuple[str, str]] = {
+    "traceability_log": ("status_timestamp", "station_id"),
+    "Control_Station": ("check_timestamp", "CAST(station_id AS VARCHAR(100))"),
+}
+
+_HOUR = "DATEADD(HOUR, DATEDIFF(HOUR, 0, {ts}), 0)"
+
+
+def _floor_hour(value: datetime.datetime) -> datetime.datetime:
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def watermark_name(source: str) -> str:
+    return f"station_hourly_rollup:{source}"
+
+
+def rollup_source(conn_str: str, database: str, source: str) -> Dict[str, Any]:
+    """Recompute one window of hours for `source`; returns the range, rows written and new watermark."""
+    ts, station = ROLLUP_SOURCES[source]
+    hour = _HOUR.format(ts=ts)
+    name = watermark_name(source)
+    with db_connect(conn_str) as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT watermark FROM [{database}].dbo.rollup_watermarks WHERE name = ?", (name,))
+        row = cursor.fetchone()
+        if row:
+            lower = row[0] - datetime.timedelta(hours=STATION_ROLLUP_OVERLAP_HOURS)
+        else:
+            lower = datetime.datetime.fromisoformat(STATION_ROLLUP_START)
+        lower = _floor_hour(lower)
+        upper = lower + datetime.timedelta(hours=STATION_ROLLUP_MAX_HOURS)
+
+        cursor.execute(
+            f"SELECT MAX({ts}), GETDATE() FROM [{database}].dbo.[{source}] WHERE {ts} >= ? AND {ts} < ?",
+            (lower, upper)
+        )
+        newest, server_now = cursor.fetchone()
+        cursor.execute(
+            f"""
+            DELETE FROM [{database}].dbo.station_hourly_rollup
+            WHERE source = ? AND hour_start >= ? AND hour_start < ?
+            """,
+            (source, lower, upper)
+        )
+        cursor.execute(
+            f"""
+            INSERT INTO [{database}].dbo.station_hourly_rollup
+                (hour_start, source, station_id, status, scan_count, part_count)
+            SELECT {hour}, ?, ISNULL({station}, ''), ISNULL([status], ''), COUNT(*), COUNT(DISTINCT part_id)
+            FROM [{database}].dbo.[{source}]
+            WHERE {ts} >= ? AND {ts} < ?
+            GROUP BY {hour}, ISNULL({station}, ''), ISNULL([status], '')
+            """,
+            (source, lower, upper)
+        )
+        written = cursor.rowcount
+
+        if upper <= server_now - datetime.timedelta(hours=STATION_ROLLUP_OVERLAP_HOURS):
+            watermark = upper  # the whole window is history (backfill)
+        elif newest is not None:
+            # newest comes from the scanners' clocks, server_now from SQL Server's
+            watermark = min(_floor_hour(newest), _floor_hour(server_now))
+        else:
+            watermark = row[0] if row else lower
+        cursor.execute(
+            f"""
+            MERGE [{database}].dbo.rollup_watermarks AS target
+            USING (SELECT ? AS name, ? AS watermark) AS source
+            ON target.name = source.name
+            WHEN MATCHED THEN UPDATE SET watermark = source.watermark, updated_timestamp = GETDATE()
+            WHEN NOT MATCHED THEN INSERT (name, watermark) VALUES (source.name, source.watermark);
+            """,
+            (name, watermark)
+        )
+        conn.commit()
+    return {"from": lower, "to": upper, "rows": written, "watermark": watermark}
+
+
+def run_rollups() -> Dict[str, Dict[str, Any]]:
+    conn_str = get_connection_string()
+    summary: Dict[str, Dict[str, Any]] = {}
+    for database in STATION_ROLLUP_DATABASES:
+        for source in ROLLUP_SOURCES:
+            summary[f"{database}.{source}"] = call_with_resilience(
+                rollup_source, conn_str, database, source,
+                deadline_seconds=STATION_ROLLUP_DEADLINE_SECONDS
+            )
+    return summary
+
+
+@bp.function_name(name="StationRollupTimer")
+@bp.timer_trigger(arg_name="timer", schedule="0 */5 * * * *", run_on_startup=False, use_monitor=True)
+@timed_request("StationRollup", db=None)
+def station_rollup(timer: func.TimerRequest) -> None:
+    if timer.past_due:
+        logging.warning("StationRollup: timer is past due, catching up")
+    try:
+        summary = run_rollups()
+    except Exception as e:
+        logging.error(f"StationRollup failed: {e}")
+        raise
+    for name, result in summary.items():
+        logging.info(f"StationRollup {name}: {result['rows']} rows ({result['from']} .. {result['to']}), "
+                     f"watermark {result['watermark']}")
@@ -0,0 +1,68 @@
+"""
+HTTP GET: parts currently at each station by last_status (work in progress).
+Rozpracovanost — kolik dílů právě leží na které stanici.
+
+    GET /api/WipCounters
+    GET /api/WipCounters?station_id=4
+
+Served from the in-memory counters of wip_counters.py: no DB call except
+the first request of a worker (seed) and background reconciliations.
+`reconciled_at` / `age_seconds` tell when the counters were last compared with
+part_status; `dirty` means writes happened that the worker could not follow
+and a reconciliation is due.
+"""
+import json
+import logging
+
+import azure.functions as func
+from shared_utils import (
+    get_connection_string,
+    CircuitOpenError,
+    service_unavailable_response,
+    timed_request,
+    add_log_fields,
+    payload_response,
+)
+from station_rules import STATION_NAMES
+import wip_counters
+
+bp = func.Blueprint()
+
+
+def _station_sort_key(station_id):
+    return (0, int(station_id)) if station_id is not None and station_id.isdigit() else (1, station_id or "")
+
+
+@bp.function_name(name="GetWipCounters")
+@bp.route(route="WipCounters", methods=["GET"], auth_level=func.AuthLevel.ANONYMOUS)
+@timed_request("WipCounters")
+def wip_counters_endpoint(req: func.HttpRequest) -> func.HttpResponse:
+    station_filter = req.params.get("station_id")
+    add_log_fields(station_id=station_filter)
+    try:
+        snapshot = wip_counters.snapshot(get_connection_string())
+    except CircuitOpenError as e:
+        return service_unavailable_response(e)
+    except Exception as e:
+        logging.error(f"Error reading WIP counters: {str(e)}")
+        return func.HttpResponse(json.dumps({"error": str(e)}), status_code=500, mimetype="application/json")
+
+    stations = {}
+    for (station_id, status), count in snapshot.pop("counts").items():
+        if station_filter and station_id != station_filter.strip():
+            continue
+        station = stations.setdefault(station_id, {
+            "station_id": station_id,
+            "station_name": STATION_NAMES.get(station_id),
+            "total": 0,
+            "statuses": {},
+        })
+        station["statuses"][status or ""] = count
+        station["total"] += count
+
+    add_log_fields(dirty=snapshot["dirty"])
+    return payload_response(req, {
+        "stations": [stations[s] for s in sorted(stations, key=_station_sort_key)],
+        "total": sum(s["total"] for s in stations.values()),
+        **snapshot,
+    })
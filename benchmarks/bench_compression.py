@@ -0,0 +1,162 @@
+"""
+Transfer vs CPU trade-off of response compression (shared_utils.json_response)
+and of the ?format=columnar shape.
+
+Builds JSON bodies shaped like the read endpoints' responses from the
+synthetic data set, times json.loads on each, compresses each with gzip (and
+brotli if installed) at a few levels and prints size, compression CPU time
+and the estimated time on the wire at --link-kbps (effective throughput of a
+handheld on shop-floor Wi-Fi, not the nominal link rate).
+
+    python benchmarks/bench_compression.py
+    python benchmarks/bench_compression.py --link-kbps 500 --out compression.json
+"""
+import argparse
+import datetime
+import gzip
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import dataset  # noqa: E402
+from fake_db import FakeDatabase  # noqa: E402
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def _parts(box_count: int) -> List[Dict[str, Any]]:
+    return list(dataset.iter_parts(box_count))
+
+
+def read_status_body(parts: List[Dict[str, Any]]) -> Dict[str, Any]:
+    part = parts[-1]
+    return {
+        "part_id": part["part_id"], "last_status": part["last_status"], "station_id": part["station_id"],
+        "status_timestamp": part["status_timestamp"], "shipping_id": part["shipping_id"],
+    }
+
+
+def info_status_body(parts: List[Dict[str, Any]]) -> Dict[str, Any]:
+    part = parts[-1]
+    return {"part_history": [
+        {
+            "part_id": part["part_id"], "station_id": step["station_id"], "rezim_cteni": "1",
+            "timestamp": step["status_timestamp"], "employee_id": dataset.BENCH_EMPLOYEE,
+            "gitterbox_id": step["shipping_id"], "protocol_id": None, "history_status": step["status"],
+            "zmena": "insert", "melt": part["melt"], "part_type": part["part_type"],
+        }
+        for step in part["history"]
+    ]}
+
+
+def gitter_body(parts: List[Dict[str, Any]]) -> Dict[str, Any]:
+    history = [
+        {
+            "part_id": part["part_id"], "create_timestamp": part["created"], "employee_id": dataset.BENCH_EMPLOYEE,
+            "station_id": part["station_id"], "last_status": part["last_status"],
+            "status_timestamp": part["status_timestamp"], "shipping_id": part["shipping_id"],
+            "melt": part["melt"], "part_type": part["part_type"],
+        }
+        for part in parts
+    ]
+    return {"gitter_history": history, "gitter_summary": {
+        "parts_count": len(history),
+        "melts": sorted({p["melt"] for p in parts}),
+        "part_types": sorted({str(p["part_type"]) for p in parts}),
+    }}
+
+
+def furnace_body(parts: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {"rows": [
+        {
+            "DMC": part["part_id"], "PartID": part["part_id"], "Furnace": part["furnace"], "MinTemp": 842.0,
+            "MaxTemp": 871.5, "AvgTemp": 858.3, "MeasurementCount": 240,
+            "InsertTime": part["status_timestamp"], "FurnaceTimeSeconds": 14400, "FurnaceTimeHours": 4.0,
+            "TempStartTime": part["created"], "TempEndTime": part["status_timestamp"] + datetime.timedelta(hours=4),
+            "TempDifference": 29.5, "MeasurementsPerMinute": 1.0,
+        }
+        for part in parts
+    ]}
+
+
+def payloads() -> Dict[str, bytes]:
+    with FakeDatabase().install():
+        from shared_utils import columnarize
+
+    box = [p for p in _parts(6) if p["box"] == 5]  # box 5 went through the whole line
+    bodies = {
+        "ReadStatus": read_status_body(box),
+        "InfoStatus": info_status_body(box),
+        "GetInfoGitter (1 box)": gitter_body(box),
+        "GetInfoGitter (5 boxes)": gitter_body(_parts(5)),
+        "GetInfoGitter (5, columnar)": columnarize(gitter_body(_parts(5)), "gitter_history"),
+        "FurnaceReport (1 box)": furnace_body(box),
+    }
+    return {name: json.dumps(body, default=str).encode("utf-8") for name, body in bodies.items()}
+
+
+def codecs() -> List[Tuple[str, Callable[[bytes], bytes], Callable[[bytes], bytes]]]:
+    result = [
+        (f"gzip-{level}", lambda b, level=level: gzip.compress(b, compresslevel=level, mtime=0), gzip.decompress)
+        for level in (1, 5, 9)
+    ]
+    if brotli is not None:
+        result += [
+            (f"br-{quality}", lambda b, quality=quality: brotli.compress(b, quality=quality), brotli.decompress)
+            for quality in (1, 4, 11)
+        ]
+    return result
+
+
+def measure(body: bytes, fn: Callable[[bytes], Any], repeat: int) -> Tuple[Any, float]:
+    """fn(body) and its median time in ms."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn(body)
+        timings.append(1000 * (time.perf_counter() - started))
+    return result, statistics.median(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Response compression: transfer vs CPU.")
+    parser.add_argument("--link-kbps", type=float, default=1000.0, help="effective client throughput (kbit/s)")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--out", help="write the results as JSON")
+    args = parser.parse_args()
+
+    bytes_per_ms = args.link_kbps * 1000 / 8 / 1000
+    results = []
+    print(f"{'payload':28} {'codec':8} {'bytes':>9} {'ratio':>6} {'cpu ms':>8} {'wire ms':>8} {'total ms':>9}")
+    for name, body in payloads().items():
+        _, parse_ms = measure(body, json.loads, args.repeat)
+        print(f"{name} (json.loads {parse_ms:.3f} ms)")
+        wire = len(body) / bytes_per_ms
+        rows = [("identity", len(body), 0.0, wire)]
+        for codec, compress, decompress in codecs():
+            compressed, cpu = measure(body, compress, args.repeat)
+            assert decompress(compressed) == body
+            rows.append((codec, len(compressed), cpu, len(compressed) / bytes_per_ms))
+        for codec, size, cpu, wire_ms in rows:
+            print(f"{name:28} {codec:8} {size:9d} {len(body) / size:6.1f} {cpu:8.3f} {wire_ms:8.1f} {cpu + wire_ms:9.1f}")
+            results.append({
+                "payload": name, "codec": codec, "bytes": size, "identity_bytes": len(body), "parse_ms": round(parse_ms, 4),
+                "cpu_ms": round(cpu, 4), "wire_ms": round(wire_ms, 2),
+            })
+        print()
+
+    if args.out:
+        Path(args.out).write_text(json.dumps({"link_kbps": args.link_kbps, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Throughput of furnace_ingest on a synthetic ExportDbTeploty export.
+
+Generates --samples temperature samples (one per furnace sensor tick, TS as
+the nvarchar text the export holds) and --parts furnace windows in batches,
+then times the stages separately: TS parsing, sorting, window aggregation and
+building the report rows. A per-row Python baseline (strptime + slicing per
+window) runs on a slice of the data for comparison; --check compares its
+results with the vectorized ones.
+
+    python benchmarks/bench_furnace_ingest.py
+    python benchmarks/bench_furnace_ingest.py --samples 5000000 --format cz --check
+"""
+import argparse
+import datetime
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, List, Tuple
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from fake_db import FakeDatabase  # noqa: E402
+
+START = datetime.datetime(2025, 5, 14, 0, 0, 0)
+FORMATS = {"iso": "%Y-%m-%d %H:%M:%S", "cz": "%d.%m.%Y %H:%M:%S"}
+
+
+def synthetic_export(samples: int, fmt: str, seed: int) -> Tuple[List[str], np.ndarray]:
+    """TS strings (1 s apart, a few out of order) and smallint temperatures."""
+    rng = np.random.default_rng(seed)
+    seconds = np.arange(samples, dtype=np.int64)
+    swap = rng.choice(samples - 1, size=samples // 1000, replace=False)
+    seconds[swap], seconds[swap + 1] = seconds[swap + 1], seconds[swap]
+    stamps = np.datetime64(START, "s") + seconds
+    text = np.datetime_as_string(stamps).astype(object)
+    if fmt == "cz":
+        text = [f"{s[8:10]}.{s[5:7]}.{s[0:4]} {s[11:19]}" for s in text]
+    else:
+        text = [s.replace("T", " ") for s in text]
+    curve = 850 + 25 * np.sin(seconds / 3600.0) + rng.normal(0, 3, samples)
+    return text, curve.round().astype(np.int16)
+
+
+def synthetic_windows(samples: int, parts: int, batch: int) -> List[Tuple[str, datetime.datetime, datetime.datetime]]:
+    """Batches of `batch` parts sharing a ~4 h window, spread over the export."""
+    windows = []
+    span = max(samples - 4 * 3600, 1)
+    for b in range(0, parts, batch):
+        entered = START + datetime.timedelta(seconds=int(span * b / parts))
+        left = entered + datetime.timedelta(hours=4, minutes=b % 17)
+        windows += [(f"P{b + j:07d}", entered, left) for j in range(min(batch, parts - b))]
+    return windows
+
+
+def timed(fn: Callable[[], Any], repeat: int) -> Tuple[Any, float]:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - started)
+    return result, statistics.median(timings)
+
+
+def baseline(ts: List[str], values: np.ndarray, windows, fmt: str) -> List[Tuple[int, float, float, float]]:
+    """Row-at-a-time reference: strptime every sample, scan the samples per window."""
+    parsed = sorted(zip((datetime.datetime.strptime(s, FORMATS[fmt]) for s in ts), values.tolist()))
+    result = []
+    for _, entered, left in windows:
+        inside = [v for t, v in parsed if entered <= t <= left]
+        result.append((len(inside), min(inside), max(inside), sum(inside) / len(inside)) if inside else (0,) * 4)
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="furnace_ingest throughput on a synthetic export.")
+    parser.add_argument("--samples", type=int, default=2_000_000)
+    parser.add_argument("--parts", type=int, default=5000)
+    parser.add_argument("--batch", type=int, default=50, help="parts per furnace batch (shared window)")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="iso", help="TS text format")
+    parser.add_argument("--baseline-samples", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--check", action="store_true", help="compare with the per-row baseline")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    with FakeDatabase().install():
+        import furnace_ingest
+
+    ts, values = synthetic_export(args.samples, args.format, args.seed)
+    windows = synthetic_windows(args.samples, args.parts, args.batch)
+    starts = np.array([w[1] for w in windows], dtype="datetime64[ms]")
+    ends = np.array([w[2] for w in windows], dtype="datetime64[ms]")
+    print(f"{args.samples} samples ({args.format}), {len(windows)} parts in batches of {args.batch}")
+
+    parsed, parse_s = timed(lambda: furnace_ingest.parse_timestamps(ts), args.repeat)
+    (sorted_ts, sorted_values), sort_s = timed(
+        lambda: furnace_ingest.sort_samples(parsed, values.astype(np.float64)), args.repeat)
+    stats, aggregate_s = timed(
+        lambda: furnace_ingest.aggregate_windows(sorted_ts, sorted_values, starts, ends), args.repeat)
+    rows, build_s = timed(
+        lambda: furnace_ingest.build_report_rows("2213", windows, stats, START), args.repeat)
+    total = parse_s + sort_s + aggregate_s + build_s
+    for stage, seconds in (("parse TS", parse_s), ("sort", sort_s), ("aggregate", aggregate_s),
+                           ("report rows", build_s), ("total", total)):
+        print(f"{stage:12} {1000 * seconds:9.1f} ms {args.samples / seconds:14,.0f} samples/s")
+    print(f"{len(rows)} report rows")
+
+    n = min(args.baseline_samples, args.samples)
+    part_windows = [w for w in windows if w[2] <= START + datetime.timedelta(seconds=n)]
+    _, base_s = timed(lambda: baseline(ts[:n], values[:n], part_windows, args.format), 1)
+    print(f"{'per-row':12} {1000 * base_s:9.1f} ms {n / base_s:14,.0f} samples/s "
+          f"({n} samples, {len(part_windows)} windows)")
+
+    if args.check:
+        small_ts, small_values = furnace_ingest.sort_samples(
+            furnace_ingest.parse_timestamps(ts[:n]), values[:n].astype(np.float64))
+        small = furnace_ingest.aggregate_windows(
+            small_ts, small_values,
+            np.array([w[1] for w in part_windows], dtype="datetime64[ms]"),
+            np.array([w[2] for w in part_windows], dtype="datetime64[ms]"))
+        for i, expected in enumerate(baseline(ts[:n], values[:n], part_windows, args.format)):
+            got = (int(small["count"][i]), small["min"][i], small["max"][i], small["avg"][i])
+            if expected[0] == 0:
+                assert got[0] == 0, (i, got)
+                continue
+            assert got[:3] == expected[:3] and abs(got[3] - expected[3]) < 1e-6, (i, got, expected)
+        print(f"check ok: {len(part_windows)} windows match the per-row baseline")
+
+
+if __name__ == "__main__":
+    main()
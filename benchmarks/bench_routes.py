@@ -0,0 +1,378 @@
+"""
+In-process load generator for the Function routes.
+
+Imports function_app, calls the registered handlers directly (no host, no
+HTTP stack, no auth keys) with weighted scenario flows modelled on the line
+terminals, and reports req/s and p50/p95/p99 per function as JSON. Point the
+AZURE_SQL_* variables at a DB seeded by seed_local_db.py first.
+
+    python benchmarks/bench_routes.py --duration 60 --concurrency 16 --out baseline.json
+    python benchmarks/bench_routes.py --duration 60 --compare baseline.json
+
+Writing flows modify the seeded data; re-run seed_local_db.py --reset between
+runs that should be compared.
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import datetime
+import inspect
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import azure.functions as func
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import dataset  # noqa: E402
+
+# flow name -> weight
+SCENARIOS: Dict[str, Dict[str, int]] = {
+    # mix of a working shift: scans, terminal lookups, box handling, reports
+    "line": {
+        "station_flow": 5,
+        "station_reads": 3,
+        "gitterbox_info": 3,
+        "reports": 2,
+        "control_checks": 1,
+        "gitterbox_moves": 1,
+        "terminal_misc": 1,
+    },
+    "reads": {"station_reads": 3, "gitterbox_info": 3, "reports": 2},
+    "writes": {"station_flow": 3, "control_checks": 1, "gitterbox_moves": 1, "terminal_misc": 1},
+    "reports": {"reports": 1},
+}
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(sorted_values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(pct / 100.0 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class RouteDriver:
+    """Calls the app's handlers by function name and records their latency."""
+
+    def __init__(self, app: func.FunctionApp, pool: concurrent.futures.Executor):
+        self.pool = pool
+        self.handlers: Dict[str, Callable] = {}
+        self.routes: Dict[str, str] = {}
+        for function in app.get_functions():
+            name = function.get_function_name()
+            trigger = function.get_trigger()
+            self.handlers[name] = function.get_user_function()
+            self.routes[name] = getattr(trigger, "route", None) or getattr(trigger, "queue_name", None) or name
+        self.latencies: Dict[str, List[float]] = {}
+        self.statuses: Dict[str, Dict[str, int]] = {}
+        self.errors: Dict[str, int] = {}
+        self.recording = False
+
+    def reset(self) -> None:
+        self.latencies, self.statuses, self.errors = {}, {}, {}
+
+    async def _call(self, name: str, arg: Any) -> Any:
+        handler = self.handlers[name]
+        if inspect.iscoroutinefunction(handler):
+            return await handler(arg)
+        return await asyncio.get_running_loop().run_in_executor(self.pool, handler, arg)
+
+    def _record(self, name: str, elapsed: float, status: str, failed: bool) -> None:
+        if not self.recording:
+            return
+        self.latencies.setdefault(name, []).append(elapsed)
+        counts = self.statuses.setdefault(name, {})
+        counts[status] = counts.get(status, 0) + 1
+        if failed:
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+    async def http(self, name: str, method: str = "GET", params: Optional[Dict[str, str]] = None,
+                   body: Optional[Dict[str, Any]] = None) -> Optional[func.HttpResponse]:
+        headers = {"content-type": "application/json"} if body is not None else {}
+        req = func.HttpRequest(
+            method=method,
+            url=f"http://localhost/api/{self.routes.get(name, name)}",
+            headers=headers,
+            params=params or {},
+            body=json.dumps(body, default=str).encode("utf-8") if body is not None else b"",
+        )
+        started = time.perf_counter()
+        try:
+            resp = await self._call(name, req)
+        except Exception as e:
+            self._record(name, time.perf_counter() - started, "exception", True)
+            logging.debug(f"{name} raised: {e}")
+            return None
+        status = resp.status_code
+        self._record(name, time.perf_counter() - started, str(status), status >= 500)
+        return resp
+
+    async def queue(self, name: str, payload: Dict[str, Any]) -> bool:
+        msg = func.QueueMessage(id=str(uuid.uuid4()), body=json.dumps(payload, default=str).encode("utf-8"))
+        started = time.perf_counter()
+        try:
+            await self._call(name, msg)
+        except Exception as e:
+            self._record(name, time.perf_counter() - started, "exception", True)
+            logging.debug(f"{name} raised: {e}")
+            return False
+        self._record(name, time.perf_counter() - started, "ok", False)
+        return True
+
+    def summary(self, elapsed: float) -> Dict[str, Any]:
+        routes = {}
+        all_latencies: List[float] = []
+        for name, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            all_latencies.extend(values)
+            routes[name] = _stats(values, elapsed, self.errors.get(name, 0))
+            routes[name]["route"] = self.routes.get(name, name)
+            routes[name]["statuses"] = self.statuses.get(name, {})
+        return {
+            "routes": routes,
+            "total": _stats(sorted(all_latencies), elapsed, sum(self.errors.values())),
+        }
+
+
+def _stats(values: List[float], elapsed: float, errors: int) -> Dict[str, Any]:
+    stats: Dict[str, Any] = {
+        "count": len(values),
+        "errors": errors,
+        "rps": round(len(values) / elapsed, 2) if elapsed else None,
+        "mean_ms": round(1000 * sum(values) / len(values), 2) if values else None,
+        "max_ms": round(1000 * values[-1], 2) if values else None,
+    }
+    for pct in PERCENTILES:
+        value = percentile(values, pct)
+        stats[f"p{pct}_ms"] = round(1000 * value, 2) if value is not None else None
+    return stats
+
+
+class Flows:
+    """Scenario flows. Each one is what a terminal does for one part / box."""
+
+    def __init__(self, driver: RouteDriver, box_count: int, with_rockq: bool):
+        self.driver = driver
+        self.box_count = box_count
+        self.with_rockq = with_rockq
+        self.run_tag = uuid.uuid4().hex[:4].upper()
+        self.counter = 0
+
+    def _new_part_id(self) -> str:
+        self.counter += 1
+        return f"BN{self.run_tag}{self.counter:06d}"
+
+    def _seeded_part(self, rng: random.Random, station_id: Optional[str] = None) -> Dict[str, Any]:
+        boxes = dataset.boxes_at_station(station_id, self.box_count) if station_id else range(self.box_count)
+        i = rng.choice(list(boxes))
+        j = rng.randrange(dataset.PARTS_PER_BOX)
+        stage = dataset.box_stage(i)
+        return {
+            "box": i,
+            "part_id": dataset.part_id(i, j),
+            "shipping_id": dataset.repack_box_id(i) if dataset.LINE_STATIONS[stage] == "6" else dataset.box_id(i),
+            "station_id": dataset.LINE_STATIONS[stage],
+            "next_station_id": dataset.LINE_STATIONS[min(stage + 1, len(dataset.LINE_STATIONS) - 1)],
+            "melt": dataset.MELTS[i % len(dataset.MELTS)],
+            "part_type": dataset.PART_TYPES[i % len(dataset.PART_TYPES)],
+        }
+
+    @staticmethod
+    def _scan(part_id: str, station_id: str, shipping_id: str) -> Dict[str, Any]:
+        return {
+            "part_id": part_id,
+            "employee_id": dataset.BENCH_EMPLOYEE,
+            "station_id": station_id,
+            "status": "OK",
+            "status_timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "shipping_id": shipping_id,
+        }
+
+    async def station_flow(self, rng: random.Random) -> None:
+        """New part from the forging line, then Test tvrdosti and Penetrace."""
+        part_id = self._new_part_id()
+        shipping_id = dataset.box_id(rng.randrange(self.box_count))
+        await self.driver.queue("QueueFunc", self._scan(part_id, "1", shipping_id))
+        for station_id in ("2", "3"):
+            await self.driver.http("ReadStatus", params={"part_id": part_id})
+            await self.driver.http("CanEnter", params={"part_id": part_id, "station_id": station_id})
+            await self.driver.queue("QueueFunc", self._scan(part_id, station_id, shipping_id))
+
+    async def station_reads(self, rng: random.Random) -> None:
+        part = self._seeded_part(rng)
+        await self.driver.http("ReadStatus", params={"part_id": part["part_id"]})
+        await self.driver.http("CanEnter", params={"part_id": part["part_id"], "station_id": part["next_station_id"]})
+
+    async def gitterbox_info(self, rng: random.Random) -> None:
+        part = self._seeded_part(rng)
+        await self.driver.http("GetInfoGitter", params={"shipping_id": part["shipping_id"]})
+        await self.driver.http("GetInfoRezim2", params={"value": part["shipping_id"]})
+        await self.driver.http("KovaciLinkaCheckHttpFunc", method="POST", body={"gitter_id": dataset.box_id(part["box"])})
+
+    async def reports(self, rng: random.Random) -> None:
+        part = self._seeded_part(rng)
+        await self.driver.http("GetInfoStatus", params={"part_id": part["part_id"]})
+        await self.driver.http("InfoKontrol", params={"part_id": part["part_id"]})
+        await self.driver.http("GetFurnaceReport", params={"value": part["part_id"]})
+        if self.with_rockq:
+            await self.driver.http("GetRqtReport", params={"dpm": part["part_id"]})
+
+    async def control_checks(self, rng: random.Random) -> None:
+        part = self._seeded_part(rng, "3")
+        for station_id in dataset.KKK_STATIONS:
+            await self.driver.http("ControlStationInsertHttpFunc", method="POST", body={
+                "station_id": station_id,
+                "part_id": part["part_id"],
+                "status": "OK",
+                "operator_id": dataset.BENCH_EMPLOYEE,
+                "shipping_id": part["shipping_id"],
+                "part_type": part["part_type"],
+                "melt": part["melt"],
+            })
+
+    async def gitterbox_moves(self, rng: random.Random) -> None:
+        part = self._seeded_part(rng, "6")
+        await self.driver.http("ChangeStatusHttpFunc", method="POST", body={
+            "station_id": "6",
+            "status": "OK",
+            "shipping_id": part["shipping_id"],
+            "current_workspace_id": dataset.BENCH_WORKSPACE,
+            "employee_id": dataset.BENCH_EMPLOYEE,
+        })
+
+    async def terminal_misc(self, rng: random.Random) -> None:
+        part = self._seeded_part(rng)
+        await self.driver.http("AuthenticateCard", params={"card_id": rng.choice(dataset.NFC_CARDS)})
+        await self.driver.http("KovaciLinkaScanHttpFunc", method="POST", body={
+            "gitter_id": dataset.box_id(part["box"]),
+            "employee_id": dataset.BENCH_EMPLOYEE,
+            "position": rng.choice("AB"),
+        })
+        await self.driver.http("ProtocolPartInsertHttpFunc", method="POST", body={
+            "part_id": part["part_id"],
+            "protocol_id": f"P{rng.randrange(1000, 9999)}",
+            "employee_id": dataset.BENCH_EMPLOYEE,
+            "station_id": part["station_id"],
+            "status": "OK",
+            "shipping_id": part["shipping_id"],
+        })
+
+
+async def worker(flows: Flows, weights: Dict[str, int], rng: random.Random, stop_at: float) -> None:
+    names = list(weights)
+    counts = [weights[name] for name in names]
+    while time.monotonic() < stop_at:
+        flow: Callable[[random.Random], Awaitable[None]] = getattr(flows, rng.choices(names, counts)[0])
+        await flow(rng)
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    import function_app
+
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=args.concurrency, thread_name_prefix="bench")
+    asyncio.get_running_loop().set_default_executor(pool)
+    driver = RouteDriver(function_app.app, pool)
+    flows = Flows(driver, args.boxes, args.with_rockq)
+    weights = SCENARIOS[args.scenario]
+
+    if args.warmup > 0:
+        stop_at = time.monotonic() + args.warmup
+        await asyncio.gather(*(
+            worker(flows, weights, random.Random(args.seed + 1000 + n), stop_at) for n in range(args.concurrency)
+        ))
+
+    driver.recording = True
+    started = time.monotonic()
+    stop_at = started + args.duration
+    await asyncio.gather(*(
+        worker(flows, weights, random.Random(args.seed + n), stop_at) for n in range(args.concurrency)
+    ))
+    elapsed = time.monotonic() - started
+
+    result = driver.summary(elapsed)
+    result["meta"] = {
+        "scenario": args.scenario,
+        "weights": weights,
+        "duration_s": round(elapsed, 2),
+        "concurrency": args.concurrency,
+        "boxes": args.boxes,
+        "seed": args.seed,
+        "python": platform.python_version(),
+        "started_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "sql_server": os.getenv("AZURE_SQL_CONNECTION_STRING"),
+    }
+    return result
+
+
+def compare(result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Routes whose p95 grew or throughput dropped by more than `tolerance` (fraction)."""
+    regressions = []
+    for name, base in baseline.get("routes", {}).items():
+        current = result["routes"].get(name)
+        if not current:
+            continue
+        if base.get("p95_ms") and current.get("p95_ms") and current["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {base['p95_ms']} ms -> {current['p95_ms']} ms")
+        if base.get("rps") and current.get("rps") is not None and current["rps"] < base["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: {base['rps']} req/s -> {current['rps']} req/s")
+    return regressions
+
+
+def print_table(result: Dict[str, Any]) -> None:
+    header = f"{'function':<30}{'count':>8}{'err':>6}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}"
+    print(header)
+    print("-" * len(header))
+    rows = list(result["routes"].items()) + [("TOTAL", result["total"])]
+    for name, stats in rows:
+        print(f"{name:<30}{stats['count']:>8}{stats['errors']:>6}{stats['rps'] or 0:>9}"
+              f"{stats['p50_ms'] or 0:>9}{stats['p95_ms'] or 0:>9}{stats['p99_ms'] or 0:>9}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the Function routes in-process.")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="line")
+    parser.add_argument("--duration", type=float, default=30.0, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=5.0, help="unmeasured seconds before the run")
+    parser.add_argument("--concurrency", type=int, default=8, help="simulated terminals")
+    parser.add_argument("--boxes", type=int, default=dataset.DEFAULT_BOX_COUNT,
+                        help="gitterboxes in the seeded data set")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--with-rockq", action="store_true", help="include RqtReport (needs ROCKQ_DB_*)")
+    parser.add_argument("--out", help="write the JSON result here")
+    parser.add_argument("--compare", help="baseline JSON to compare against; exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression (fraction)")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+
+    # Handlers log every request at INFO; keep that out of the measurement
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING, format="%(message)s")
+
+    result = asyncio.run(run(args))
+    print_table(result)
+
+    if args.out:
+        Path(args.out).write_text(json.dumps(result, indent=2), encoding="utf-8")
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        regressions = compare(result, baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+"""
+Concurrency regression checks against the fake DB driver (fake_db.py).
+
+Drives the real handlers with N concurrent callers and asserts the
+properties the write/read paths rely on: per-key write serialization,
+executor-bounded DB concurrency, handler overhead at the tail, the circuit
+breaker failing fast, connection-pool exhaustion, idempotent replays and the
+part dossier fan-out being bounded by its slowest source, with the sources on
+executors of their own (not DB_EXECUTOR).
+Needs no database; exits 1 when a check fails.
+
+    python benchmarks/concurrency_checks.py            # all checks
+    python benchmarks/concurrency_checks.py -k breaker # checks whose name contains "breaker"
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import datetime
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+import uuid
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import fake_db  # noqa: E402
+from fake_db import FakeDatabase, constant, lognormal, transient_error  # noqa: E402
+from bench_routes import RouteDriver, percentile  # noqa: E402
+
+CALLERS = 32
+CHECKS: List[Callable[[RouteDriver], Awaitable[None]]] = []
+
+
+def check(fn: Callable[[RouteDriver], Awaitable[None]]) -> Callable[[RouteDriver], Awaitable[None]]:
+    CHECKS.append(fn)
+    return fn
+
+
+def scan(part_id: str, station_id: str = "2", shipping_id: str = None) -> Dict[str, Any]:
+    return {
+        "part_id": part_id,
+        "employee_id": "bench",
+        "station_id": station_id,
+        "status": "OK",
+        "status_timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "shipping_id": shipping_id,
+    }
+
+
+def unique(prefix: str) -> str:
+    return f"{prefix}{uuid.uuid4().hex[:8].upper()}"
+
+
+def max_overlap(calls: List[fake_db.Call]) -> int:
+    """Largest number of calls that were running at the same time."""
+    events = sorted([(c.started, 1) for c in calls] + [(c.ended, -1) for c in calls])
+    running = peak = 0
+    for _, delta in events:
+        running += delta
+        peak = max(peak, running)
+    return peak
+
+
+def part_status_row(part_id: str) -> tuple:
+    now = datetime.datetime.now()
+    return ("OK", "2", now, now, "bench", f"BOX{part_id}", 1, 0)
+
+
+async def callers(count: int, total: int, call: Callable[[], Awaitable[Any]]) -> None:
+    """`total` calls from `count` concurrent callers, each waiting for its previous call."""
+    async def caller(n: int) -> None:
+        for _ in range(n):
+            await call()
+
+    await asyncio.gather(*(caller(total // count + (i < total % count)) for i in range(count)))
+
+
+@check
+async def writes_to_one_part_never_overlap(driver: RouteDriver) -> None:
+    db = FakeDatabase(seed=1)
+    db.on(r"EXEC InsertTraceabilityLog", latency=constant(20))
+    parts = [unique("CP") for _ in range(8)]
+    with db.install():
+        await asyncio.gather(*(
+            driver.queue("QueueFunc", scan(part_id, station_id, f"BOX{part_id}"))
+            for station_id in ("2", "3", "4", "5") for part_id in parts
+        ))
+
+    execs = db.calls_matching(r"EXEC InsertTraceabilityLog")
+    assert len(execs) == 32, f"expected 32 writes, got {len(execs)}"
+    for part_id in parts:
+        mine = [c for c in execs if c.params[0] == part_id]
+        assert max_overlap(mine) == 1, f"writes to {part_id} overlapped"
+    assert max_overlap(execs) > 1, "writes to different parts were serialized too"
+
+
+@check
+async def executor_bounds_db_concurrency(driver: RouteDriver) -> None:
+    import shared_utils
+
+    workers = shared_utils.DB_EXECUTOR._max_workers
+    latency_ms = 25
+    db = FakeDatabase(seed=2)
+    db.on(r"EXEC InsertTraceabilityLog", latency=constant(latency_ms))
+    started = time.monotonic()
+    with db.install():
+        await asyncio.gather(*(
+            driver.queue("QueueFunc", scan(unique("CE"), "2", None)) for _ in range(4 * workers)
+        ))
+    elapsed = time.monotonic() - started
+
+    execs = db.calls_matching(r"EXEC InsertTraceabilityLog")
+    assert max_overlap(execs) <= workers, f"{max_overlap(execs)} concurrent writes > {workers} executor workers"
+    ideal = 4 * latency_ms / 1000.0
+    assert elapsed < 2 * ideal + 0.1, f"{4 * workers} writes took {elapsed:.3f} s (ideal {ideal:.3f} s)"
+
+
+@check
+async def read_overhead_at_the_tail(driver: RouteDriver) -> None:
+    db = FakeDatabase(seed=3)
+    db.on(r"FROM dbo\.part_status", handler=lambda sql, params: [part_status_row(params[0])],
+          latency=lognormal(10, 0.6))
+    driver.reset()
+    with db.install():
+        await callers(CALLERS, 200, lambda: driver.http("ReadStatus", params={"part_id": unique("CR")}))
+
+    statuses = driver.statuses["ReadStatus"]
+    assert statuses == {"200": 200}, f"unexpected statuses {statuses}"
+    handler = sorted(driver.latencies["ReadStatus"])
+    queries = sorted(c.duration for c in db.calls_matching(r"FROM dbo\.part_status"))
+    overhead_ms = 1000 * (percentile(handler, 99) - percentile(queries, 99))
+    assert overhead_ms < 30, f"ReadStatus adds {overhead_ms:.1f} ms over the query at p99"
+
+
+@check
+async def breaker_fails_fast_when_db_is_down(driver: RouteDriver) -> None:
+    import shared_utils
+
+    breaker = shared_utils.sql_circuit_breaker
+    saved = shared_utils.SQL_RETRY_BASE_DELAY, breaker.reset_seconds
+    shared_utils.SQL_RETRY_BASE_DELAY = 0.005
+    breaker.reset_seconds = 60
+    db = FakeDatabase(seed=4)
+    db.on(r".", error=transient_error, latency=constant(5))
+    try:
+        with db.install():
+            driver.reset()
+            await asyncio.gather(*(
+                driver.http("ReadStatus", params={"part_id": unique("CB")}) for _ in range(CALLERS)
+            ))
+            first_wave = len(db.calls)
+            assert set(driver.statuses["ReadStatus"]) <= {"500", "503"}, driver.statuses["ReadStatus"]
+            assert breaker.state == breaker.OPEN, "breaker did not open"
+            bound = breaker.failure_threshold + CALLERS
+            assert first_wave <= bound, f"{first_wave} DB calls before the breaker opened (> {bound})"
+
+            driver.reset()
+            await asyncio.gather(*(
+                driver.http("ReadStatus", params={"part_id": unique("CB")}) for _ in range(CALLERS)
+            ))
+            assert len(db.calls) == first_wave, "open breaker still let calls through"
+            assert driver.statuses["ReadStatus"] == {"503": CALLERS}, driver.statuses["ReadStatus"]
+            p99 = percentile(sorted(driver.latencies["ReadStatus"]), 99)
+            assert p99 < 0.05, f"rejections took {1000 * p99:.1f} ms at p99"
+            rejected = await driver.http("ReadStatus", params={"part_id": unique("CB")})
+            assert rejected.headers.get("Retry-After"), "503 without Retry-After"
+    finally:
+        shared_utils.SQL_RETRY_BASE_DELAY, breaker.reset_seconds = saved
+        breaker.record_success()
+
+
+@check
+async def pool_exhaustion_queues_callers(driver: RouteDriver) -> None:
+    db = FakeDatabase(seed=5, max_connections=4, pool_timeout=5)
+    db.on(r"FROM dbo\.part_status", handler=lambda sql, params: [part_status_row(params[0])],
+          latency=constant(50))
+    driver.reset()
+    started = time.monotonic()
+    with db.install():
+        await asyncio.gather(*(
+            driver.http("ReadStatus", params={"part_id": unique("CP")}) for _ in range(16)
+        ))
+    elapsed = time.monotonic() - started
+
+    assert driver.statuses["ReadStatus"] == {"200": 16}, driver.statuses["ReadStatus"]
+    assert db.max_active_connections <= 4, f"{db.max_active_connections} connections open at once"
+    assert elapsed >= 0.9 * 4 * 0.05, f"16 reads through 4 connections took only {elapsed:.3f} s"
+
+
+@check
+async def replayed_messages_write_once(driver: RouteDriver) -> None:
+    db = FakeDatabase(seed=6)
+    db.on(r"INSERT INTO dbo\.idempotency_keys", rowcount=0)
+    db.on(r"INSERT INTO dbo\.idempotency_keys", rowcount=1, times=1)
+    payload = dict(scan(unique("CI"), "2", None), idempotency_key=unique("key-"))
+    with db.install():
+        # The same scan delivered concurrently (two producers) and once more later (queue redelivery)
+        await asyncio.gather(*(driver.queue("QueueFunc", payload) for _ in range(4)))
+        await driver.queue("QueueFunc", payload)
+
+    execs = db.calls_matching(r"EXEC InsertTraceabilityLog")
+    assert len(execs) == 1, f"replayed scan was written {len(execs)} times"
+
+
+@check
+async def dossier_waits_for_the_slowest_source_only(driver: RouteDriver) -> None:
+    import json
+    import PartDossier
+    from shared_utils import get_metrics
+
+    saved = dict(PartDossier.DOSSIER_SOURCES), {k: os.environ.get(k) for k in ("ROCKQ_DB_SERVER", "ROCKQ_DB_USER",
+                                                                                  "ROCKQ_DB_PASSWORD", "ROCKQ_DB_NAME")}
+    PartDossier.DOSSIER_SOURCES["rqt_report"] = (PartDossier._rqt_report, 0.2)
+    os.environ.update(ROCKQ_DB_SERVER="rockq", ROCKQ_DB_USER="bench", ROCKQ_DB_PASSWORD="x", ROCKQ_DB_NAME="rockq")
+    db = FakeDatabase(seed=7)
+    db.on(r".", latency=constant(50))
+    db.on(r"THEN 1 ELSE 0 END", rows=[(1,)], latency=constant(50))
+    db.on(r"v_traceability_report", rows=[], latency=constant(1000))
+    release = threading.Event()
+    try:
+        started = time.monotonic()
+        with db.install():
+            resp = await driver.http("GetPartDossier", params={"part_id": unique("CD")})
+            elapsed = time.monotonic() - started
+            # RockQ hung on every thread of its executor: the next dossier drops its queued lookup
+            for _ in range(PartDossier.RQT_EXECUTOR._max_workers):
+                PartDossier.RQT_EXECUTOR.submit(release.wait, 5)
+            cancelled = get_metrics()["counters"].get("dossier_cancelled_rqt_report", 0)
+            rockq_calls = len(db.calls_matching(r"v_traceability_report"))
+            blocked = await driver.http("GetPartDossier", params={"part_id": unique("CD")})
+    finally:
+        release.set()
+        PartDossier.DOSSIER_SOURCES.update(saved[0])
+        for name, value in saved[1].items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+    assert resp is not None and resp.status_code == 200, resp and resp.status_code
+    dossier = json.loads(resp.get_body())
+    assert dossier["incomplete_sources"] == ["rqt_report"], dossier["sources"]
+    assert dossier["sources"]["rqt_report"]["status"] == "timeout", dossier["sources"]["rqt_report"]
+    sql_time = sum(c.duration for c in db.calls if "v_traceability_report" not in c.sql)
+    # InfoKontrol's three queries (150 ms) are the slowest SQL source; the sum is 300 ms
+    assert elapsed < 0.25, f"dossier took {elapsed:.3f} s, expected ~0.2 s (RockQ deadline)"
+    assert elapsed < sql_time, f"dossier took {elapsed:.3f} s, the sources sequentially {sql_time:.3f} s"
+    rockq_threads = {c.thread for c in db.calls_matching(r"v_traceability_report")}
+    assert all(t.startswith("rockq") for t in rockq_threads), rockq_threads
+    source_threads = {c.thread for c in db.calls if "v_traceability_report" not in c.sql}
+    assert all(t.startswith("dossier") for t in source_threads), f"sources ran on {source_threads}, not off DB_EXECUTOR"
+
+    assert blocked is not None and blocked.status_code == 200, blocked and blocked.status_code
+    assert json.loads(blocked.get_body())["incomplete_sources"] == ["rqt_report"]
+    assert get_metrics()["counters"].get("dossier_cancelled_rqt_report", 0) == cancelled + 1
+    assert len(db.calls_matching(r"v_traceability_report")) == rockq_calls, "a cancelled RockQ lookup ran"
+
+
+async def run_checks(selected: List[Callable[[RouteDriver], Awaitable[None]]]) -> int:
+    import function_app
+
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=CALLERS, thread_name_prefix="caller")
+    driver = RouteDriver(function_app.app, pool)
+    driver.recording = True
+    failed = 0
+    for fn in selected:
+        started = time.monotonic()
+        try:
+            await fn(driver)
+        except AssertionError as e:
+            failed += 1
+            print(f"FAIL  {fn.__name__}: {e}")
+        except Exception:
+            failed += 1
+            print(f"ERROR {fn.__name__}")
+            traceback.print_exc()
+        else:
+            print(f"ok    {fn.__name__} ({time.monotonic() - started:.2f} s)")
+    pool.shutdown()
+    return failed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Concurrency checks against the fake DB driver.")
+    parser.add_argument("-k", dest="keyword", help="only run checks whose name contains this")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.CRITICAL, format="%(message)s")
+    # Gating reads part_status before every scan; the write checks only script the writes.
+    os.environ["STATION_GATING_ENFORCED"] = "false"
+
+    selected = [fn for fn in CHECKS if not args.keyword or args.keyword in fn.__name__]
+    # Import the app against the fake so no real driver (or ODBC stack) is needed.
+    with FakeDatabase().install():
+        failed = asyncio.run(run_checks(selected))
+    print(f"{len(selected) - failed} passed, {failed} failed")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
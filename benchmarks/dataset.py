@@ -0,0 +1,91 @@
+"""
+Deterministic synthetic data set shared by seed_local_db.py and bench_routes.py.
+
+Gitterbox i holds PARTS_PER_BOX parts that all went through the same stations
+(box_stage(i) picks how far along the line they are), so the benchmark can pick
+ids that hit the interesting branches of every read endpoint without querying
+the DB first.
+"""
+import datetime
+from typing import Any, Dict, Iterator, List
+
+DEFAULT_BOX_COUNT = 120
+PARTS_PER_BOX = 40
+
+# Route of a part through the line: Kovací linka -> ... -> Přeskladnění
+LINE_STATIONS = ["1", "2", "3", "4", "5", "6"]
+KKK_STATIONS = [15, 16, 17, 18]
+QUALITY_STATIONS = [19, 20]
+
+MELTS = ["A1203", "B0711", "C3302", "D4105", "E0509"]
+PART_TYPES = [101, 102, 205]
+FURNACES = ["2213", "2214"]
+
+BASE_TIMESTAMP = datetime.datetime(2026, 1, 5, 6, 0, 0)
+
+# Cards from database/insert_nfc_cards.sql
+NFC_CARDS = ["04:96:73:8A:9C:1B:90", "04:B9:57:8A:9C:1B:90"]
+BENCH_EMPLOYEE = "bench"
+BENCH_WORKSPACE = 1
+
+
+def box_id(i: int) -> str:
+    return f"BGB{i:05d}"
+
+
+def repack_box_id(i: int) -> str:
+    """Gitterbox the parts of box i end up in after Přeskladnění (station 6)."""
+    return f"BGR{i:05d}"
+
+
+def part_id(i: int, j: int) -> str:
+    return f"BP{i:05d}{j:03d}"
+
+
+def box_stage(i: int) -> int:
+    """Index into LINE_STATIONS of the last station the parts of box i passed."""
+    return i % len(LINE_STATIONS)
+
+
+def box_started_at(i: int) -> datetime.datetime:
+    return BASE_TIMESTAMP + datetime.timedelta(minutes=10 * i)
+
+
+def iter_parts(box_count: int = DEFAULT_BOX_COUNT) -> Iterator[Dict[str, Any]]:
+    """Yield one dict per part with its current state and station history."""
+    for i in range(box_count):
+        stage = box_stage(i)
+        started = box_started_at(i)
+        for j in range(PARTS_PER_BOX):
+            history: List[Dict[str, Any]] = []
+            shipping_id = box_id(i)
+            for step, station_id in enumerate(LINE_STATIONS[:stage + 1]):
+                if station_id == "6":
+                    shipping_id = repack_box_id(i)
+                history.append({
+                    "station_id": station_id,
+                    "status": "OK",
+                    "status_timestamp": started + datetime.timedelta(hours=2 * step, seconds=j),
+                    "shipping_id": shipping_id,
+                })
+            yield {
+                "box": i,
+                "part_id": part_id(i, j),
+                "melt": MELTS[i % len(MELTS)],
+                "part_type": PART_TYPES[i % len(PART_TYPES)],
+                "furnace": FURNACES[i % len(FURNACES)],
+                "created": history[0]["status_timestamp"],
+                "station_id": history[-1]["station_id"],
+                "last_status": history[-1]["status"],
+                "status_timestamp": history[-1]["status_timestamp"],
+                "shipping_id": history[-1]["shipping_id"],
+                # KKK kontroly sú hotové pred Tryskaním, 19/20 pred Kontrolou kvality
+                "control_check": stage >= LINE_STATIONS.index("3"),
+                "quality_check": stage >= LINE_STATIONS.index("4"),
+                "history": history,
+            }
+
+
+def boxes_at_station(station_id: str, box_count: int = DEFAULT_BOX_COUNT) -> List[int]:
+    """Boxes whose parts currently sit at `station_id`."""
+    return [i for i in range(box_count) if LINE_STATIONS[box_stage(i)] == station_id]
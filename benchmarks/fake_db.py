@@ -0,0 +1,425 @@
+"""
+Latency-injecting stand-in for the pyodbc / pymssql surface the app uses.
+
+    db = FakeDatabase(seed=1)
+    db.on(r"FROM dbo\\.part_status", rows=[("OK", "2", "BGB00001", 1, 0)], latency=lognormal(8, 0.5))
+    db.on(r"EXEC InsertTraceabilityLog", latency=constant(20), error=transient_error, error_rate=0.1)
+    with db.install():
+        ...  # handlers now talk to db
+
+Rules are matched (regex, case-insensitive, whitespace collapsed) against the
+SQL text; the rule added last wins. Every execute is recorded in `db.calls`
+with its start/end time and thread, so checks can assert on overlap,
+throughput and tail latency.
+"""
+import contextlib
+import math
+import random
+import re
+import sys
+import threading
+import time
+import types
+from typing import Any, Callable, Iterator, List, Optional, Sequence, Tuple
+
+Latency = Callable[[random.Random], float]
+
+
+# ---------------------------------------------------------------------------
+# Latency distributions (all in milliseconds, return seconds)
+# ---------------------------------------------------------------------------
+
+def constant(ms: float) -> Latency:
+    return lambda rng: ms / 1000.0
+
+
+def uniform(low_ms: float, high_ms: float) -> Latency:
+    return lambda rng: rng.uniform(low_ms, high_ms) / 1000.0
+
+
+def lognormal(median_ms: float, sigma: float = 0.5) -> Latency:
+    """Long right tail, like real query latency; `median_ms` is the p50."""
+    mu = math.log(median_ms)
+    return lambda rng: rng.lognormvariate(mu, sigma) / 1000.0
+
+
+def spikes(base: Latency, spike_ms: float, probability: float) -> Latency:
+    """`base`, but with `probability` of an extra `spike_ms` (lock waits, GC, failover)."""
+    return lambda rng: base(rng) + (spike_ms / 1000.0 if rng.random() < probability else 0.0)
+
+
+# ---------------------------------------------------------------------------
+# Exceptions shaped like the real drivers' (see shared_utils._sql_error_info)
+# ---------------------------------------------------------------------------
+
+class Error(Exception):
+    pass
+
+
+class DatabaseError(Error):
+    pass
+
+
+class InterfaceError(Error):
+    pass
+
+
+class OperationalError(DatabaseError):
+    pass
+
+
+class ProgrammingError(DatabaseError):
+    pass
+
+
+class IntegrityError(DatabaseError):
+    pass
+
+
+def transient_error() -> Exception:
+    return OperationalError("08S01", "[08S01] [Fake ODBC] Communication link failure (10054) (SQLExecDirectW)")
+
+
+def deadlock_error() -> Exception:
+    return DatabaseError(
+        "40001",
+        "[40001] [Fake ODBC] Transaction (Process ID 61) was deadlocked on lock resources "
+        "with another process and has been chosen as the deadlock victim. (1205) (SQLExecDirectW)"
+    )
+
+
+def timeout_error() -> Exception:
+    return OperationalError("HYT00", "[HYT00] [Fake ODBC] Query timeout expired (0) (SQLExecDirectW)")
+
+
+def programming_error(message: str = "Invalid object name") -> Exception:
+    return ProgrammingError("42S02", f"[42S02] [Fake ODBC] {message}. (208) (SQLExecDirectW)")
+
+
+# ---------------------------------------------------------------------------
+# Scripted database
+# ---------------------------------------------------------------------------
+
+class Row(tuple):
+    """Tuple with attribute access by column name, like pyodbc.Row."""
+
+    columns: Sequence[str] = ()
+
+    def __getattr__(self, name: str) -> Any:
+        try:
+            return self[list(self.columns).index(name)]
+        except ValueError:
+            raise AttributeError(name)
+
+
+class Rule:
+    def __init__(self, pattern: str, result_sets: Optional[List[List[Sequence[Any]]]], columns: Sequence[str],
+                 rowcount: Optional[int], handler: Optional[Callable[[str, tuple], Any]],
+                 latency: Optional[Latency], error: Any, error_rate: float, times: Optional[int]):
+        self.regex = re.compile(pattern, re.IGNORECASE)
+        self.result_sets = result_sets
+        self.columns = list(columns)
+        self.rowcount = rowcount
+        self.handler = handler
+        self.latency = latency
+        self.error = error
+        self.error_rate = error_rate
+        self.remaining = times
+        self.hits = 0
+
+
+class Call:
+    __slots__ = ("sql", "params", "started", "ended", "thread", "failed")
+
+    def __init__(self, sql: str, params: tuple, started: float, thread: str):
+        self.sql = sql
+        self.params = params
+        self.started = started
+        self.ended: Optional[float] = None
+        self.thread = thread
+        self.failed = False
+
+    @property
+    def duration(self) -> float:
+        return (self.ended or time.monotonic()) - self.started
+
+
+class FakeDatabase:
+    """Shared state behind every fake connection: rules, latency, limits, call log."""
+
+    def __init__(self, seed: int = 0, default_latency: Latency = constant(0),
+                 connect_latency: Latency = constant(0), max_connections: Optional[int] = None,
+                 pool_timeout: float = 15.0):
+        self.rng = random.Random(seed)
+        self.default_latency = default_latency
+        self.connect_latency = connect_latency
+        self.connect_error: Any = None
+        self.rules: List[Rule] = []
+        self.calls: List[Call] = []
+        self.commits = 0
+        self.rollbacks = 0
+        self.connections_opened = 0
+        self.active_connections = 0
+        self.max_active_connections = 0
+        self.active_executes = 0
+        self.max_active_executes = 0
+        self._lock = threading.Lock()
+        self._pool = threading.BoundedSemaphore(max_connections) if max_connections else None
+        self.pool_timeout = pool_timeout
+        self.pyodbc = self._module("pyodbc")
+        self.pymssql = self._module("pymssql")
+
+    # -- scripting ----------------------------------------------------------
+
+    def on(self, pattern: str, rows: Optional[List[Sequence[Any]]] = None, *,
+           result_sets: Optional[List[List[Sequence[Any]]]] = None, columns: Sequence[str] = (),
+           rowcount: Optional[int] = None, handler: Optional[Callable[[str, tuple], Any]] = None,
+           latency: Optional[Latency] = None, error: Any = None, error_rate: float = 1.0,
+           times: Optional[int] = None) -> Rule:
+        """Script the response to statements matching `pattern`.
+
+        rows / result_sets: what fetch*/nextset return; handler(sql, params)
+        may return either a list of rows (tuples) or a list of result sets
+        (lists of rows) and overrides them. error (exception or factory) is raised with
+        probability error_rate; times limits how often the rule matches.
+        """
+        if rows is not None and result_sets is None:
+            result_sets = [rows]
+        rule = Rule(pattern, result_sets, columns, rowcount, handler, latency, error,
+                    error_rate if error is not None else 0.0, times)
+        with self._lock:
+            self.rules.insert(0, rule)
+        return rule
+
+    def _match(self, sql: str) -> Optional[Rule]:
+        with self._lock:
+            for rule in self.rules:
+                if rule.remaining == 0 or not rule.regex.search(sql):
+                    continue
+                rule.hits += 1
+                if rule.remaining is not None:
+                    rule.remaining -= 1
+                return rule
+        return None
+
+    def _sample(self, latency: Latency) -> float:
+        with self._lock:
+            return latency(self.rng)
+
+    def _roll(self, probability: float) -> bool:
+        with self._lock:
+            return self.rng.random() < probability
+
+    @staticmethod
+    def _raise(error: Any) -> None:
+        raise error() if callable(error) and not isinstance(error, BaseException) else error
+
+    # -- connections --------------------------------------------------------
+
+    def connect(self, *args: Any, timeout: Optional[float] = None, login_timeout: Optional[float] = None,
+                **kwargs: Any) -> "Connection":
+        time.sleep(self._sample(self.connect_latency))
+        if self.connect_error is not None:
+            self._raise(self.connect_error)
+        if self._pool is not None:
+            wait = timeout or login_timeout or self.pool_timeout
+            if not self._pool.acquire(timeout=wait):
+                raise OperationalError("HYT00", "[HYT00] [Fake ODBC] Login timeout expired (0) (SQLDriverConnect)")
+        with self._lock:
+            self.connections_opened += 1
+            self.active_connections += 1
+            self.max_active_connections = max(self.max_active_connections, self.active_connections)
+        return Connection(self)
+
+    def _release(self) -> None:
+        with self._lock:
+            self.active_connections -= 1
+        if self._pool is not None:
+            self._pool.release()
+
+    # -- statements ---------------------------------------------------------
+
+    def _execute(self, sql: str, params: tuple) -> Tuple[List[List[Sequence[Any]]], Optional[int], List[str]]:
+        normalized = " ".join(sql.split())
+        rule = self._match(normalized)
+        call = Call(normalized, params, time.monotonic(), threading.current_thread().name)
+        with self._lock:
+            self.calls.append(call)
+            self.active_executes += 1
+            self.max_active_executes = max(self.max_active_executes, self.active_executes)
+        try:
+            time.sleep(self._sample(rule.latency if rule and rule.latency else self.default_latency))
+            if rule and rule.error is not None and self._roll(rule.error_rate):
+                call.failed = True
+                self._raise(rule.error)
+            if rule is None:
+                return [[]], None, []
+            result = rule.handler(normalized, params) if rule.handler else rule.result_sets
+            if result is None:
+                result = [[]]
+            elif result and not isinstance(result[0], list):
+                result = [result]
+            return result, rule.rowcount, rule.columns
+        finally:
+            call.ended = time.monotonic()
+            with self._lock:
+                self.active_executes -= 1
+
+    def calls_matching(self, pattern: str) -> List[Call]:
+        regex = re.compile(pattern, re.IGNORECASE)
+        return [c for c in self.calls if regex.search(c.sql)]
+
+    def reset_log(self) -> None:
+        with self._lock:
+            self.calls = []
+            self.commits = self.rollbacks = 0
+            self.connections_opened = 0
+            self.max_active_connections = self.active_connections
+            self.max_active_executes = self.active_executes
+
+    # -- installation -------------------------------------------------------
+
+    def _module(self, name: str) -> types.ModuleType:
+        module = types.ModuleType(name)
+        module.__doc__ = f"Fake {name} backed by benchmarks.fake_db.FakeDatabase"
+        for exc in (Error, DatabaseError, InterfaceError, OperationalError, ProgrammingError, IntegrityError):
+            setattr(module, exc.__name__, exc)
+        module.connect = self.connect
+        module.Row = Row
+        return module
+
+    @contextlib.contextmanager
+    def install(self) -> Iterator["FakeDatabase"]:
+        """Swap pyodbc / pymssql for this fake, in sys.modules and in already imported modules."""
+        fakes = {"pyodbc": self.pyodbc, "pymssql": self.pymssql}
+        saved_modules = {name: sys.modules.get(name) for name in fakes}
+        patched = []
+        sys.modules.update(fakes)
+        for module in list(sys.modules.values()):
+            for name, fake in fakes.items():
+                current = getattr(module, name, None)
+                if isinstance(current, types.ModuleType) and current is not fake and current.__name__ == name:
+                    setattr(module, name, fake)
+                    patched.append((module, name, current))
+        try:
+            yield self
+        finally:
+            for module, name, original in patched:
+                setattr(module, name, original)
+            for name, original in saved_modules.items():
+                if original is None:
+                    sys.modules.pop(name, None)
+                else:
+                    sys.modules[name] = original
+
+
+class Connection:
+    def __init__(self, db: FakeDatabase):
+        self._db = db
+        self.closed = False
+        self.autocommit = False
+        self.timeout = 0
+
+    def cursor(self, as_dict: bool = False) -> "Cursor":
+        return Cursor(self, as_dict=as_dict)
+
+    def execute(self, sql: str, *params: Any) -> "Cursor":
+        return self.cursor().execute(sql, *params)
+
+    def commit(self) -> None:
+        with self._db._lock:
+            self._db.commits += 1
+
+    def rollback(self) -> None:
+        with self._db._lock:
+            self._db.rollbacks += 1
+
+    def close(self) -> None:
+        if not self.closed:
+            self.closed = True
+            self._db._release()
+
+    def __enter__(self) -> "Connection":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        # pyodbc commits / rolls back here; it closes once the last reference
+        # goes away, which in this codebase is right after the with block.
+        if not self.autocommit:
+            self.rollback() if exc_type else self.commit()
+        self.close()
+
+
+class Cursor:
+    def __init__(self, connection: Connection, as_dict: bool = False):
+        self.connection = connection
+        self.as_dict = as_dict
+        self.fast_executemany = False
+        self.rowcount = -1
+        self.description = None
+        self._sets: List[List[Sequence[Any]]] = []
+        self._rows: List[Any] = []
+        self._columns: List[str] = []
+
+    def _load(self, rows: Sequence[Sequence[Any]]) -> None:
+        columns = self._columns
+        self.description = [(c, None, None, None, None, None, None) for c in columns] if columns else None
+        if self.as_dict:
+            self._rows = [dict(zip(columns, row)) for row in rows]
+        else:
+            self._rows = []
+            for row in rows:
+                r = Row(row)
+                r.columns = columns
+                self._rows.append(r)
+
+    def execute(self, sql: str, *params: Any) -> "Cursor":
+        if self.connection.closed:
+            raise ProgrammingError("08003", "Attempt to use a closed connection.")
+        if len(params) == 1 and isinstance(params[0], (tuple, list)):
+            params = tuple(params[0])
+        result_sets, rowcount, columns = self.connection._db._execute(sql, tuple(params))
+        self._columns = list(columns)
+        self._sets = list(result_sets[1:])
+        self._load(result_sets[0] if result_sets else [])
+        is_select = sql.lstrip().upper().startswith(("SELECT", "WITH"))
+        self.rowcount = rowcount if rowcount is not None else (len(self._rows) if is_select else 1)
+        return self
+
+    def executemany(self, sql: str, seq_of_params: Sequence[Sequence[Any]]) -> None:
+        for params in seq_of_params:
+            self.execute(sql, tuple(params))
+
+    def fetchone(self) -> Any:
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchmany(self, size: int = 1) -> List[Any]:
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
+
+    def fetchall(self) -> List[Any]:
+        rows, self._rows = self._rows, []
+        return rows
+
+    def nextset(self) -> bool:
+        if not self._sets:
+            self._rows = []
+            return False
+        self._load(self._sets.pop(0))
+        return True
+
+    def close(self) -> None:
+        self._rows = []
+
+    def __iter__(self):
+        while self._rows:
+            yield self._rows.pop(0)
+
+    def __enter__(self) -> "Cursor":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if not exc_type and not self.connection.autocommit:
+            self.connection.commit()
+        self.close()
+
@@ -0,0 +1,283 @@
+"""
+Round-trip checks of the negotiated response formats (shared_utils.payload_response).
+
+Calls the read handlers against the fake DB driver (fake_db.py) with rows
+holding datetimes with microseconds, Decimals, None and non-ASCII text, once
+with the default JSON response and once with `Accept: application/msgpack`,
+and asserts both decode to the same logical payload (MessagePack timestamps
+compared as the str() JSON sends). Also checks ?format=columnar decodes back
+to the row shape and that compressed bodies decompress to the same bytes.
+Needs the msgpack package; exits 1 when a check fails.
+
+    python benchmarks/response_roundtrip_checks.py
+    python benchmarks/response_roundtrip_checks.py -k gitter
+"""
+import argparse
+import datetime
+import gzip
+import json
+import logging
+import os
+import sys
+import traceback
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+import azure.functions as func
+import msgpack
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from fake_db import FakeDatabase  # noqa: E402
+
+CHECKS: List[Callable[[Dict[str, Callable]], None]] = []
+
+T0 = datetime.datetime(2026, 3, 29, 1, 59, 58, 123456)  # night of the DST switch, µs precision
+T1 = datetime.datetime(2026, 3, 29, 3, 0, 1)
+
+
+def check(fn: Callable[[Dict[str, Callable]], None]) -> Callable[[Dict[str, Callable]], None]:
+    CHECKS.append(fn)
+    return fn
+
+
+def fake_db() -> FakeDatabase:
+    db = FakeDatabase(seed=7)
+    db.on(r"FROM dbo\.part_status\s+WHERE part_id", rows=[("OK", "2", T0, T1, "Ľuboš", "GB-Ž1", 1, None)])
+    db.on(r"WHERE ps\.shipping_id", rows=[
+        (f"P{i}", "OK", "3", T0 + datetime.timedelta(seconds=i), T1, "bench", "GB-Ž1", "A1203", 101 + i % 2)
+        for i in range(12)
+    ])
+    db.on(r"SELECT part_id, \[melt\], \[part_type\]", rows=[(f"P{i}", "A1203", 101 + i % 2) for i in range(12)])
+    db.on(r"FULL OUTER JOIN", rows=[
+        ("P1", "Kovací linka", "OK", T0, "bench", "GB-Ž1", None, "OK", "zmena statusu", "A1203", "101"),
+        ("P1", "Tryskání", "NOK", T1, "bench", "GB-Ž1", 7, None, None, "A1203", "101"),
+    ])
+    db.on(r"furnace_temperature_report", rows=[
+        (1, "P1", "P1", "2213", Decimal("842.50"), 871.25, 858.3, 240, T0, 14400, 4.0, T0, T1,
+         Decimal("29.5"), 1.0, T0, None),
+    ])
+    db.on(r"sys\.tables", rows=[("ExportDbTeploty2213_20260329_u",)])
+    db.on(r"\[ExportDbTeploty2213_", rows=[
+        ((T0 + datetime.timedelta(seconds=10 * i)).strftime("%d.%m.%Y %H:%M:%S"), 840 + (i * 7) % 31)
+        for i in range(3600)
+    ])
+    db.on(r"GROUP BY part_id, shipping_id", rows=[
+        ("P0", "GB-Ž1", T0), ("P1", "GB-Ž1", T0), ("P2", "GB-Ž1", T0), ("P3", "GB-Ž1 ", T0),
+        ("P0", "GB-B", T1), ("P1", "GB-B", T1), ("P5", "GB-B", T1), ("P6", "GB-C", T1),
+    ])
+    db.on(r"WHERE melt = \? AND part_id|WHERE melt = \?\s+ORDER BY part_id", rows=[
+        (f"P{i:02d}", 101, str(i % 4 + 1), "OK", T0, "GB-Ž1", i % 2, None) for i in range(12)
+    ])
+    db.on(r"WHERE melt = \?\s+GROUP BY", rows=[(1, "OK", 3), (2, "OK", 3), (3, "OK", 3), (4, "OK", 3)])
+    db.on(r"THEN 1 ELSE 0 END", rows=[(1,)])
+    db.on(r"SELECT last_status, station_id, Control_check", rows=[("OK", "3", True, None)])
+    db.on(r"FROM dbo\.Control_Station", rows=[(15, "OK", T0, "Ľuboš"), (19, "nok", T1, None)])
+    return db
+
+
+def call(handler: Callable, params: Dict[str, str], headers: Dict[str, str] = None) -> func.HttpResponse:
+    response = handler(func.HttpRequest("GET", "/api/x", params=params, headers=headers or {}, body=b""))
+    assert response.status_code == 200, f"status {response.status_code}: {response.get_body()[:200]!r}"
+    return response
+
+
+def body_bytes(response: func.HttpResponse) -> bytes:
+    body = response.get_body()
+    return gzip.decompress(body) if response.headers.get("Content-Encoding") == "gzip" else body
+
+
+def as_json_types(value: Any) -> Any:
+    """Decoded MessagePack payload with timestamps rendered the way JSON sends them (str(datetime))."""
+    if isinstance(value, datetime.datetime):
+        return str(value.replace(tzinfo=None))
+    if isinstance(value, dict):
+        return {k: as_json_types(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [as_json_types(v) for v in value]
+    return value
+
+
+def assert_equivalent(handler: Callable, params: Dict[str, str]) -> None:
+    as_json = call(handler, params)
+    as_msgpack = call(handler, params, {"Accept": "application/msgpack"})
+    assert as_json.mimetype == "application/json", as_json.mimetype
+    assert as_msgpack.mimetype == "application/msgpack", as_msgpack.mimetype
+
+    from_json = json.loads(body_bytes(as_json))
+    from_msgpack = msgpack.unpackb(body_bytes(as_msgpack), timestamp=3)
+    assert as_json_types(from_msgpack) == from_json, "MessagePack and JSON payloads differ"
+    timestamps = [v for v in _leaves(from_msgpack) if isinstance(v, datetime.datetime)]
+    if any(isinstance(v, str) and v.startswith("2026-03-29 ") for v in _leaves(from_json)):
+        assert timestamps, "datetimes were not sent as MessagePack timestamps"
+        assert all(v.tzinfo is not None for v in timestamps)
+
+
+def _leaves(value: Any):
+    if isinstance(value, dict):
+        for v in value.values():
+            yield from _leaves(v)
+    elif isinstance(value, list):
+        for v in value:
+            yield from _leaves(v)
+    else:
+        yield value
+
+
+@check
+def read_status_equivalent(handlers: Dict[str, Callable]) -> None:
+    assert_equivalent(handlers["ReadStatus"], {"part_id": "P1"})
+
+
+@check
+def info_kontrol_equivalent(handlers: Dict[str, Callable]) -> None:
+    assert_equivalent(handlers["InfoKontrol"], {"part_id": "P1"})
+
+
+@check
+def gitter_equivalent(handlers: Dict[str, Callable]) -> None:
+    assert_equivalent(handlers["GetInfoGitter"], {"shipping_id": "GB-Ž1"})
+
+
+@check
+def gitter_columnar_equivalent(handlers: Dict[str, Callable]) -> None:
+    assert_equivalent(handlers["GetInfoGitter"], {"shipping_id": "GB-Ž1", "format": "columnar"})
+
+
+@check
+def info_status_and_furnace_equivalent(handlers: Dict[str, Callable]) -> None:
+    assert_equivalent(handlers["GetInfoStatus"], {"part_id": "P1"})
+    assert_equivalent(handlers["GetFurnaceReport"], {"part_id": "P1"})
+
+
+@check
+def furnace_curve_equivalent(handlers: Dict[str, Callable]) -> None:
+    for method in ("lttb", "minmax"):
+        params = {"part_id": "P1", "points": "200", "method": method}
+        assert_equivalent(handlers["GetFurnaceCurve"], params)
+        curve = json.loads(body_bytes(call(handlers["GetFurnaceCurve"], params)))
+        assert curve["source_points"] > curve["points"] and curve["points"] <= 200, curve["points"]
+        assert curve["timestamps"] == sorted(curve["timestamps"]), f"{method}: points out of order"
+
+
+@check
+def gitter_summary_only_matches_full(handlers: Dict[str, Callable]) -> None:
+    import gitter_summary
+
+    gitter_summary.forget("GB-Ž1")
+    from_db = json.loads(call(handlers["GetInfoGitter"], {"shipping_id": "GB-Ž1", "summary_only": "true"}).get_body())
+    full = json.loads(call(handlers["GetInfoGitter"], {"shipping_id": "GB-Ž1"}).get_body())
+    cached = json.loads(call(handlers["GetInfoGitter"], {"shipping_id": "GB-Ž1", "summary_only": "true"}).get_body())
+    assert from_db == cached == {"gitter_summary": full["gitter_summary"]}, (from_db, cached, full["gitter_summary"])
+
+
+@check
+def genealogy_hops(handlers: Dict[str, Callable]) -> None:
+    from shared_utils import notify_write
+
+    def reached(params: Dict[str, str]):
+        body = json.loads(body_bytes(call(handlers["GetGenealogy"], params)))
+        return ({p["part_id"]: p["distance"] for p in body["parts"]},
+                {b["shipping_id"]: b["distance"] for b in body["boxes"]})
+
+    assert_equivalent(handlers["GetGenealogy"], {"shipping_id": "GB-Ž1", "edges": "true"})
+    parts, boxes = reached({"shipping_id": "GB-Ž1", "hops": "3"})
+    assert boxes == {"GB-Ž1": 0, "GB-B": 2}, boxes
+    assert parts == {"P0": 1, "P1": 1, "P2": 1, "P3": 1, "P5": 3}, parts
+    notify_write("part", part_id="P6", station_id="2", status="OK", shipping_id="GB-B")
+    parts, boxes = reached({"part_id": "P6", "hops": "2"})
+    assert boxes == {"GB-C": 1}, boxes  # writes go to the test database, prod's graph stays
+    reached({"part_id": "P6", "db": "test"})
+    forged = {"last_status": "OK", "station_id": "1", "shipping_id": "GB-C",
+              "control_check": False, "quality_check": False}
+    # Scans the trigger ignores, or that keep the part in its box, add no edge
+    notify_write("part", part_id="P6", station_id="2", status="OK", shipping_id="GB-D",
+                 previous=dict(forged, last_status="DESTROYED"))
+    notify_write("part", part_id="P6", station_id="5", status="OK", shipping_id="GB-D",
+                 previous=dict(forged, station_id="4", quality_check=True))
+    notify_write("part", part_id="P6", station_id="2", status="OK", shipping_id="GB-B", previous=forged)
+    parts, boxes = reached({"part_id": "P6", "hops": "2", "db": "test"})
+    assert boxes == {"GB-C": 1, "GB-B": 1}, boxes
+    assert set(parts) == {"P6", "P0", "P1", "P5"}, parts
+    missing = handlers["GetGenealogy"](func.HttpRequest("GET", "/api/x", params={"shipping_id": "GB-X"}, body=b""))
+    assert missing.status_code == 404, missing.status_code
+
+
+@check
+def melt_recall_pages(handlers: Dict[str, Callable]) -> None:
+    assert_equivalent(handlers["GetMeltRecall"], {"melt": "A1203"})
+    first = json.loads(body_bytes(call(handlers["GetMeltRecall"], {"melt": "A1203", "limit": "5"})))
+    assert [p["part_id"] for p in first["parts"]] == ["P00", "P01", "P02", "P03", "P04"], first["parts"]
+    assert first["next_after"] == "P04" and first["total_parts"] == 12, (first["next_after"], first["total_parts"])
+    assert first["parts"][1]["station_name"] == "Test tvrdosti" and first["parts"][1]["control_check"] is True
+    rest = json.loads(body_bytes(call(handlers["GetMeltRecall"], {"melt": "A1203", "after": "P04"})))
+    assert "totals" not in rest and rest["next_after"] is None, rest.keys()
+
+
+@check
+def columnar_decodes_to_rows(handlers: Dict[str, Callable]) -> None:
+    rows = json.loads(call(handlers["GetInfoGitter"], {"shipping_id": "GB-Ž1"}).get_body())["gitter_history"]
+    table = json.loads(call(handlers["GetInfoGitter"], {"shipping_id": "GB-Ž1", "format": "columnar"})
+                       .get_body())["gitter_history"]
+    decoded = [
+        {
+            name: table["dictionaries"][name][cell] if name in table["dictionaries"] else cell
+            for name, cell in zip(table["columns"], row)
+        }
+        for row in table["rows"]
+    ]
+    assert decoded == rows, "columnar form does not decode to the row form"
+    assert "shipping_id" in table["dictionaries"], "constant shipping_id column was not dictionary-encoded"
+
+
+@check
+def compressed_bodies_match(handlers: Dict[str, Callable]) -> None:
+    import shared_utils
+
+    saved = shared_utils.RESPONSE_COMPRESSION_MIN_BYTES
+    shared_utils.RESPONSE_COMPRESSION_MIN_BYTES = 0
+    try:
+        for accept in ("application/json", "application/msgpack"):
+            plain = call(handlers["GetInfoGitter"], {"shipping_id": "GB-Ž1"}, {"Accept": accept})
+            packed = call(handlers["GetInfoGitter"], {"shipping_id": "GB-Ž1"},
+                          {"Accept": accept, "Accept-Encoding": "gzip"})
+            assert packed.headers.get("Content-Encoding") == "gzip", f"{accept}: not compressed"
+            assert gzip.decompress(packed.get_body()) == plain.get_body(), f"{accept}: bodies differ"
+    finally:
+        shared_utils.RESPONSE_COMPRESSION_MIN_BYTES = saved
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="JSON / MessagePack response round-trip checks.")
+    parser.add_argument("-k", dest="keyword", help="only run checks whose name contains this")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.CRITICAL)
+    os.environ["STATION_GATING_ENFORCED"] = "false"
+    selected = [fn for fn in CHECKS if not args.keyword or args.keyword in fn.__name__]
+
+    failed = 0
+    with fake_db().install():
+        import function_app
+
+        handlers = {f.get_function_name(): f.get_user_function() for f in function_app.app.get_functions()}
+        for fn in selected:
+            try:
+                fn(handlers)
+            except AssertionError as e:
+                failed += 1
+                print(f"FAIL  {fn.__name__}: {e}")
+            except Exception:
+                failed += 1
+                print(f"ERROR {fn.__name__}")
+                traceback.print_exc()
+            else:
+                print(f"ok    {fn.__name__}")
+    print(f"{len(selected) - failed} passed, {failed} failed")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""
+Seed a local SQL Server (e.g. the mcr.microsoft.com/mssql/server container) so
+the Functions can be benchmarked without Azure SQL.
+
+Creates Traceability and Traceability_TEST, applies database/*.sql to both and
+loads the synthetic data set from benchmarks/dataset.py. Uses the same
+AZURE_SQL_* variables as the app; for a local container set
+AZURE_SQL_TRUST_SERVER_CERTIFICATE=yes.
+
+    python benchmarks/seed_local_db.py --boxes 120 --reset
+"""
+import argparse
+import logging
+import os
+import re
+import sys
+from pathlib import Path
+from typing import List
+
+import pyodbc
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from shared_utils import get_connection_string  # noqa: E402
+import dataset  # noqa: E402
+
+DATABASE_DIR = Path(__file__).resolve().parent.parent / "database"
+DATABASES = ["Traceability", "Traceability_TEST"]
+
+# ddl first (tables + triggers), nfc table before its inserts; the rest follows sorted
+SCRIPT_ORDER = ["ddl trace.sql", "nfc_rfid_cards.sql", "insert_nfc_cards.sql"]
+
+# Columns / tables the app reads that are not part of the exported DDL
+STAND_IN_SCHEMA = [
+    """
+    IF COL_LENGTH('dbo.part_status', 'melt') IS NULL
+        ALTER TABLE dbo.part_status ADD
+            melt VARCHAR(20) NULL,
+            part_type VARCHAR(20) NULL,
+            Control_check BIT NULL,
+            Quality_check BIT NULL
+    """,
+    """
+    IF OBJECT_ID('dbo.Control_Station', 'U') IS NULL
+        CREATE TABLE dbo.Control_Station (
+            id INT IDENTITY(1,1) PRIMARY KEY,
+            station_id INT NOT NULL,
+            part_id VARCHAR(50) NOT NULL,
+            sample INT NULL,
+            check_timestamp DATETIME NULL,
+            shipping_id VARCHAR(50) NULL,
+            operator_id VARCHAR(100) NULL,
+            part_type INT NULL,
+            melt VARCHAR(20) NULL,
+            control_group_id INT NULL,
+            status VARCHAR(10) NULL
+        )
+    """,
+    """
+    IF OBJECT_ID('dbo.furnace_temperature_report', 'U') IS NULL
+        CREATE TABLE dbo.furnace_temperature_report (
+            id INT IDENTITY(1,1) PRIMARY KEY,
+            DMC VARCHAR(50) NULL,
+            PartID VARCHAR(50) NULL,
+            Furnace VARCHAR(20) NULL,
+            MinTemp FLOAT NULL,
+            MaxTemp FLOAT NULL,
+            AvgTemp FLOAT NULL,
+            MeasurementCount INT NULL,
+            InsertTime DATETIME NULL,
+            FurnaceTimeSeconds INT NULL,
+            FurnaceTimeHours FLOAT NULL,
+            TempStartTime DATETIME NULL,
+            TempEndTime DATETIME NULL,
+            TempDifference FLOAT NULL,
+            MeasurementsPerMinute FLOAT NULL,
+            created_timestamp DATETIME NOT NULL DEFAULT GETDATE(),
+            updated_timestamp DATETIME NULL
+        )
+    """,
+]
+
+DATA_TABLES = [
+    "traceability_log", "h_part_status", "part_status", "kovaci_linka_scans",
+    "Control_Station", "furnace_temperature_report", "idempotency_keys",
+]
+
+_GO = re.compile(r"^\s*GO\s*$", re.IGNORECASE | re.MULTILINE)
+_USE = re.compile(r"^\s*USE\s+\[?\w+\]?\s*;?\s*$", re.IGNORECASE | re.MULTILINE)
+
+
+def connection_string(database: str) -> str:
+    return get_connection_string().replace("Database=Traceability_TEST;", f"Database={database};")
+
+
+def read_script(path: Path) -> str:
+    raw = path.read_bytes()
+    if raw[:2] in (b"\xff\xfe", b"\xfe\xff"):
+        return raw.decode("utf-16")
+    return raw.decode("utf-8-sig")
+
+
+def script_batches(text: str) -> List[str]:
+    """Split a SSMS script on GO; USE lines are dropped (we pick the DB per connection)."""
+    batches = []
+    for batch in _GO.split(text):
+        batch = _USE.sub("", batch).strip()
+        if batch:
+            batches.append(batch)
+    return batches
+
+
+def ordered_scripts() -> List[Path]:
+    scripts = sorted(DATABASE_DIR.glob("*.sql"), key=lambda p: p.name)
+    first = [DATABASE_DIR / name for name in SCRIPT_ORDER if (DATABASE_DIR / name).exists()]
+    return first + [p for p in scripts if p not in first]
+
+
+def create_databases() -> None:
+    with pyodbc.connect(connection_string("master"), autocommit=True) as conn:
+        cursor = conn.cursor()
+        for name in DATABASES:
+            cursor.execute(f"IF DB_ID('{name}') IS NULL CREATE DATABASE [{name}]")
+
+
+def apply_scripts(conn) -> None:
+    cursor = conn.cursor()
+    for path in ordered_scripts():
+        failed = 0
+        for batch in script_batches(read_script(path)):
+            try:
+                cursor.execute(batch)
+                while cursor.nextset():
+                    pass
+            except pyodbc.Error as e:
+                # Objects that already exist, views over linked servers, ... — not fatal
+                failed += 1
+                logging.debug(f"{path.name}: batch skipped: {e}")
+        logging.info(f"Applied {path.name} ({failed} batches skipped)")
+    for statement in STAND_IN_SCHEMA:
+        cursor.execute(statement)
+
+
+def reset_data(conn) -> None:
+    cursor = conn.cursor()
+    for table in DATA_TABLES:
+        cursor.execute(f"IF OBJECT_ID('dbo.{table}', 'U') IS NOT NULL DELETE FROM dbo.{table}")
+
+
+def load_data(conn, box_count: int) -> int:
+    """Bulk-load the data set with triggers off so the rows land exactly as generated."""
+    cursor = conn.cursor()
+    cursor.fast_executemany = True
+    for table in ("traceability_log", "h_part_status", "part_status"):
+        cursor.execute(f"DISABLE TRIGGER ALL ON dbo.{table}")
+
+    part_rows, history_rows, control_rows, furnace_rows = [], [], [], []
+    for part in dataset.iter_parts(box_count):
+        part_rows.append((
+            part["part_id"], part["created"], dataset.BENCH_EMPLOYEE, part["station_id"],
+            part["last_status"], part["status_timestamp"], part["shipping_id"],
+            part["melt"], str(part["part_type"]), part["control_check"], part["quality_check"],
+        ))
+        for step in part["history"]:
+            history_rows.append((
+                part["part_id"], dataset.BENCH_EMPLOYEE, step["station_id"], step["status"],
+                step["status_timestamp"], step["shipping_id"],
+            ))
+        checked = (dataset.KKK_STATIONS if part["control_check"] else []) + \
+                  (dataset.QUALITY_STATIONS if part["quality_check"] else [])
+        for station_id in checked:
+            control_rows.append((
+                station_id, part["part_id"], 1, part["status_timestamp"], part["shipping_id"],
+                dataset.BENCH_EMPLOYEE, part["part_type"], part["melt"], "OK",
+            ))
+        if len(part["history"]) > 1:
+            start = part["history"][1]["status_timestamp"]
+            furnace_rows.append((
+                part["part_id"], part["part_id"], part["furnace"], 842.0, 871.5, 858.3, 240,
+                start, 14400, 4.0, start, start, 29.5, 1.0,
+            ))
+
+    try:
+        cursor.executemany(
+            """
+            INSERT INTO dbo.part_status (part_id, create_timestamp, employee_id, station_id, last_status,
+                status_timestamp, shipping_id, melt, part_type, Control_check, Quality_check)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            part_rows
+        )
+        for table in ("h_part_status", "traceability_log"):
+            cursor.executemany(
+                f"""
+                INSERT INTO dbo.{table} (part_id, employee_id, station_id, status, status_timestamp, shipping_id)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                history_rows
+            )
+        if control_rows:
+            cursor.executemany(
+                """
+                INSERT INTO dbo.Control_Station (station_id, part_id, sample, check_timestamp, shipping_id,
+                    operator_id, part_type, melt, status)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                control_rows
+            )
+        if furnace_rows:
+            cursor.executemany(
+                """
+                INSERT INTO dbo.furnace_temperature_report (DMC, PartID, Furnace, MinTemp, MaxTemp, AvgTemp,
+                    MeasurementCount, InsertTime, FurnaceTimeSeconds, FurnaceTimeHours, TempStartTime,
+                    TempEndTime, TempDifference, MeasurementsPerMinute)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                furnace_rows
+            )
+        cursor.executemany(
+            "INSERT INTO dbo.kovaci_linka_scans (gitter_id, employee_id, timestamp, position) VALUES (?, ?, ?, ?)",
+            [
+                (dataset.box_id(i), dataset.BENCH_EMPLOYEE, dataset.box_started_at(i), "A" if i % 2 == 0 else "B")
+                for i in range(box_count)
+            ]
+        )
+        conn.commit()
+    finally:
+        for table in ("traceability_log", "h_part_status", "part_status"):
+            cursor.execute(f"ENABLE TRIGGER ALL ON dbo.{table}")
+        conn.commit()
+
+    return len(part_rows)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Seed a local SQL Server for the route benchmarks.")
+    parser.add_argument("--boxes", type=int, default=dataset.DEFAULT_BOX_COUNT,
+                        help=f"gitterboxes to generate ({dataset.PARTS_PER_BOX} parts each)")
+    parser.add_argument("--reset", action="store_true", help="delete existing rows before loading")
+    parser.add_argument("--schema-only", action="store_true", help="apply the scripts, load no data")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO, format="%(message)s")
+
+    create_databases()
+    for database in DATABASES:
+        with pyodbc.connect(connection_string(database)) as conn:
+            conn.autocommit = True
+            apply_scripts(conn)
+            conn.autocommit = False
+            if args.schema_only:
+                continue
+            if args.reset:
+                reset_data(conn)
+                conn.commit()
+            count = load_data(conn, args.boxes)
+            logging.info(f"{database}: loaded {count} parts in {args.boxes} gitterboxes")
+
+
+if __name__ == "__main__":
+    main()
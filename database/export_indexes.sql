@@ -0,0 +1,15 @@
+-- Time-range indexes for the NDJSON export (Export.py, GET /api/export/{table})
+-- Indexy pro export podle časového rozsahu
+-- Database: Traceability_TEST (and Traceability)
+
+-- Key order = export order (status_timestamp, part_id), so a range is read
+-- in index order without a sort and the export can stop after a page.
+CREATE NONCLUSTERED INDEX [IX_traceability_log_status_timestamp]
+    ON [dbo].[traceability_log] ([status_timestamp] ASC, [part_id] ASC)
+    INCLUDE ([employee_id], [station_id], [status], [shipping_id]);
+GO
+
+CREATE NONCLUSTERED INDEX [IX_h_part_status_status_timestamp]
+    ON [dbo].[h_part_status] ([status_timestamp] ASC, [part_id] ASC)
+    INCLUDE ([employee_id], [station_id], [status], [shipping_id]);
+GO
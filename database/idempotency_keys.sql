@@ -0,0 +1,44 @@
+-- Dedup table for idempotent writers (CheckInsert / ProtocolPartInsert queues,
+-- ChangeStatus, ControlStationInsert, KovaciLinkaScan, ProtocolPartInsert HTTP)
+-- Deduplikační tabulka pro idempotentní zápisy (queue redelivery, HTTP retry)
+-- Database: Traceability_TEST
+
+SET ANSI_NULLS ON
+GO
+SET QUOTED_IDENTIFIER ON
+GO
+
+-- Key = queue message id or client-supplied Idempotency-Key header / body field,
+-- scoped by route: the same key sent to two endpoints is two different writes.
+-- Klíč = id zprávy z fronty nebo klientem dodaný Idempotency-Key, zvlášť pro každou route.
+-- idempotency_key leads the PK, so IngestStatus' lookup by tracking id alone is a seek.
+CREATE TABLE [dbo].[idempotency_keys] (
+    [idempotency_key] VARCHAR(100) NOT NULL,
+    [route] VARCHAR(50) NOT NULL,
+    [created_timestamp] DATETIME NOT NULL DEFAULT GETDATE(),
+    CONSTRAINT [PK_idempotency_keys] PRIMARY KEY CLUSTERED ([idempotency_key] ASC, [route] ASC)
+);
+GO
+
+-- Existing tables (PK on idempotency_key only): widen the key to (idempotency_key, route).
+-- ALTER TABLE [dbo].[idempotency_keys] DROP CONSTRAINT [PK_idempotency_keys];
+-- ALTER TABLE [dbo].[idempotency_keys] ADD CONSTRAINT [PK_idempotency_keys]
+--     PRIMARY KEY CLUSTERED ([idempotency_key] ASC, [route] ASC);
+-- GO
+
+CREATE NONCLUSTERED INDEX [IX_idempotency_keys_created] ON [dbo].[idempotency_keys] ([created_timestamp] ASC);
+GO
+
+-- Keys only need to outlive queue redelivery and client retry windows.
+-- Run daily (e.g. SQL Agent / elastic job) to keep the table compact.
+-- Klíče stačí držet po dobu možného opakování; spouštět denně.
+CREATE PROCEDURE [dbo].[purge_idempotency_keys]
+    @retention_days INT = 7
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    DELETE FROM [dbo].[idempotency_keys]
+    WHERE [created_timestamp] < DATEADD(DAY, -@retention_days, GETDATE());
+END
+GO
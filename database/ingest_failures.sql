@@ -0,0 +1,30 @@
+-- Terminal failures of async ingest writes (AsyncIngest.py), read by GET /api/IngestStatus
+-- Zápisy z async ingestu, které se nepodařilo aplikovat (validace, poison queue)
+-- Database: Traceability_TEST
+
+SET ANSI_NULLS ON
+GO
+SET QUOTED_IDENTIFIER ON
+GO
+
+-- Key = tracking id (= idempotency key of the queued write), first reason wins.
+CREATE TABLE [dbo].[ingest_failures] (
+    [tracking_id] VARCHAR(100) NOT NULL,
+    [route] VARCHAR(50) NULL,
+    [reason] NVARCHAR(1000) NOT NULL,
+    [failed_timestamp] DATETIME NOT NULL DEFAULT GETDATE(),
+    CONSTRAINT [PK_ingest_failures] PRIMARY KEY CLUSTERED ([tracking_id] ASC)
+);
+GO
+
+-- Same retention as dbo.idempotency_keys; run daily next to purge_idempotency_keys.
+CREATE PROCEDURE [dbo].[purge_ingest_failures]
+    @retention_days INT = 7
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    DELETE FROM [dbo].[ingest_failures]
+    WHERE [failed_timestamp] < DATEADD(DAY, -@retention_days, GETDATE());
+END
+GO
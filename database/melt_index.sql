@@ -0,0 +1,12 @@
+-- Melt index for the recall query (MeltRecall.py, GET /api/MeltRecall)
+-- Index pro dohledání všech dílů jedné tavby (odchylka materiálového listu)
+-- Database: Traceability_TEST (and Traceability)
+
+-- Key (melt, part_id) = recall page order, so a page is one range seek that
+-- continues after the previous page's last part_id. The INCLUDE columns cover
+-- the whole response, no lookups into the clustered index.
+CREATE NONCLUSTERED INDEX [IX_part_status_melt]
+    ON [dbo].[part_status] ([melt] ASC, [part_id] ASC)
+    INCLUDE ([part_type], [station_id], [last_status], [status_timestamp], [shipping_id],
+             [Control_check], [Quality_check]);
+GO
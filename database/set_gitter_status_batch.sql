@@ -0,0 +1,79 @@
+-- Batch variant of set_gitter_status: several gitterboxes, one station and
+-- status transition, one transaction. Returns affected part count per box.
+-- Dávková varianta set_gitter_status: více gitterboxů v jedné transakci,
+-- vrací počet změněných dílů pro každý gitterbox.
+-- Database: Traceability_TEST
+
+SET ANSI_NULLS ON
+GO
+SET QUOTED_IDENTIFIER ON
+GO
+
+-- set_gitter_status filters part_status by (station_id, shipping_id); without
+-- this index every call scans part_status.
+-- Bez indexu každé volání prochází celou part_status.
+CREATE NONCLUSTERED INDEX [IX_part_status_shipping_station]
+    ON [dbo].[part_status] ([shipping_id] ASC, [station_id] ASC);
+GO
+
+CREATE PROCEDURE [dbo].[set_gitter_status_batch]
+    @station_id VARCHAR(100),
+    @status VARCHAR(20),
+    @status_timestamp DATETIME,
+    @shipping_ids NVARCHAR(MAX),      -- JSON array, e.g. '["GB001","GB002"]'
+    @current_workspace_id INT,
+    @employee_id VARCHAR(100) = NULL
+AS
+BEGIN
+    SET NOCOUNT ON;
+    SET XACT_ABORT ON;
+
+    -- Same employee convention as set_gitter_status
+    -- Stejná konvence employee_id jako v set_gitter_status
+    DECLARE @actual_employee_id VARCHAR(100) =
+        CASE
+            WHEN @employee_id IS NOT NULL AND LEN(LTRIM(RTRIM(@employee_id))) > 0
+                THEN @employee_id + '_virtual'
+            ELSE 'virtual'
+        END;
+
+    DECLARE @boxes TABLE (shipping_id VARCHAR(50) PRIMARY KEY);
+    INSERT INTO @boxes (shipping_id)
+    SELECT DISTINCT LTRIM(RTRIM(j.[value]))
+    FROM OPENJSON(@shipping_ids) j
+    WHERE LEN(LTRIM(RTRIM(j.[value]))) > 0;
+
+    -- OUTPUT ... INTO a table variable is allowed on a table with triggers
+    DECLARE @affected TABLE (shipping_id VARCHAR(50));
+
+    BEGIN TRANSACTION;
+
+    INSERT INTO traceability_log (
+        part_id,
+        employee_id,
+        station_id,
+        [status],
+        status_timestamp,
+        shipping_id
+    )
+    OUTPUT inserted.shipping_id INTO @affected (shipping_id)
+    SELECT
+        ps.part_id,
+        @actual_employee_id AS employee_id,
+        @current_workspace_id AS station_id,
+        @status AS [status],
+        @status_timestamp AS status_timestamp,
+        ps.shipping_id
+    FROM dbo.part_status ps
+    JOIN @boxes b ON b.shipping_id = ps.shipping_id
+    WHERE ps.station_id = @station_id;
+
+    COMMIT TRANSACTION;
+
+    SELECT b.shipping_id, COUNT(a.shipping_id) AS affected_parts
+    FROM @boxes b
+    LEFT JOIN @affected a ON a.shipping_id = b.shipping_id
+    GROUP BY b.shipping_id
+    ORDER BY b.shipping_id;
+END
+GO
@@ -0,0 +1,42 @@
+-- Hourly throughput per station for the production dashboard
+-- (StationRollup.py timer, GET /api/ProductionDashboard)
+-- Hodinové souhrny průchodu dílů po stanicích
+-- Database: Traceability_TEST. Production (Traceability) only when it is added to
+-- STATION_ROLLUP_DATABASES: that is new DDL in prod and the app login needs
+-- INSERT / UPDATE / DELETE on station_hourly_rollup and rollup_watermarks there,
+-- while the rest of the app only reads production.
+
+SET ANSI_NULLS ON
+GO
+SET QUOTED_IDENTIFIER ON
+GO
+
+-- One row per hour x station x status x source table.
+-- scan_count = rows, part_count = distinct parts within the hour.
+-- source: 'traceability_log' (scans) or 'Control_Station' (KKK / quality checks)
+CREATE TABLE [dbo].[station_hourly_rollup] (
+    [hour_start] DATETIME NOT NULL,
+    [source] VARCHAR(30) NOT NULL,
+    [station_id] VARCHAR(100) NOT NULL,
+    [status] VARCHAR(20) NOT NULL,
+    [scan_count] INT NOT NULL,
+    [part_count] INT NOT NULL,
+    [updated_timestamp] DATETIME NOT NULL DEFAULT GETDATE(),
+    CONSTRAINT [PK_station_hourly_rollup] PRIMARY KEY CLUSTERED ([hour_start] ASC, [source] ASC, [station_id] ASC, [status] ASC)
+);
+GO
+
+-- Recompute progress per source table (StationRollup.py).
+CREATE TABLE [dbo].[rollup_watermarks] (
+    [name] VARCHAR(50) NOT NULL,
+    [watermark] DATETIME NOT NULL,
+    [updated_timestamp] DATETIME NOT NULL DEFAULT GETDATE(),
+    CONSTRAINT [PK_rollup_watermarks] PRIMARY KEY CLUSTERED ([name] ASC)
+);
+GO
+
+-- traceability_log is covered by IX_traceability_log_status_timestamp (export_indexes.sql).
+CREATE NONCLUSTERED INDEX [IX_Control_Station_check_timestamp]
+    ON [dbo].[Control_Station] ([check_timestamp] ASC)
+    INCLUDE ([station_id], [status], [part_id]);
+GO
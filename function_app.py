@@ -14,9 +14,21 @@ from CheckInsert import bp as check_insert_bp
 from AuthenticateCard import bp as authenticate_card_bp
 from InfoRezim2 import bp as info_rezim2_bp
 from FurnaceReport import bp as furnace_report_bp
+from FurnaceCurve import bp as furnace_curve_bp
 from RqtReport import bp as rqt_report_bp
 from ControlStationInsert import bp as control_station_insert_bp
 from InfoKontrol import bp as info_kontrol_bp
+from AsyncIngest import bp as async_ingest_bp
+from CanEnter import bp as can_enter_bp
+from Diagnostics import bp as diagnostics_bp
+from Export import bp as export_bp
+from AnalyticsExport import bp as analytics_export_bp
+from StationRollup import bp as station_rollup_bp
+from ProductionDashboard import bp as production_dashboard_bp
+from WipCounters import bp as wip_counters_bp
+from PartGenealogy import bp as part_genealogy_bp
+from MeltRecall import bp as melt_recall_bp
+from PartDossier import bp as part_dossier_bp
 
 app = func.FunctionApp()
 
@@ -32,9 +44,21 @@ app.register_functions(check_insert_bp)         # Queue trigger (operations-log-
 app.register_functions(authenticate_card_bp)    # GET/POST /api/AuthenticateCard
 app.register_functions(info_rezim2_bp)          # GET /api/InfoRezim2
 app.register_functions(furnace_report_bp)       # GET /api/FurnaceReport
+app.register_functions(furnace_curve_bp)        # GET /api/FurnaceCurve (downsampled temperature curve)
 app.register_functions(rqt_report_bp)           # GET /api/RqtReport
 app.register_functions(control_station_insert_bp)  # POST /api/ControlStationInsert
 app.register_functions(info_kontrol_bp)             # GET /api/InfoKontrol
+app.register_functions(async_ingest_bp)             # Queue triggers (scan-ingest-test + -poison) + GET /api/IngestStatus
+app.register_functions(can_enter_bp)                # GET /api/CanEnter
+app.register_functions(diagnostics_bp)              # GET /api/_diag (function key)
+app.register_functions(export_bp)                   # GET /api/export/{traceability_log|h_part_status} (NDJSON)
+app.register_functions(analytics_export_bp)         # Timer (hourly): Parquet export for analytics
+app.register_functions(station_rollup_bp)           # Timer (5 min): hourly station throughput rollups
+app.register_functions(production_dashboard_bp)     # GET /api/ProductionDashboard
+app.register_functions(wip_counters_bp)             # GET /api/WipCounters (in-memory)
+app.register_functions(part_genealogy_bp)           # GET /api/Genealogy (in-memory part/gitterbox graph)
+app.register_functions(melt_recall_bp)             # GET /api/MeltRecall (paged by part_id)
+app.register_functions(part_dossier_bp)            # GET /api/PartDossier (all part sources concurrently)
 
 # Simple test function
 @app.function_name(name="TestFunction")
@@ -0,0 +1,393 @@
+"""
+Build furnace_temperature_report rows from raw furnace exports.
+Výpočet reportu pecí z exportů ExportDbTeploty<pec>_<datum>_u.
+
+The exports hold one row per sample (ParameterDefinitionID, Value smallint,
+TS nvarchar). They are loaded into NumPy arrays, TS is parsed in one
+vectorized pass, and every part's furnace window (its scan at the furnace's
+entry station, until its next scan) is aggregated with searchsorted +
+cumulative sums, min/max once per distinct window (parts of one furnace batch
+share it). Report rows are upserted with fast_executemany.
+
+FURNACE_ENTRY_STATIONS maps each furnace to the station its parts are scanned
+at before it ("2213=1,2214=21"); a furnace that is not mapped, or shares its
+station with another furnace, is refused, since its windows could not be told
+apart from the other furnace's. A window that runs past the first or last
+sample of the export is aggregated from every export covering it
+(load_window_samples) and only when those cover it whole
+(FURNACE_COVERAGE_GAP_SECONDS at either end); otherwise it is left for the
+ingest of the adjacent export, which then overwrites the row.
+
+    python furnace_ingest.py ExportDbTeploty2213_20250514_u [--dry-run]
+
+benchmarks/bench_furnace_ingest.py measures rows/s on synthetic exports.
+"""
+import argparse
+import datetime
+import logging
+import os
+import re
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from shared_utils import get_connection_string, db_connect
+
+# Parts go to a furnace from its entry station; the window ends at their next scan (Test tvrdosti)
+# furnace -> station its parts are scanned at before entering it, "2213=1,2214=21"
+FURNACE_ENTRY_STATIONS = {
+    furnace.strip(): station.strip()
+    for furnace, _, station in (
+        pair.partition("=") for pair in os.getenv("FURNACE_ENTRY_STATIONS", "").split(",") if pair.strip()
+    )
+}
+# A window counts as covered when there are samples this close to its start and end
+FURNACE_COVERAGE_GAP_SECONDS = int(os.getenv("FURNACE_COVERAGE_GAP_SECONDS", "300"))
+# Temperature parameters of the export; empty = every sample is a temperature
+FURNACE_TEMPERATURE_PARAMETERS = [
+    p.strip() for p in os.getenv("FURNACE_TEMPERATURE_PARAMETERS", "").split(",") if p.strip()
+]
+# Exports are dumped after the run; how many days after the window to look for them
+FURNACE_EXPORT_MAX_LAG_DAYS = int(os.getenv("FURNACE_EXPORT_MAX_LAG_DAYS", "7"))
+FETCH_ROWS = 50000
+
+_EXPORT_TABLE = re.compile(r"^ExportDbTeploty(\d+)_\w+$")
+_EXPORT_DATE = re.compile(r"^ExportDbTeploty\d+_(\d{8})")
+# TS as datetime2 on the server: yyyy-mm-dd hh:mi:ss, ISO 8601 with T, dd.mm.yyyy hh:mi:ss
+_TS_SQL = "COALESCE(TRY_CONVERT(datetime2, [TS], 120), TRY_CONVERT(datetime2, [TS], 126), TRY_CONVERT(datetime2, [TS], 104))"
+
+# dd.mm.yyyy HH:MM:SS -> yyyy-mm-ddTHH:MM:SS, as byte positions into the source
+_CZ_TO_ISO = [6, 7, 8, 9, 2, 3, 4, 2, 0, 1, 10, 11, 12, 13, 14, 15, 16, 17, 18]
+
+
+def furnace_of(table: str) -> str:
+    match = _EXPORT_TABLE.match(table)
+    if not match:
+        raise ValueError(f"{table} is not an ExportDbTeploty<furnace>_... table")
+    return match.group(1)
+
+
+def entry_station_of(furnace: str) -> str:
+    """Station whose scans start the windows of `furnace`; ValueError when that is ambiguous."""
+    station = FURNACE_ENTRY_STATIONS.get(furnace)
+    if not station:
+        raise ValueError(f"Furnace {furnace} has no entry station, set FURNACE_ENTRY_STATIONS ({furnace}=<station_id>)")
+    shared = sorted(f for f, s in FURNACE_ENTRY_STATIONS.items() if s == station and f != furnace)
+    if shared:
+        raise ValueError(
+            f"Furnace {furnace} shares entry station {station} with {', '.join(shared)}, "
+            "its parts cannot be told apart"
+        )
+    return station
+
+
+def parse_timestamps(values: Sequence[str]) -> np.ndarray:
+    """TS strings -> datetime64[ms]; ISO 8601 (T or space) or dd.mm.yyyy HH:MM:SS."""
+    # Byte strings: several times faster to build and to convert than str arrays
+    raw = np.char.strip(np.asarray(values, dtype="S"))
+    if raw.size == 0:
+        return raw.astype("datetime64[ms]")
+    width = raw.dtype.itemsize
+    sample = raw[0]
+    if width >= 19 and sample[2:3] == b"." and sample[5:6] == b".":
+        # Re-order the bytes of all rows at once instead of strptime per row
+        matrix = raw.view(np.uint8).reshape(-1, width).copy()
+        matrix[:, :19] = matrix[:, _CZ_TO_ISO]
+        matrix[:, [4, 7]] = ord("-")
+        matrix[:, 10] = ord("T")
+        raw = matrix.view(f"S{width}").ravel()
+    return raw.astype("datetime64[ms]")
+
+
+def export_tables(conn_str: str, furnace: str, start: datetime.date, end: datetime.date,
+                  database: Optional[str] = None) -> List[str]:
+    """Export tables of `furnace` whose date suffix falls in [start, end + FURNACE_EXPORT_MAX_LAG_DAYS]."""
+    prefix = f"[{database}]." if database else ""
+    with db_connect(conn_str) as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            f"SELECT name FROM {prefix}sys.tables WHERE name LIKE ? ORDER BY name",
+            (f"ExportDbTeploty{furnace}[_]%",)
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    last = end + datetime.timedelta(days=FURNACE_EXPORT_MAX_LAG_DAYS)
+    tables = []
+    for name in names:
+        match = _EXPORT_DATE.match(name)
+        if match and furnace_of(name) == furnace:
+            exported = datetime.datetime.strptime(match.group(1), "%Y%m%d").date()
+            if start <= exported <= last:
+                tables.append(name)
+    return tables
+
+
+def load_samples(conn_str: str, table: str, start: Optional[datetime.datetime] = None,
+                 end: Optional[datetime.datetime] = None,
+                 database: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """(timestamps datetime64[ms], values float64) of the temperature samples, sorted by time.
+
+    With start/end only samples with start <= TS <= end (TS converted on the server).
+    """
+    furnace_of(table)  # validates the name before it goes into SQL
+    prefix = f"[{database}]." if database else ""
+    query = f"SELECT [TS], [Value] FROM {prefix}[dbo].[{table}] WHERE [TS] IS NOT NULL AND [Value] IS NOT NULL"
+    params: List[Any] = []
+    if FURNACE_TEMPERATURE_PARAMETERS:
+        query += f" AND [ParameterDefinitionID] IN ({', '.join('?' * len(FURNACE_TEMPERATURE_PARAMETERS))})"
+        params = list(FURNACE_TEMPERATURE_PARAMETERS)
+    if start is not None and end is not None:
+        query += f" AND {_TS_SQL} BETWEEN ? AND ?"
+        params += [start, end]
+
+    ts_chunks, value_chunks = [], []
+    with db_connect(conn_str) as conn:
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(FETCH_ROWS)
+            if not rows:
+                break
+            ts_chunks.append(parse_timestamps([r[0] for r in rows]))
+            value_chunks.append(np.fromiter((r[1] for r in rows), dtype=np.float64, count=len(rows)))
+        cursor.close()
+    if not ts_chunks:
+        return np.array([], dtype="datetime64[ms]"), np.array([], dtype=np.float64)
+    return sort_samples(np.concatenate(ts_chunks), np.concatenate(value_chunks))
+
+
+def sort_samples(timestamps: np.ndarray, values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    if timestamps.size > 1 and not np.all(timestamps[1:] >= timestamps[:-1]):
+        order = np.argsort(timestamps, kind="stable")
+        return timestamps[order], values[order]
+    return timestamps, values
+
+
+def load_windows(conn_str: str, station_id: str, start: np.datetime64,
+                 end: np.datetime64) -> List[Tuple[str, datetime.datetime, datetime.datetime]]:
+    """(part_id, entered, left) of windows starting at `station_id` that overlap [start, end]."""
+    with db_connect(conn_str) as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            SELECT part_id, status_timestamp, left_timestamp
+            FROM (
+                SELECT part_id, station_id, status_timestamp,
+                       LEAD(status_timestamp) OVER (PARTITION BY part_id ORDER BY status_timestamp) AS left_timestamp
+                FROM dbo.h_part_status
+                WHERE status_timestamp >= DATEADD(DAY, -2, ?) AND status_timestamp <= DATEADD(DAY, 2, ?)
+            ) h
+            WHERE station_id = ? AND left_timestamp IS NOT NULL
+              AND status_timestamp <= ? AND left_timestamp >= ?
+            """,
+            (start.item(), end.item(), station_id, end.item(), start.item())
+        )
+        rows = cursor.fetchall()
+    return [(row[0], row[1], row[2]) for row in rows]
+
+
+def load_part_window(conn_str: str, furnace: str, part_id: str,
+                     database: Optional[str] = None) -> Optional[Tuple[datetime.datetime, Optional[datetime.datetime]]]:
+    """(entered, left) of the part's last window in `furnace`; left is None while it is still in the furnace.
+
+    ValueError when the furnace has no unambiguous entry station (entry_station_of).
+    """
+    station_id = entry_station_of(furnace)
+    prefix = f"[{database}]." if database else ""
+    with db_connect(conn_str) as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            f"""
+            SELECT TOP 1 status_timestamp, left_timestamp
+            FROM (
+                SELECT station_id, status_timestamp,
+                       LEAD(status_timestamp) OVER (ORDER BY status_timestamp) AS left_timestamp
+                FROM {prefix}dbo.h_part_status
+                WHERE part_id = ?
+            ) h
+            WHERE station_id = ?
+            ORDER BY status_timestamp DESC
+            """,
+            (part_id, station_id)
+        )
+        row = cursor.fetchone()
+    return (row[0], row[1]) if row else None
+
+
+def load_window_samples(conn_str: str, furnace: str, start: datetime.datetime, end: datetime.datetime,
+                        database: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Samples of `furnace` within [start, end] from every export covering it, duplicates dropped."""
+    ts_parts, value_parts = [], []
+    for table in export_tables(conn_str, furnace, start.date(), end.date(), database):
+        timestamps, values = load_samples(conn_str, table, start, end, database)
+        ts_parts.append(timestamps)
+        value_parts.append(values)
+    if not ts_parts:
+        return np.array([], dtype="datetime64[ms]"), np.array([], dtype=np.float64)
+    timestamps, values = sort_samples(np.concatenate(ts_parts), np.concatenate(value_parts))
+    if len(ts_parts) > 1:
+        # Overlapping exports repeat samples
+        keep = np.concatenate(([True], timestamps[1:] != timestamps[:-1]))
+        timestamps, values = timestamps[keep], values[keep]
+    return timestamps, values
+
+
+def aggregate_windows(timestamps: np.ndarray, values: np.ndarray,
+                      starts: np.ndarray, ends: np.ndarray) -> Dict[str, np.ndarray]:
+    """Per-window stats over time-sorted samples; windows are inclusive [start, end]."""
+    lo = np.searchsorted(timestamps, starts, side="left")
+    hi = np.searchsorted(timestamps, ends, side="right")
+    counts = hi - lo
+    cumulative = np.concatenate(([0.0], np.cumsum(values, dtype=np.float64)))
+    sums = cumulative[hi] - cumulative[lo]
+
+    mins = np.full(len(starts), np.nan)
+    maxs = np.full(len(starts), np.nan)
+    # Parts of one batch share a window: reduce each distinct (lo, hi) once.
+    bounds, inverse = np.unique(np.stack([lo, hi], axis=1), axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    window_min = np.full(len(bounds), np.nan)
+    window_max = np.full(len(bounds), np.nan)
+    for n, (a, b) in enumerate(bounds):
+        if b > a:
+            window_min[n] = values[a:b].min()
+            window_max[n] = values[a:b].max()
+    mins[:] = window_min[inverse]
+    maxs[:] = window_max[inverse]
+
+    has = counts > 0
+    first_ts = np.where(has, timestamps[np.minimum(lo, len(timestamps) - 1)], np.datetime64("NaT"))
+    last_ts = np.where(has, timestamps[np.maximum(hi - 1, 0)], np.datetime64("NaT"))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        averages = np.where(has, sums / np.maximum(counts, 1), np.nan)
+        span_minutes = (last_ts - first_ts) / np.timedelta64(1, "m")
+        per_minute = np.where(span_minutes > 0, counts / span_minutes, np.nan)
+    return {
+        "count": counts, "min": mins, "max": maxs, "avg": averages,
+        "first": first_ts, "last": last_ts, "per_minute": per_minute,
+    }
+
+
+def build_report_rows(furnace: str, windows: Sequence[Tuple[str, Any, Any]],
+                      stats: Dict[str, np.ndarray], now: datetime.datetime) -> List[tuple]:
+    """furnace_temperature_report rows (column order of upsert_report_rows) for windows with samples.
+
+    DMC is left NULL: the exports and h_part_status only know the part id.
+    """
+    rows = []
+    for i, (part_id, entered, left) in enumerate(windows):
+        count = int(stats["count"][i])
+        if not count:
+            continue
+        seconds = int((left - entered).total_seconds())
+        minimum, maximum = float(stats["min"][i]), float(stats["max"][i])
+        per_minute = stats["per_minute"][i]
+        rows.append((
+            None, part_id, furnace, minimum, maximum, round(float(stats["avg"][i]), 2), count, now,
+            seconds, round(seconds / 3600, 2),
+            stats["first"][i].astype("datetime64[ms]").item(), stats["last"][i].astype("datetime64[ms]").item(),
+            maximum - minimum, None if np.isnan(per_minute) else round(float(per_minute), 3),
+        ))
+    return rows
+
+
+def upsert_report_rows(conn_str: str, furnace: str, rows: List[tuple]) -> Tuple[int, int]:
+    """Bulk insert new parts, overwrite the report row of parts already reported for this furnace.
+
+    Returns (inserted, updated).
+    """
+    if not rows:
+        return 0, 0
+    with db_connect(conn_str) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT PartID FROM dbo.furnace_temperature_report WHERE Furnace = ?", (furnace,))
+        existing = {r[0] for r in cursor.fetchall()}
+        new_rows = [row for row in rows if row[1] not in existing]
+        # Same columns without DMC (an existing row keeps its own), then the key: PartID, Furnace
+        changed = [row[3:] + (row[1], row[2]) for row in rows if row[1] in existing]
+        cursor.fast_executemany = True
+        if new_rows:
+            cursor.executemany(
+                """
+                INSERT INTO dbo.furnace_temperature_report (DMC, PartID, Furnace, MinTemp, MaxTemp, AvgTemp,
+                    MeasurementCount, InsertTime, FurnaceTimeSeconds, FurnaceTimeHours, TempStartTime,
+                    TempEndTime, TempDifference, MeasurementsPerMinute)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                new_rows
+            )
+        if changed:
+            cursor.executemany(
+                """
+                UPDATE dbo.furnace_temperature_report
+                SET MinTemp = ?, MaxTemp = ?, AvgTemp = ?, MeasurementCount = ?, InsertTime = ?,
+                    FurnaceTimeSeconds = ?, FurnaceTimeHours = ?, TempStartTime = ?, TempEndTime = ?,
+                    TempDifference = ?, MeasurementsPerMinute = ?, updated_timestamp = GETDATE()
+                WHERE PartID = ? AND Furnace = ?
+                """,
+                changed
+            )
+        conn.commit()
+    return len(new_rows), len(changed)
+
+
+def covered(stats: Dict[str, np.ndarray], starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Windows whose samples reach within FURNACE_COVERAGE_GAP_SECONDS of both ends."""
+    gap = np.timedelta64(FURNACE_COVERAGE_GAP_SECONDS, "s")
+    with np.errstate(invalid="ignore"):
+        return (stats["count"] > 0) & (stats["first"] <= starts + gap) & (stats["last"] >= ends - gap)
+
+
+def ingest_export(conn_str: str, table: str, dry_run: bool = False) -> Dict[str, int]:
+    furnace = furnace_of(table)
+    station_id = entry_station_of(furnace)
+    timestamps, values = load_samples(conn_str, table)
+    if not timestamps.size:
+        return {"samples": 0, "windows": 0, "partial": 0, "rows": 0, "inserted": 0, "updated": 0}
+    windows = load_windows(conn_str, station_id, timestamps[0], timestamps[-1])
+    starts = np.array([w[1] for w in windows], dtype="datetime64[ms]")
+    ends = np.array([w[2] for w in windows], dtype="datetime64[ms]")
+    stats = aggregate_windows(timestamps, values, starts, ends)
+
+    # Windows running past this export's samples: aggregate them over all exports covering them
+    inside = (starts >= timestamps[0]) & (ends <= timestamps[-1])
+    keep = inside.copy()
+    crossing = np.flatnonzero(~inside)
+    if crossing.size:
+        bounds, inverse = np.unique(np.stack([starts[crossing], ends[crossing]], axis=1), axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+        for n, (start, end) in enumerate(bounds):
+            members = crossing[inverse == n]
+            window_ts, window_values = load_window_samples(
+                conn_str, furnace, start.astype("datetime64[ms]").item(), end.astype("datetime64[ms]").item()
+            )
+            window_stats = aggregate_windows(window_ts, window_values, starts[members], ends[members])
+            if not covered(window_stats, starts[members], ends[members]).all():
+                continue
+            for key in stats:
+                stats[key][members] = window_stats[key]
+            keep[members] = True
+
+    kept = [w for w, k in zip(windows, keep) if k]
+    stats = {key: column[keep] for key, column in stats.items()}
+    rows = build_report_rows(furnace, kept, stats, datetime.datetime.now())
+    inserted, updated = (0, 0) if dry_run else upsert_report_rows(conn_str, furnace, rows)
+    return {
+        "samples": int(timestamps.size), "windows": len(windows), "partial": len(windows) - len(kept),
+        "rows": len(rows), "inserted": inserted, "updated": updated,
+    }
+
+
+def main(argv: Optional[Iterable[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Build furnace_temperature_report rows from ExportDbTeploty tables.")
+    parser.add_argument("tables", nargs="+", help="e.g. ExportDbTeploty2213_20250514_u")
+    parser.add_argument("--dry-run", action="store_true", help="compute, don't insert")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    conn_str = get_connection_string()
+    for table in args.tables:
+        logging.info(f"{table}: {ingest_export(conn_str, table, args.dry_run)}")
+
+
+if __name__ == "__main__":
+    main()
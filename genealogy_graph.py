@@ -0,0 +1,220 @@
+"""
+In-memory part <-> gitterbox graph built from h_part_status, for N-hop traversal.
+
+Every (part_id, shipping_id) pair ever recorded is one edge. Ids are interned
+to ints and adjacency holds ints only: about 400 bytes per part that went
+through three boxes (300k parts ~ 120 MB), a 3-hop query from a box of 40
+parts takes a few ms. The first request of a worker loads the
+graph, later requests refresh it in the background from a status_timestamp
+watermark (minus GENEALOGY_OVERLAP_MINUTES for late scans) once it is older
+than GENEALOGY_REFRESH_SECONDS. The app's own writes add their edge at once
+when the trigger accepts the scan and moves the part to its box (checked like
+gitter_summary); writes without the state they were gated on only make the
+graph due for a refresh.
+Removing edges is never needed: history only grows.
+"""
+import datetime
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from shared_utils import DB_EXECUTOR, add_write_listener, db_connect, get_connection_string, call_with_resilience
+from station_rules import STATION_RULES, evaluate_entry, keeps_shipping_id
+
+GENEALOGY_REFRESH_SECONDS = float(os.getenv("GENEALOGY_REFRESH_SECONDS", "60"))
+GENEALOGY_OVERLAP_MINUTES = int(os.getenv("GENEALOGY_OVERLAP_MINUTES", "60"))
+GENEALOGY_LOAD_DEADLINE_SECONDS = float(os.getenv("GENEALOGY_LOAD_DEADLINE_SECONDS", "120"))
+FETCH_ROWS = 10000
+
+# Writers go through get_connection_string(), whose database is Traceability_TEST
+_WRITES_DATABASE = "Traceability_TEST"
+
+
+class GenealogyGraph:
+    def __init__(self, database: str):
+        self.database = database
+        self.part_ids: Dict[str, int] = {}
+        self.part_names: List[str] = []
+        self.box_ids: Dict[str, int] = {}
+        self.box_names: List[str] = []
+        self.part_boxes: List[List[int]] = []  # a part visits a handful of boxes, a list is smaller than a set
+        self.box_parts: List[Set[int]] = []
+        self.edges = 0
+        self.watermark: Optional[datetime.datetime] = None
+        self.refreshed_at = 0.0  # time.monotonic()
+        self.refreshed_wall: Optional[datetime.datetime] = None
+        self.refreshing = False
+        self.lock = threading.Lock()
+        self.load_lock = threading.Lock()  # serialises the first load
+
+    def _part(self, part_id: str) -> int:
+        index = self.part_ids.get(part_id)
+        if index is None:
+            index = self.part_ids[part_id] = len(self.part_names)
+            self.part_names.append(part_id)
+            self.part_boxes.append([])
+        return index
+
+    def _box(self, shipping_id: str) -> int:
+        index = self.box_ids.get(shipping_id)
+        if index is None:
+            index = self.box_ids[shipping_id] = len(self.box_names)
+            self.box_names.append(shipping_id)
+            self.box_parts.append(set())
+        return index
+
+    def add_edge(self, part_id: str, shipping_id: str) -> None:
+        """Caller holds self.lock."""
+        p, b = self._part(part_id), self._box(shipping_id)
+        if b not in self.part_boxes[p]:
+            self.part_boxes[p].append(b)
+            self.box_parts[b].add(p)
+            self.edges += 1
+
+    def load(self, conn_str: str) -> int:
+        """Add the edges recorded since the watermark (everything on the first call); returns rows read."""
+        where, params = "shipping_id IS NOT NULL AND shipping_id <> ''", []
+        if self.watermark is not None:
+            where += " AND status_timestamp >= ?"
+            params.append(self.watermark - datetime.timedelta(minutes=GENEALOGY_OVERLAP_MINUTES))
+        count = 0
+        newest = self.watermark
+        with db_connect(conn_str) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    f"""
+                    SELECT part_id, shipping_id, MAX(status_timestamp)
+                    FROM [{self.database}].dbo.h_part_status
+                    WHERE {where}
+                    GROUP BY part_id, shipping_id
+                    """,
+                    params
+                )
+                while True:
+                    rows = cursor.fetchmany(FETCH_ROWS)
+                    if not rows:
+                        break
+                    with self.lock:
+                        for part_id, shipping_id, seen in rows:
+                            self.add_edge(part_id, shipping_id.strip())
+                            if seen is not None and (newest is None or seen > newest):
+                                newest = seen
+                    count += len(rows)
+        with self.lock:
+            self.watermark = newest
+            self.refreshed_at = time.monotonic()
+            self.refreshed_wall = datetime.datetime.now()
+        return count
+
+    def traverse(self, part_id: Optional[str], shipping_id: Optional[str], hops: int,
+                 max_nodes: int) -> Optional[Dict[str, Any]]:
+        """Breadth-first neighbourhood up to `hops` edges; None when the start node is unknown."""
+        with self.lock:
+            if part_id is not None:
+                start = self.part_ids.get(part_id)
+                start_node = ("part", start)
+            else:
+                start = self.box_ids.get(shipping_id)
+                start_node = ("box", start)
+            if start is None:
+                return None
+
+            distance: Dict[Tuple[str, int], int] = {start_node: 0}
+            edges: List[Tuple[str, str]] = []
+            queue = deque([start_node])
+            truncated = False
+            while queue:
+                node = queue.popleft()
+                depth = distance[node]
+                if depth == hops:
+                    continue
+                kind, index = node
+                neighbours = self.part_boxes[index] if kind == "part" else self.box_parts[index]
+                other = "box" if kind == "part" else "part"
+                for neighbour in neighbours:
+                    key = (other, neighbour)
+                    if kind == "part":
+                        edge = (self.part_names[index], self.box_names[neighbour])
+                    else:
+                        edge = (self.part_names[neighbour], self.box_names[index])
+                    if key not in distance:
+                        if len(distance) >= max_nodes:
+                            truncated = True
+                            continue
+                        distance[key] = depth + 1
+                        queue.append(key)
+                        edges.append(edge)
+                    elif distance[key] > depth:
+                        edges.append(edge)  # edge to a node of the next layer reached from elsewhere
+
+            parts = [
+                {"part_id": self.part_names[i], "distance": d} for (k, i), d in distance.items() if k == "part"
+            ]
+            boxes = [
+                {"shipping_id": self.box_names[i], "distance": d} for (k, i), d in distance.items() if k == "box"
+            ]
+            return {"parts": parts, "boxes": boxes, "edges": edges, "truncated": truncated}
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "parts": len(self.part_names),
+                "boxes": len(self.box_names),
+                "edges": self.edges,
+                "watermark": self.watermark,
+                "refreshed_at": self.refreshed_wall,
+            }
+
+
+_graphs: Dict[str, GenealogyGraph] = {}
+_graphs_lock = threading.Lock()
+
+
+def _refresh_in_background(graph: GenealogyGraph) -> None:
+    try:
+        graph.load(get_connection_string())
+    except Exception as e:
+        logging.warning(f"Genealogy refresh of {graph.database} failed: {e}")
+    finally:
+        with graph.lock:
+            graph.refreshing = False
+
+
+def get_graph(conn_str: str, database: str) -> GenealogyGraph:
+    """The database's graph; loaded on first use, refreshed in the background when stale."""
+    with _graphs_lock:
+        graph = _graphs.get(database)
+        if graph is None:
+            graph = _graphs[database] = GenealogyGraph(database)
+    if graph.refreshed_wall is None:
+        # One loader per database; concurrent first requests wait for it
+        with graph.load_lock:
+            if graph.refreshed_wall is None:
+                call_with_resilience(graph.load, conn_str, deadline_seconds=GENEALOGY_LOAD_DEADLINE_SECONDS)
+        return graph
+    with graph.lock:
+        if time.monotonic() - graph.refreshed_at >= GENEALOGY_REFRESH_SECONDS and not graph.refreshing:
+            graph.refreshing = True
+            DB_EXECUTOR.submit(_refresh_in_background, graph)
+    return graph
+
+
+@add_write_listener
+def on_write(kind: str, fields: Dict[str, Any]) -> None:
+    graph = _graphs.get(_WRITES_DATABASE)
+    if graph is None or kind != "part" or not fields.get("part_id") or not fields.get("shipping_id"):
+        return
+    station_id, status = fields.get("station_id"), fields.get("status")
+    if "previous" not in fields or str(station_id).strip() not in STATION_RULES:
+        # Can't tell whether the trigger took the scan: let h_part_status decide on the next refresh
+        with graph.lock:
+            graph.refreshed_at = 0.0
+        return
+    allowed, _ = evaluate_entry(fields["previous"], station_id, status)
+    if not allowed or keeps_shipping_id(station_id, status):
+        return
+    with graph.lock:
+        graph.add_edge(fields["part_id"], str(fields["shipping_id"]).strip())
@@ -0,0 +1,162 @@
+"""
+Per-gitterbox composition (parts_count, melts, part_types) kept in memory.
+
+Filled from part_status on the first read of a box (or from the rows
+GetInfoGitter already fetched) and then kept current by the app's own writes
+(shared_utils.notify_write): a scan the part_status trigger accepts
+(evaluate_entry on the state before the scan, as in wip_counters) that moves
+a known part to another box moves its melt / part_type between the two
+aggregates; a rejected scan changes nothing. A scan without that state, or of
+a part the worker knows nothing about, drops the boxes involved, which are
+re-read on the next request. Entries expire after GITTER_SUMMARY_TTL seconds to pick up writes of
+other workers and of the part_status trigger itself.
+"""
+import os
+import threading
+from collections import Counter
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from shared_utils import LRUCache, add_write_listener, db_connect
+from station_rules import STATION_RULES, evaluate_entry, keeps_shipping_id
+
+GITTER_SUMMARY_TTL = float(os.getenv("GITTER_SUMMARY_TTL", "60"))
+
+_summaries = LRUCache(
+    maxsize=int(os.getenv("GITTER_SUMMARY_CACHE_SIZE", "2000")),
+    ttl=GITTER_SUMMARY_TTL,
+    name="gitter_summaries"
+)
+# part_id -> shipping_id of the cached box holding it (may be stale; checked against the box)
+_part_box = LRUCache(maxsize=int(os.getenv("GITTER_SUMMARY_PART_INDEX_SIZE", "200000")))
+_lock = threading.Lock()
+
+Composition = Tuple[Optional[str], Optional[str]]
+
+
+def _normalize(value: Any) -> Optional[str]:
+    return str(value).strip() if value not in (None, "") else None
+
+
+class GitterAggregate:
+    __slots__ = ("parts", "melts", "part_types")
+
+    def __init__(self):
+        self.parts: Dict[str, Composition] = {}
+        self.melts: Counter = Counter()
+        self.part_types: Counter = Counter()
+
+    def add(self, part_id: str, composition: Composition) -> None:
+        if part_id in self.parts:
+            self.remove(part_id)
+        self.parts[part_id] = composition
+        melt, part_type = composition
+        if melt is not None:
+            self.melts[melt] += 1
+        if part_type is not None:
+            self.part_types[part_type] += 1
+
+    def remove(self, part_id: str) -> Optional[Composition]:
+        composition = self.parts.pop(part_id, None)
+        if composition is not None:
+            melt, part_type = composition
+            if melt is not None:
+                self.melts[melt] -= 1
+                if not self.melts[melt]:
+                    del self.melts[melt]
+            if part_type is not None:
+                self.part_types[part_type] -= 1
+                if not self.part_types[part_type]:
+                    del self.part_types[part_type]
+        return composition
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'parts_count': len(self.parts),
+            'melts': sorted(self.melts),
+            'part_types': sorted(self.part_types),
+        }
+
+
+def remember_parts(shipping_id: str, parts: Iterable[Tuple[str, Any, Any]]) -> Dict[str, Any]:
+    """Cache the box from (part_id, melt, part_type) rows; returns its summary."""
+    aggregate = GitterAggregate()
+    for part_id, melt, part_type in parts:
+        aggregate.add(part_id, (_normalize(melt), _normalize(part_type)))
+    with _lock:
+        _summaries.set(shipping_id, aggregate)
+        for part_id in aggregate.parts:
+            _part_box.set(part_id, shipping_id)
+        return aggregate.summary()
+
+
+def cached_summary(shipping_id: str) -> Optional[Dict[str, Any]]:
+    with _lock:
+        aggregate = _summaries.get(shipping_id)
+        return aggregate.summary() if aggregate is not None else None
+
+
+def load_summary(conn_str: str, shipping_id: str) -> Dict[str, Any]:
+    """Read the box's composition from part_status (no sort, three columns) and cache it."""
+    with db_connect(conn_str) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT part_id, [melt], [part_type] FROM dbo.part_status WHERE shipping_id = ?",
+                (shipping_id,)
+            )
+            rows = cursor.fetchall()
+    return remember_parts(shipping_id, ((row[0], row[1], row[2]) for row in rows))
+
+
+def forget(shipping_id: str) -> None:
+    with _lock:
+        _summaries.pop(shipping_id)
+
+
+def _invalidate_part(part_id: str, shipping_id: Optional[str]) -> None:
+    """Drop the box cached as holding the part and the scan's box."""
+    with _lock:
+        old_box = _part_box.pop(part_id)
+        for box in (old_box, shipping_id):
+            if box:
+                _summaries.pop(box)
+
+
+def _apply_part_write(part_id: str, previous: Optional[Dict[str, Any]], station_id: Any, status: Any,
+                      shipping_id: Optional[str]) -> None:
+    allowed, _ = evaluate_entry(previous, station_id, status)
+    if not allowed:
+        return  # the trigger ignores the scan, the part stays in its box
+    if keeps_shipping_id(station_id, status):
+        return
+    with _lock:
+        old_box = _part_box.get(part_id)
+        old = _summaries.get(old_box) if old_box else None
+        composition = old.parts.get(part_id) if old is not None else None
+        if old_box == shipping_id and composition is not None:
+            return
+        if composition is not None:
+            old.remove(part_id)
+        _part_box.pop(part_id)
+        if not shipping_id:
+            return
+        new = _summaries.get(shipping_id)
+        if new is None:
+            return
+        if composition is None:
+            # melt / part_type of the part are only in the DB
+            _summaries.pop(shipping_id)
+            return
+        new.add(part_id, composition)
+        _part_box.set(part_id, shipping_id)
+
+
+@add_write_listener
+def on_write(kind: str, fields: Dict[str, Any]) -> None:
+    if kind != "part" or not fields.get("part_id"):
+        return
+    # Only scans with the state they were gated on can be mirrored exactly
+    if "previous" in fields and str(fields.get("station_id")).strip() in STATION_RULES:
+        _apply_part_write(fields["part_id"], fields["previous"], fields.get("station_id"), fields.get("status"),
+                          fields.get("shipping_id"))
+    else:
+        _invalidate_part(fields["part_id"], fields.get("shipping_id"))
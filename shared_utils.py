@@ -1,4 +1,30 @@
+import asyncio
+import atexit
+import concurrent.futures
+import contextlib
+import contextvars
+import datetime
+import functools
+import gzip
+import hashlib
+import inspect
+import json
+import logging
+import logging.handlers
+import math
 import os
+import queue
+import random
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple, Union
+
+import azure.functions as func
+import pyodbc
+from azure.storage.queue import QueueClient, TextBase64EncodePolicy
 
 
 def get_connection_string() -> str:
@@ -13,6 +39,8 @@ def get_connection_string() -> str:
     sql_user = os.getenv("AZURE_SQL_DB_USER")
     sql_pwd = os.getenv("AZURE_SQL_DB_PASSWORD")
     sql_driver = os.getenv("AZURE_SQL_DRIVER")
+    # "yes" only for a local SQL Server with a self-signed cert (benchmarks/)
+    trust_cert = os.getenv("AZURE_SQL_TRUST_SERVER_CERTIFICATE", "no")
 
     return (f"Driver={sql_driver};"
             f"Server={sql_conn_str};"
@@ -20,7 +48,1388 @@ def get_connection_string() -> str:
             f"Uid={sql_user};"
             f"Pwd={sql_pwd};"
             "Encrypt=yes;"
-            "TrustServerCertificate=no;"
+            f"TrustServerCertificate={trust_cert};"
             "Connection Timeout=60;")
 
 
+_MISSING = object()
+
+# name -> LRUCache, for the diagnostics endpoint
+_caches: Dict[str, "LRUCache"] = {}
+
+
+class LRUCache:
+    """Small thread-safe LRU map shared by the handlers of one worker process.
+
+    With `ttl` (seconds) entries also expire; expired entries read as missing.
+    Named caches report their hit ratio in cache_stats().
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None, name: Optional[str] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        if name:
+            _caches[name] = self
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at and expires_at < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        expires_at = time.monotonic() + self.ttl if self.ttl else 0.0
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.pop(key, _MISSING)
+            return default if entry is _MISSING else entry[1]
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: cache.stats() for name, cache in _caches.items()}
+
+
+# ---------------------------------------------------------------------------
+# Idempotency keys
+# ---------------------------------------------------------------------------
+# Queue messages can be redelivered (visibilityTimeout 30 s, maxDequeueCount 5)
+# and HTTP clients retry on timeouts. Each writer claims its key in
+# dbo.idempotency_keys in the same transaction as the real write, so a replay
+# is acknowledged without touching traceability_log / part_status (and without
+# re-running trg_Insert_Update_Part_Status). Keys that are known to be done are
+# also kept in a per-process LRU so hot replays don't even open a connection.
+# Keys are scoped by route: the same client key on two endpoints is two writes.
+# Writes sent without a key are at-least-once at best, so they are retried only
+# where the failure proves nothing was sent (call_with_resilience idempotent=False).
+# DDL: database/idempotency_keys.sql
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+IDEMPOTENCY_BODY_FIELD = "idempotency_key"
+IDEMPOTENCY_KEY_MAX_LENGTH = 100
+
+_processed_idempotency_keys = LRUCache(
+    maxsize=int(os.getenv("IDEMPOTENCY_LRU_SIZE", "10000")), name="idempotency_keys"
+)
+
+
+def idempotency_key_from_request(req: func.HttpRequest, body: Optional[Dict[str, Any]] = None) -> Optional[str]:
+    """Return the client-supplied idempotency key (header first, then JSON body).
+
+    Raises ValueError for keys that don't fit dbo.idempotency_keys.
+    """
+    key = req.headers.get(IDEMPOTENCY_HEADER)
+    if not key and isinstance(body, dict):
+        key = body.get(IDEMPOTENCY_BODY_FIELD)
+    return _validate_idempotency_key(key)
+
+
+def idempotency_key_from_message(msg: func.QueueMessage, data: Optional[Dict[str, Any]] = None) -> Optional[str]:
+    """Return the idempotency key of a queue message.
+
+    A key set by the producer in the message body wins (it survives re-enqueueing
+    the same logical write); otherwise the storage queue message id is used, which
+    is stable across redeliveries of the same message.
+    """
+    key = data.get(IDEMPOTENCY_BODY_FIELD) if isinstance(data, dict) else None
+    return _validate_idempotency_key(key or msg.id)
+
+
+def _validate_idempotency_key(key: Any) -> Optional[str]:
+    if key is None:
+        return None
+    key = str(key).strip()
+    if not key:
+        return None
+    if len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise ValueError(f"Idempotency key must be at most {IDEMPOTENCY_KEY_MAX_LENGTH} characters")
+    return key
+
+
+def is_idempotency_key_processed(key: Optional[str], route: str) -> bool:
+    """Cheap in-memory check, no DB round trip. False just means 'not known here'."""
+    return bool(key) and (route, key) in _processed_idempotency_keys
+
+
+def remember_idempotency_key(key: Optional[str], route: str) -> None:
+    """Record a key whose write for `route` has been committed (or found already committed)."""
+    if key:
+        _processed_idempotency_keys.set((route, key), True)
+
+
+def claim_idempotency_key(cursor, key: str, route: str) -> bool:
+    """Claim `key` inside the caller's open transaction.
+
+    Returns False when the key was already claimed, i.e. the write is a replay.
+    The claim becomes durable only when the caller commits its main write, so a
+    failed write leaves the key free for the next delivery.
+    """
+    cursor.execute(
+        """
+        INSERT INTO dbo.idempotency_keys (idempotency_key, route)
+        SELECT ?, ?
+        WHERE NOT EXISTS (
+            SELECT 1 FROM dbo.idempotency_keys WITH (UPDLOCK, HOLDLOCK)
+            WHERE idempotency_key = ? AND route = ?
+        );
+        """,
+        (key, route, key, route)
+    )
+    claimed = cursor.rowcount == 1
+    if not claimed:
+        log_event(route, "Idempotency key already processed, skipping write", idempotency_key=key)
+    return claimed
+
+
+# ---------------------------------------------------------------------------
+# Async ingest (write-behind)
+# ---------------------------------------------------------------------------
+# Routes listed in ASYNC_INGEST_ROUTES (comma separated, e.g.
+# "ControlStationInsert,KovaciLinkaScan") validate the payload, put it on the
+# ingest queue and answer 202 right away; AsyncIngest.py applies the write.
+# A client can also opt in per request with the `Prefer: respond-async` header.
+# The tracking id doubles as the idempotency key of the queued write, so the
+# status endpoint only has to look the key up in dbo.idempotency_keys.
+
+ASYNC_INGEST_QUEUE = os.getenv("ASYNC_INGEST_QUEUE", "scan-ingest-test")
+
+_ingest_queue_client: Optional[QueueClient] = None
+_ingest_queue_lock = threading.Lock()
+
+
+def async_ingest_requested(route: str, req: func.HttpRequest) -> bool:
+    """True when `route` is configured for async ingest or the client asked for it."""
+    if "respond-async" in req.headers.get("Prefer", "").lower():
+        return True
+    routes = os.getenv("ASYNC_INGEST_ROUTES", "")
+    return route.lower() in {r.strip().lower() for r in routes.split(",") if r.strip()}
+
+
+def _get_ingest_queue_client() -> QueueClient:
+    global _ingest_queue_client
+    with _ingest_queue_lock:
+        if _ingest_queue_client is None:
+            # Functions queue trigger expects base64 encoded messages by default.
+            _ingest_queue_client = QueueClient.from_connection_string(
+                os.environ["AzureWebJobsStorage"],
+                ASYNC_INGEST_QUEUE,
+                message_encode_policy=TextBase64EncodePolicy()
+            )
+        return _ingest_queue_client
+
+
+def _send_ingest_message(message: str) -> None:
+    _get_ingest_queue_client().send_message(message)
+
+
+async def enqueue_ingest(route: str, payload: Dict[str, Any], tracking_id: Optional[str] = None) -> str:
+    """Queue a validated write for AsyncIngest.py and return its tracking id.
+
+    A client-supplied idempotency key is reused as tracking id, so retried
+    async POSTs collapse into one write as well.
+    """
+    tracking_id = tracking_id or uuid.uuid4().hex
+    message = json.dumps({
+        "route": route,
+        "tracking_id": tracking_id,
+        "enqueued_at": datetime.datetime.utcnow().isoformat(),
+        "payload": payload,
+    }, default=str)
+    await asyncio.get_event_loop().run_in_executor(None, _send_ingest_message, message)
+    log_event(route, "Queued write for async ingest", tracking_id=tracking_id)
+    return tracking_id
+
+
+def ingest_accepted_response(tracking_id: str) -> func.HttpResponse:
+    """202 Accepted pointing the client at the ingest status endpoint."""
+    status_url = f"/api/IngestStatus?tracking_id={tracking_id}"
+    return func.HttpResponse(
+        body=json.dumps({
+            "message": "Accepted for processing",
+            "tracking_id": tracking_id,
+            "status_url": status_url,
+        }),
+        mimetype="application/json",
+        status_code=202,
+        headers={"Location": status_url}
+    )
+
+
+# ---------------------------------------------------------------------------
+# Write listeners
+# ---------------------------------------------------------------------------
+# In-memory views of part_status (gitterbox summaries, ...) follow the app's
+# own writes. Writers call notify_write after the commit:
+#   notify_write("part", part_id=..., station_id=..., status=..., shipping_id=...)
+#   notify_write("gitter_status", shipping_ids=[...], station_id=..., status=...)
+# Listeners run on the writer's thread, must be cheap and never fail the
+# write; writes of other workers are not seen, so views also expire.
+
+_write_listeners: List[Callable[[str, Dict[str, Any]], None]] = []
+
+
+def add_write_listener(listener: Callable[[str, Dict[str, Any]], None]) -> Callable[[str, Dict[str, Any]], None]:
+    _write_listeners.append(listener)
+    return listener
+
+
+def notify_write(kind: str, **fields: Any) -> None:
+    for listener in list(_write_listeners):
+        try:
+            listener(kind, fields)
+        except Exception as e:
+            increment_metric("write_listener_errors")
+            logging.warning(f"Write listener {getattr(listener, '__name__', listener)} failed on {kind}: {e}")
+
+
+# ---------------------------------------------------------------------------
+# In-process metrics
+# ---------------------------------------------------------------------------
+# Plain counters and gauges per worker process; cheap enough for hot paths.
+
+_metrics_lock = threading.Lock()
+_counters: Dict[str, float] = {}
+_gauges: Dict[str, float] = {}
+
+
+def increment_metric(name: str, value: float = 1) -> None:
+    with _metrics_lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def set_gauge(name: str, value: float) -> None:
+    with _metrics_lock:
+        _gauges[name] = value
+
+
+def get_metrics() -> Dict[str, Dict[str, float]]:
+    """Snapshot of all counters and gauges of this worker process."""
+    with _metrics_lock:
+        return {"counters": dict(_counters), "gauges": dict(_gauges)}
+
+
+class LatencyHistogram:
+    """Log-linear (HDR-style) histogram of millisecond values.
+
+    8 sub-buckets per power of two (<= 12.5 % relative error), linear below
+    1 ms; recording is O(1) and the memory is a few dozen ints per series.
+    """
+
+    SUB_BUCKETS = 8
+
+    def __init__(self):
+        self._counts: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def _index(cls, ms: float) -> int:
+        if ms < 1:
+            return int(max(ms, 0.0) * cls.SUB_BUCKETS)
+        exponent = int(math.log2(ms))
+        sub = min(int((ms / 2 ** exponent - 1) * cls.SUB_BUCKETS), cls.SUB_BUCKETS - 1)
+        return cls.SUB_BUCKETS * (exponent + 1) + sub
+
+    @classmethod
+    def _upper_bound(cls, index: int) -> float:
+        if index < cls.SUB_BUCKETS:
+            return (index + 1) / cls.SUB_BUCKETS
+        exponent, sub = divmod(index, cls.SUB_BUCKETS)
+        return 2 ** (exponent - 1) * (1 + (sub + 1) / cls.SUB_BUCKETS)
+
+    def record(self, ms: float) -> None:
+        index = self._index(ms)
+        with self._lock:
+            self._counts[index] = self._counts.get(index, 0) + 1
+            self.count += 1
+            self.total += ms
+            self.min = min(self.min, ms)
+            self.max = max(self.max, ms)
+
+    def _percentile(self, indexes: List[int], pct: float) -> float:
+        target = pct / 100.0 * self.count
+        seen = 0
+        for index in indexes:
+            seen += self._counts[index]
+            if seen >= target:
+                return min(self._upper_bound(index), self.max)
+        return self.max
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            if not self.count:
+                return {"count": 0}
+            indexes = sorted(self._counts)
+            return {
+                "count": self.count,
+                "mean_ms": round(self.total / self.count, 3),
+                "min_ms": round(self.min, 3),
+                "max_ms": round(self.max, 3),
+                **{f"p{str(pct).replace('.', '')}_ms": round(self._percentile(indexes, pct), 3)
+                   for pct in (50, 90, 95, 99, 99.9)},
+                # [upper bound ms, count] of the non-empty buckets
+                "buckets": [[round(self._upper_bound(i), 3), self._counts[i]] for i in indexes],
+            }
+
+
+_histograms: Dict[str, LatencyHistogram] = {}
+
+
+def record_latency(series: str, ms: float) -> None:
+    """Add `ms` to the named latency histogram (created on first use)."""
+    histogram = _histograms.get(series)
+    if histogram is None:
+        with _metrics_lock:
+            histogram = _histograms.setdefault(series, LatencyHistogram())
+    histogram.record(ms)
+
+
+def get_histograms(prefix: str = "") -> Dict[str, Dict[str, Any]]:
+    return {name: h.snapshot() for name, h in sorted(_histograms.items()) if name.startswith(prefix)}
+
+
+# ---------------------------------------------------------------------------
+# Hot-path logging (sampled, queued, structured)
+# ---------------------------------------------------------------------------
+# log_event() is for the per-request INFO logs of scan / ingest / read paths.
+# Records below WARNING are sampled per route (LOG_SAMPLE_RATE, overridden by
+# LOG_SAMPLE_RATES="ReadStatus=0.01,ChangeStatus=1"); warnings and errors are
+# always kept. Kept records go through a bounded in-memory queue and are
+# formatted and handed to the root logger's handlers (the Functions host /
+# App Insights) on a listener thread, so the handler never waits on log I/O;
+# a full queue drops the record (log_records_dropped) instead of blocking.
+# Structured fields (route, part_id, duration_ms, ...) travel as LogRecord
+# attributes (customDimensions with azure-monitor-opentelemetry) and are
+# appended to the message as key=value.
+# Records emitted from the listener thread are not tied to an invocation id.
+
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.1"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+_log_sample_rates: Dict[str, float] = {}
+for _item in os.getenv("LOG_SAMPLE_RATES", "").split(","):
+    if "=" in _item:
+        _route, _rate = _item.split("=", 1)
+        _log_sample_rates[_route.strip()] = float(_rate)
+
+
+class _StructuredMessage:
+    """LogRecord.msg formatted only when a handler asks for it."""
+
+    __slots__ = ("msg", "args", "fields")
+
+    def __init__(self, msg: str, args: tuple, fields: Dict[str, Any]):
+        self.msg = msg
+        self.args = args
+        self.fields = fields
+
+    def __str__(self) -> str:
+        text = self.msg % self.args if self.args else self.msg
+        return text + " | " + " ".join(f"{k}={v}" for k, v in self.fields.items())
+
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Same process: no need to pre-format (QueueHandler's default), the listener does it.
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            increment_metric("log_records_dropped")
+
+
+class _ForwardToRoot(logging.Handler):
+    """Listener-side handler: whatever handlers the root logger has when the record is written."""
+
+    def emit(self, record: logging.LogRecord) -> None:
+        logging.getLogger().handle(record)
+
+
+_hot_logger = logging.getLogger("traceability")
+_log_listener: Optional[logging.handlers.QueueListener] = None
+_log_listener_lock = threading.Lock()
+
+
+def _start_log_listener() -> None:
+    global _log_listener
+    with _log_listener_lock:
+        if _log_listener is not None:
+            return
+        log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        _hot_logger.addHandler(_NonBlockingQueueHandler(log_queue))
+        _hot_logger.propagate = False
+        _log_listener = logging.handlers.QueueListener(log_queue, _ForwardToRoot())
+        _log_listener.start()
+        atexit.register(_log_listener.stop)
+
+
+def log_sampled(route: str) -> bool:
+    rate = _log_sample_rates.get(route, LOG_SAMPLE_RATE)
+    return rate >= 1 or (rate > 0 and random.random() < rate)
+
+
+def log_event(route: str, msg: str, *args: Any, level: int = logging.INFO,
+              exc_info: Any = None, **fields: Any) -> None:
+    """Log `msg % args` for `route` with structured `fields`, sampled below WARNING.
+
+    Formatting is lazy: pass values as args / fields, not as an f-string.
+    """
+    if level < logging.WARNING and not log_sampled(route):
+        return
+    if not _hot_logger.isEnabledFor(level):
+        return
+    if _log_listener is None:
+        _start_log_listener()
+    fields = {"route": route, **fields}
+    _hot_logger.log(level, _StructuredMessage(msg, args, fields), exc_info=exc_info, extra=fields)
+
+
+# ---------------------------------------------------------------------------
+# Azure SQL resilience: transient-fault retry + circuit breaker
+# ---------------------------------------------------------------------------
+# During Azure SQL failovers / throttling every instance would otherwise hit
+# the server with fresh connection attempts as fast as clients and queue
+# redeliveries retry. Transient errors are retried with jittered exponential
+# backoff inside a deadline; after CIRCUIT_FAILURE_THRESHOLD consecutive
+# transient failures the breaker opens and calls fail fast with
+# CircuitOpenError until CIRCUIT_RESET_SECONDS have passed and one probe call
+# succeeds. Breaker state is exported as gauge `sql_circuit_state`
+# (0 = closed, 1 = half-open, 2 = open).
+
+# Error numbers from Azure SQL "transient fault" docs + network / timeout errors
+TRANSIENT_SQL_ERRORS = {
+    233, 64, 10053, 10054, 10060, 10928, 10929, 40143, 40197, 40501, 40540,
+    40613, 42108, 42109, 49918, 49919, 49920, 4060, 4221,
+}
+TRANSIENT_SQLSTATES = {"08S01", "08001", "HYT00", "HYT01"}
+# Failures to connect / log in: no statement reached the server, so even a
+# write without an idempotency key can be retried. A link failure or timeout
+# during execute (08S01, HYT01, ...) may come after the commit went through.
+NOT_SENT_SQLSTATES = {"08001", "HYT00"}
+DEADLOCK_ERROR = 1205
+
+SQL_RETRY_DEADLINE_SECONDS = float(os.getenv("SQL_RETRY_DEADLINE_SECONDS", "20"))
+# Interactive reads (terminals wait on them) give up sooner than writes.
+SQL_READ_DEADLINE_SECONDS = float(os.getenv("SQL_READ_DEADLINE_SECONDS", "8"))
+SQL_RETRY_BASE_DELAY = float(os.getenv("SQL_RETRY_BASE_DELAY", "0.2"))
+SQL_RETRY_MAX_DELAY = float(os.getenv("SQL_RETRY_MAX_DELAY", "5"))
+SQL_RETRY_MAX_ATTEMPTS = int(os.getenv("SQL_RETRY_MAX_ATTEMPTS", "5"))
+
+_sql_error_number = re.compile(r"\((\d{3,5})\)")
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the DB while the circuit breaker is open."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Database circuit breaker is open, retry in {retry_after:.0f} s")
+        self.retry_after = retry_after
+
+
+def _sql_error_info(exc: BaseException) -> Tuple[Optional[str], set]:
+    args = getattr(exc, "args", ())
+    sqlstate = args[0] if args and isinstance(args[0], str) and len(args[0]) == 5 else None
+    text = " ".join(str(arg) for arg in args)
+    return sqlstate, {int(n) for n in _sql_error_number.findall(text)}
+
+
+def is_deadlock_error(exc: BaseException) -> bool:
+    """SQL Server deadlock victim (error 1205, SQLSTATE 40001)."""
+    sqlstate, numbers = _sql_error_info(exc)
+    return sqlstate == "40001" or DEADLOCK_ERROR in numbers
+
+
+def is_transient_error(exc: BaseException) -> bool:
+    """True for errors worth retrying: failover, throttling, network, timeouts, deadlocks."""
+    if isinstance(exc, CircuitOpenError):
+        return False
+    sqlstate, numbers = _sql_error_info(exc)
+    return (
+        sqlstate in TRANSIENT_SQLSTATES
+        or bool(numbers & TRANSIENT_SQL_ERRORS)
+        or is_deadlock_error(exc)
+    )
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker shared by all DB calls of the process."""
+
+    CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+
+    def __init__(self, name: str, failure_threshold: int, reset_seconds: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        set_gauge(f"{name}_circuit_state", self.CLOSED)
+
+    @property
+    def state(self) -> int:
+        return self._state
+
+    def _set_state(self, state: int) -> None:
+        if state != self._state:
+            logging.warning(f"Circuit breaker {self.name}: {self._state} -> {state}")
+        self._state = state
+        set_gauge(f"{self.name}_circuit_state", state)
+
+    def before_call(self) -> None:
+        """Raise CircuitOpenError unless a call may go through now."""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return
+            elapsed = time.monotonic() - self._opened_at
+            if self._state == self.OPEN and elapsed >= self.reset_seconds:
+                self._set_state(self.HALF_OPEN)
+            if self._state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return
+            increment_metric(f"{self.name}_circuit_rejections")
+            raise CircuitOpenError(max(self.reset_seconds - elapsed, 1.0))
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._probe_in_flight = False
+            self._set_state(self.CLOSED)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._set_state(self.OPEN)
+
+
+sql_circuit_breaker = CircuitBreaker(
+    "sql",
+    failure_threshold=int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5")),
+    reset_seconds=float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+)
+
+
+def call_with_resilience(fn: Callable[..., Any], *args: Any, deadline_seconds: Optional[float] = None,
+                         idempotent: bool = True) -> Any:
+    """Call blocking DB function `fn(*args)` through the breaker, retrying transient errors.
+
+    Retries use full-jitter exponential backoff and stop once the next attempt
+    would start after the deadline. Deadlocks are retried but don't count
+    against the breaker (the server is healthy, we just lost a lock race).
+    Anything non-transient is re-raised immediately. With idempotent=False
+    (writes without an idempotency key) only deadlocks and NOT_SENT_SQLSTATES
+    are retried, so an error after a commit that did go through cannot write twice.
+    """
+    deadline = time.monotonic() + (deadline_seconds or SQL_RETRY_DEADLINE_SECONDS)
+    name = getattr(fn, "__name__", str(fn))
+    attempt = 0
+    while True:
+        attempt += 1
+        sql_circuit_breaker.before_call()
+        try:
+            result = fn(*args)
+        except Exception as e:
+            if not is_transient_error(e):
+                # The server answered; only the request was bad.
+                sql_circuit_breaker.record_success()
+                raise
+            if is_deadlock_error(e):
+                sql_circuit_breaker.record_success()
+                increment_metric("deadlock_retries")
+            else:
+                sql_circuit_breaker.record_failure()
+                increment_metric("sql_transient_errors")
+            if not idempotent and not is_deadlock_error(e) and _sql_error_info(e)[0] not in NOT_SENT_SQLSTATES:
+                increment_metric("sql_unretried_writes")
+                logging.error(f"{name}: not retrying a write without idempotency key, it may have committed: {e}")
+                raise
+
+            delay = random.uniform(0, min(SQL_RETRY_MAX_DELAY, SQL_RETRY_BASE_DELAY * 2 ** (attempt - 1)))
+            if attempt >= SQL_RETRY_MAX_ATTEMPTS or time.monotonic() + delay >= deadline:
+                if is_deadlock_error(e):
+                    increment_metric("deadlock_failures")
+                logging.error(f"{name}: giving up after {attempt} attempts: {e}")
+                raise
+            logging.warning(f"{name}: transient SQL error (attempt {attempt}), retrying in {delay:.2f} s: {e}")
+            time.sleep(delay)
+        else:
+            sql_circuit_breaker.record_success()
+            return result
+
+
+def service_unavailable_response(exc: CircuitOpenError) -> func.HttpResponse:
+    """503 with Retry-After so clients back off instead of retrying right away."""
+    return func.HttpResponse(
+        body=json.dumps({"error": "Database temporarily unavailable, retry later"}),
+        mimetype="application/json",
+        status_code=503,
+        headers={"Retry-After": str(int(exc.retry_after))}
+    )
+
+
+# ---------------------------------------------------------------------------
+# Shared DB executor + keyed write serialization
+# ---------------------------------------------------------------------------
+# set_gitter_status, InsertTraceabilityLog, insert_protocol_part and the
+# Control_Station insert all end up updating part_status through triggers.
+# Two concurrent writes touching the same gitterbox / part take conflicting
+# locks and one of them becomes a deadlock victim (error 1205). Writes are
+# therefore serialized per key (shipping id / part id) inside the process,
+# while writes with different keys still run in parallel on the shared
+# executor. Deadlocks with other instances are retried by call_with_resilience.
+
+DB_EXECUTOR = concurrent.futures.ThreadPoolExecutor(
+    max_workers=int(os.getenv("DB_EXECUTOR_WORKERS", "16")),
+    thread_name_prefix="db"
+)
+
+def serialization_keys(part_ids: Iterable[Any] = (), shipping_ids: Iterable[Any] = ()) -> List[str]:
+    """Keys a write has to hold; parts and gitterboxes live in separate namespaces."""
+    keys = [f"part:{p}" for p in part_ids if p]
+    keys += [f"shipping:{s}" for s in shipping_ids if s]
+    return keys
+
+
+class KeyedSerializer:
+    """Runs blocking writes so that writes sharing a key never overlap.
+
+    Waiting happens on the event loop (asyncio locks), not in executor
+    threads, so a burst on one gitterbox doesn't starve writes to others.
+    Multiple keys are always acquired in sorted order.
+    """
+
+    def __init__(self, executor: concurrent.futures.Executor):
+        self._executor = executor
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._users: Dict[str, int] = {}
+
+    def in_flight_keys(self) -> int:
+        return len(self._locks)
+
+    async def run(self, keys: Iterable[str], fn: Callable[..., Any], *args: Any, idempotent: bool = True) -> Any:
+        keys = sorted(set(keys))
+        for key in keys:
+            self._locks.setdefault(key, asyncio.Lock())
+            self._users[key] = self._users.get(key, 0) + 1
+
+        acquired = []
+        try:
+            contended = False
+            for key in keys:
+                lock = self._locks[key]
+                if lock.locked():
+                    contended = True
+                await lock.acquire()
+                acquired.append(lock)
+            if contended:
+                # A write on the same key was in flight: it would have raced us
+                # for the same part_status rows.
+                increment_metric("write_serialization_waits")
+            return await asyncio.get_event_loop().run_in_executor(
+                self._executor, contextvars.copy_context().run,
+                functools.partial(call_with_resilience, fn, *args, idempotent=idempotent)
+            )
+        finally:
+            for lock in acquired:
+                lock.release()
+            for key in keys:
+                self._users[key] -= 1
+                if self._users[key] == 0:
+                    del self._users[key]
+                    del self._locks[key]
+
+
+_write_serializer = KeyedSerializer(DB_EXECUTOR)
+
+
+def executor_stats() -> Dict[str, int]:
+    """Occupancy of DB_EXECUTOR (work_queue = calls waiting for a free thread)."""
+    return {
+        "max_workers": DB_EXECUTOR._max_workers,
+        "threads": len(DB_EXECUTOR._threads),
+        "work_queue": DB_EXECUTOR._work_queue.qsize(),
+        "serialized_keys_in_flight": _write_serializer.in_flight_keys(),
+    }
+
+
+async def run_serialized(keys: Iterable[str], fn: Callable[..., Any], *args: Any, idempotent: bool = True) -> Any:
+    """Run blocking write `fn(*args)` on the DB executor, serialized per key.
+
+    Pass idempotent=False for writes without an idempotency key (see call_with_resilience).
+    """
+    return await _write_serializer.run(keys, fn, *args, idempotent=idempotent)
+
+
+async def run_blocking(fn: Callable[..., Any], *args: Any) -> Any:
+    """Run a blocking DB read on the shared DB executor."""
+    return await asyncio.get_event_loop().run_in_executor(DB_EXECUTOR, contextvars.copy_context().run, fn, *args)
+
+
+# ---------------------------------------------------------------------------
+# Per-request timing (Server-Timing + metrics)
+# ---------------------------------------------------------------------------
+# timed_request keeps a RequestTiming for the handler call in a context
+# variable; db_connect (connect), its cursors (query / fetch) and
+# request_phase("encode") add to it from whatever thread does the work —
+# hand contextvars.copy_context().run to executors so they see it.
+# HTTP responses get e.g.
+#   Server-Timing: connect;dur=4.1, query;dur=12.8, fetch;dur=0.4, encode;dur=0.3, total;dur=19.2
+# and each phase is recorded as a metric tagged with route and database
+# (in get_metrics() and, when the OpenTelemetry API is installed, as the
+# request_phase_duration histogram that azure-monitor-opentelemetry exports
+# to App Insights). REQUEST_TIMING_ENABLED=false leaves handlers unwrapped
+# (connections stay wrapped while the slow-query log below is on).
+
+REQUEST_TIMING_ENABLED = os.getenv("REQUEST_TIMING_ENABLED", "true").strip().lower() not in ("0", "false", "no", "off")
+
+try:
+    from opentelemetry import metrics as otel_metrics
+except ImportError:  # optional
+    otel_metrics = None
+
+_current_timing: contextvars.ContextVar[Optional["RequestTiming"]] = contextvars.ContextVar(
+    "request_timing", default=None
+)
+_phase_histogram = None
+
+
+class RequestTiming:
+    """Phase durations (seconds) accumulated over one handler call."""
+
+    def __init__(self, route: str, db: Optional[str] = None):
+        self.route = route
+        self.db = db
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.log_fields: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def add(self, phase: str, seconds: float) -> None:
+        with self._lock:
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def server_timing(self, total: float) -> str:
+        parts = [f"{phase};dur={1000 * seconds:.1f}" for phase, seconds in self.phases.items()]
+        parts.append(f"total;dur={1000 * total:.1f}")
+        return ", ".join(parts)
+
+
+def add_log_fields(**fields: Any) -> None:
+    """Attach fields (part_id, station_id, ...) to the current request's "done" log line."""
+    timing = _current_timing.get()
+    if timing is not None:
+        timing.log_fields.update(fields)
+
+
+@contextlib.contextmanager
+def request_phase(phase: str):
+    """Time the block as `phase` of the current request (no-op outside one)."""
+    timing = _current_timing.get()
+    if timing is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.add(phase, time.perf_counter() - started)
+
+
+def requested_database(req: func.HttpRequest) -> str:
+    """Database a report endpoint reads for its `db` parameter (prod by default)."""
+    return "Traceability" if req.params.get("db", "prod") == "prod" else "Traceability_TEST"
+
+
+def _get_phase_histogram():
+    global _phase_histogram
+    if _phase_histogram is None and otel_metrics is not None:
+        _phase_histogram = otel_metrics.get_meter("traceability").create_histogram(
+            "request_phase_duration", unit="ms", description="Handler time per phase"
+        )
+    return _phase_histogram
+
+
+def _record_request_timing(timing: RequestTiming, total: float) -> None:
+    phases = list(timing.phases.items()) + [("total", total)]
+    tags = f"route={timing.route},db={timing.db or '-'}"
+    with _metrics_lock:
+        key = f"requests{{{tags}}}"
+        _counters[key] = _counters.get(key, 0) + 1
+        for phase, seconds in phases:
+            key = f"request_phase_ms{{{tags},phase={phase}}}"
+            _counters[key] = _counters.get(key, 0) + 1000 * seconds
+    record_latency(f"request_ms{{route={timing.route}}}", 1000 * total)
+
+    histogram = _get_phase_histogram()
+    if histogram is not None:
+        for phase, seconds in phases:
+            histogram.record(1000 * seconds, {"route": timing.route, "db": timing.db or "-", "phase": phase})
+
+
+_in_flight: Dict[str, int] = {}
+
+
+def in_flight_requests() -> Dict[str, int]:
+    with _metrics_lock:
+        return {route: count for route, count in _in_flight.items() if count}
+
+
+def _track_in_flight(route: str, delta: int) -> None:
+    with _metrics_lock:
+        _in_flight[route] = _in_flight.get(route, 0) + delta
+
+
+def _record_queue_lag(route: str, msg: Any) -> None:
+    """Time the message spent in the queue before this (latest) delivery."""
+    inserted = getattr(msg, "insertion_time", None)
+    if not isinstance(inserted, datetime.datetime):
+        return
+    if inserted.tzinfo is None:
+        inserted = inserted.replace(tzinfo=datetime.timezone.utc)
+    lag = datetime.datetime.now(datetime.timezone.utc) - inserted
+    record_latency(f"queue_lag_ms{{route={route}}}", max(lag.total_seconds(), 0.0) * 1000)
+
+
+def timed_request(route: str, db: Union[str, Callable[[Any], str], None] = "Traceability_TEST"):
+    """Decorator (innermost, under the bp.* decorators) timing a handler's phases.
+
+    `db` is the database tag, or a callable deriving it from the trigger
+    argument (e.g. requested_database).
+    """
+    def decorator(fn: Callable[..., Any]) -> Callable[..., Any]:
+        if not REQUEST_TIMING_ENABLED:
+            return fn
+
+        def start(args: tuple, kwargs: dict) -> Tuple[RequestTiming, contextvars.Token]:
+            trigger_arg = args[0] if args else next(iter(kwargs.values()), None)
+            if isinstance(trigger_arg, func.QueueMessage):
+                _record_queue_lag(route, trigger_arg)
+            timing = RequestTiming(route, db(trigger_arg) if callable(db) else db)
+            _track_in_flight(route, 1)
+            return timing, _current_timing.set(timing)
+
+        def finish(timing: RequestTiming, token: contextvars.Token, result: Any) -> None:
+            _current_timing.reset(token)
+            _track_in_flight(route, -1)
+            total = time.perf_counter() - timing.started
+            status_code = None
+            if isinstance(result, func.HttpResponse):
+                result.headers["Server-Timing"] = timing.server_timing(total)
+                status_code = result.status_code
+            _record_request_timing(timing, total)
+            log_event(route, "%s done", route, level=logging.WARNING if status_code and status_code >= 500 else logging.INFO,
+                      duration_ms=round(1000 * total, 1), status_code=status_code, **timing.log_fields)
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                timing, token = start(args, kwargs)
+                result = None
+                try:
+                    result = await fn(*args, **kwargs)
+                    return result
+                finally:
+                    finish(timing, token, result)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            timing, token = start(args, kwargs)
+            result = None
+            try:
+                result = fn(*args, **kwargs)
+                return result
+            finally:
+                finish(timing, token, result)
+        return wrapper
+
+    return decorator
+
+
+# ---------------------------------------------------------------------------
+# Response compression
+# ---------------------------------------------------------------------------
+# Read endpoints return whole part / gitterbox histories to handhelds on
+# shop-floor Wi-Fi. json_response() compresses bodies of at least
+# RESPONSE_COMPRESSION_MIN_BYTES with the best coding the client accepts:
+# br (only if the optional `brotli` package is installed), then gzip.
+# Levels are tuned for CPU per request, not ratio (benchmarks/bench_compression.py).
+
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESSION_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("RESPONSE_GZIP_LEVEL", "5"))
+BROTLI_QUALITY = int(os.getenv("RESPONSE_BROTLI_QUALITY", "4"))
+
+try:
+    import brotli
+except ImportError:  # optional
+    brotli = None
+
+
+def _quality_values(header: str) -> Dict[str, float]:
+    """Accept / Accept-Encoding header -> {value: q}"""
+    accepted: Dict[str, float] = {}
+    for item in header.split(","):
+        value, *params = item.split(";")
+        value = value.strip().lower()
+        if not value:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, number = param.strip().partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(number)
+                except ValueError:
+                    q = 0.0
+        accepted[value] = q
+    return accepted
+
+
+def negotiate_encoding(accept_encoding: Optional[str], codings: Optional[Iterable[str]] = None) -> Optional[str]:
+    """Coding to use for a response ("br", "gzip", limited to `codings` if given) or None for identity."""
+    if not accept_encoding:
+        return None
+    accepted = _quality_values(accept_encoding)
+    wildcard = accepted.get("*", 0.0)
+    candidates = list(codings) if codings is not None else (["br"] if brotli is not None else []) + ["gzip"]
+    best, best_q = None, 0.0
+    for coding in candidates:
+        q = accepted.get(coding, wildcard)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compress_body(body: bytes, coding: str) -> bytes:
+    if coding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def json_response(req: func.HttpRequest, body: Union[str, bytes], status_code: int = 200,
+                  headers: Optional[Dict[str, str]] = None, mimetype: str = "application/json") -> func.HttpResponse:
+    """HttpResponse (JSON unless `mimetype` says otherwise), compressed when large
+    enough and the client accepts it."""
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    headers = dict(headers or {})
+    headers["Vary"] = "Accept, Accept-Encoding"
+    if len(body) >= RESPONSE_COMPRESSION_MIN_BYTES:
+        coding = negotiate_encoding(req.headers.get("Accept-Encoding"))
+        if coding:
+            with request_phase("compress"):
+                compressed = compress_body(body, coding)
+            if len(compressed) < len(body):
+                increment_metric(f"response_bytes_saved{{coding={coding}}}", len(body) - len(compressed))
+                body = compressed
+                headers["Content-Encoding"] = coding
+    return func.HttpResponse(body, status_code=status_code, mimetype=mimetype, headers=headers)
+
+
+# ---------------------------------------------------------------------------
+# Content negotiation: JSON / MessagePack
+# ---------------------------------------------------------------------------
+# payload_response() encodes a response payload as JSON, or as MessagePack
+# when the client sends `Accept: application/msgpack` (and the optional
+# msgpack package is installed), then compresses it like json_response().
+# Both carry the same logical payload; in MessagePack datetimes are native
+# timestamps instead of str(). DB datetimes are naive, so their wall-clock
+# value is sent as if it were UTC — decode with timestamp=3 and drop tzinfo.
+# Anything else JSON would str() (Decimal, date, ...) is str() here too.
+# benchmarks/response_roundtrip_checks.py proves both decode to the same data.
+
+MSGPACK_MIMETYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+
+try:
+    import msgpack
+except ImportError:  # optional
+    msgpack = None
+
+
+def wants_msgpack(req: func.HttpRequest) -> bool:
+    if msgpack is None:
+        return False
+    accepted = _quality_values(req.headers.get("Accept") or "")
+    msgpack_q = max((accepted.get(mimetype, 0.0) for mimetype in MSGPACK_MIMETYPES), default=0.0)
+    return msgpack_q > 0 and msgpack_q >= accepted.get("application/json", 0.0)
+
+
+def _msgpack_default(value: Any) -> Any:
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=datetime.timezone.utc)
+        return msgpack.Timestamp.from_datetime(value)
+    return str(value)
+
+
+def encode_msgpack(payload: Any) -> bytes:
+    return msgpack.packb(payload, default=_msgpack_default, use_bin_type=True)
+
+
+def payload_response(req: func.HttpRequest, payload: Any, status_code: int = 200,
+                     headers: Optional[Dict[str, str]] = None) -> func.HttpResponse:
+    """Encode `payload` in the format the client negotiated (JSON by default)."""
+    if wants_msgpack(req):
+        with request_phase("encode"):
+            body = encode_msgpack(payload)
+        return json_response(req, body, status_code, headers, mimetype="application/msgpack")
+    with request_phase("encode"):
+        body = json.dumps(payload, default=str)
+    return json_response(req, body, status_code, headers)
+
+
+# ---------------------------------------------------------------------------
+# Columnar response format (?format=columnar)
+# ---------------------------------------------------------------------------
+# List responses repeat every key and the same shipping_id / melt / part_type
+# on each row. Opt-in columnar form of such a list:
+#   {"columns": ["part_id", "melt", ...],
+#    "rows": [["P1", 0, ...], ["P2", 0, ...]],
+#    "dictionaries": {"melt": ["A1203"]}}
+# Columns with few distinct values are dictionary-encoded: their cells are
+# indexes into dictionaries[column]. Clients that don't ask keep the row shape.
+
+COLUMNAR_DICT_MAX_RATIO = 0.5  # encode when distinct values <= ratio * rows
+
+
+def wants_columnar(req: func.HttpRequest) -> bool:
+    return (req.params.get("format") or "").strip().lower() == "columnar"
+
+
+def to_columnar(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    columns: List[str] = []
+    for row in rows:
+        for name in row:
+            if name not in columns:
+                columns.append(name)
+    table = [[row.get(name) for name in columns] for row in rows]
+
+    dictionaries: Dict[str, List[Any]] = {}
+    if len(rows) > 1:
+        for i, name in enumerate(columns):
+            try:
+                distinct = dict.fromkeys(r[i] for r in table)
+            except TypeError:  # unhashable cells (nested lists / dicts)
+                continue
+            if len(distinct) <= COLUMNAR_DICT_MAX_RATIO * len(rows):
+                index = {value: n for n, value in enumerate(distinct)}
+                for r in table:
+                    r[i] = index[r[i]]
+                dictionaries[name] = list(distinct)
+    return {"columns": columns, "rows": table, "dictionaries": dictionaries}
+
+
+def columnarize(payload: Dict[str, Any], key: str) -> Dict[str, Any]:
+    """Copy of `payload` with the row list under `key` in columnar form."""
+    result = dict(payload)
+    result[key] = to_columnar(payload.get(key) or [])
+    result["format"] = "columnar"
+    return result
+
+
+# ---------------------------------------------------------------------------
+# Slow-query log
+# ---------------------------------------------------------------------------
+# Every statement run on a db_connect cursor is fingerprinted (comments,
+# whitespace and literals normalized, IN lists collapsed) and its duration
+# and row counts are added to an in-memory table per fingerprint
+# (slow_query_report). Statements over SLOW_QUERY_THRESHOLD_MS are logged with
+# the fingerprint; a SLOW_QUERY_PARAM_SAMPLE_RATE share of those also logs
+# the parameters, redacted to their types and lengths.
+
+SLOW_QUERY_LOG_ENABLED = os.getenv("SLOW_QUERY_LOG_ENABLED", "true").strip().lower() not in ("0", "false", "no", "off")
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "500"))
+SLOW_QUERY_PARAM_SAMPLE_RATE = float(os.getenv("SLOW_QUERY_PARAM_SAMPLE_RATE", "0.1"))
+# The app has a few dozen distinct statements; the cap guards against dynamic SQL.
+SLOW_QUERY_MAX_FINGERPRINTS = 500
+
+_sql_comment = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_sql_string = re.compile(r"N?'(?:[^']|'')*'")
+_sql_number = re.compile(r"(?<![\w@\]])-?\d+(?:\.\d+)?\b")
+_sql_operator_space = re.compile(r"\s*([=<>!,()+*/])\s*")
+_sql_in_list = re.compile(r"\(\?(?:,\?)+\)")
+
+_query_stats: Dict[str, Dict[str, Any]] = {}
+_query_stats_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=1024)
+def fingerprint_statement(sql: str) -> Tuple[str, str]:
+    """(fingerprint id, normalized text) of a SQL statement."""
+    text = _sql_comment.sub(" ", sql)
+    text = _sql_string.sub("?", text)
+    text = _sql_number.sub("?", text)
+    text = _sql_operator_space.sub(r"\1", " ".join(text.split()).lower())
+    text = _sql_in_list.sub("(?+)", text)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:12], text
+
+
+def _redact_params(params: tuple) -> List[str]:
+    if len(params) == 1 and isinstance(params[0], (tuple, list)):
+        params = tuple(params[0])
+
+    def shape(value: Any) -> str:
+        if value is None:
+            return "NULL"
+        if isinstance(value, (str, bytes)):
+            return f"{type(value).__name__}({len(value)})"
+        return type(value).__name__
+
+    return [shape(value) for value in params]
+
+
+def record_statement(sql: str, params: tuple, seconds: float, rowcount: Optional[int] = None,
+                     failed: bool = False) -> str:
+    """Add one execution to the fingerprint table; log it when slow. Returns the fingerprint."""
+    fingerprint, text = fingerprint_statement(sql)
+    ms = 1000 * seconds
+    slow = ms >= SLOW_QUERY_THRESHOLD_MS
+    with _query_stats_lock:
+        stats = _query_stats.get(fingerprint)
+        if stats is None and len(_query_stats) < SLOW_QUERY_MAX_FINGERPRINTS:
+            stats = _query_stats[fingerprint] = {
+                "fingerprint": fingerprint,
+                "statement": text[:500],
+                "count": 0,
+                "errors": 0,
+                "slow_count": 0,
+                "total_ms": 0.0,
+                "max_ms": 0.0,
+                "rows_fetched": 0,
+                "rows_affected": 0,
+            }
+        if stats is not None:
+            stats["count"] += 1
+            stats["total_ms"] += ms
+            stats["max_ms"] = max(stats["max_ms"], ms)
+            if failed:
+                stats["errors"] += 1
+            if rowcount is not None and rowcount > 0 and not text.startswith(("select", "with")):
+                stats["rows_affected"] += rowcount
+            if slow:
+                stats["slow_count"] += 1
+
+    if slow:
+        increment_metric("slow_queries")
+        message = f"Slow query {fingerprint} took {ms:.0f} ms (rowcount {rowcount}, failed {failed}): {text[:300]}"
+        if params and random.random() < SLOW_QUERY_PARAM_SAMPLE_RATE:
+            message += f" params={_redact_params(params)}"
+        logging.warning(message)
+    return fingerprint
+
+
+def _record_fetched_rows(fingerprint: Optional[str], count: int) -> None:
+    if fingerprint is None or not count:
+        return
+    with _query_stats_lock:
+        stats = _query_stats.get(fingerprint)
+        if stats is not None:
+            stats["rows_fetched"] += count
+
+
+def slow_query_report(limit: int = 20, order_by: str = "total_ms") -> List[Dict[str, Any]]:
+    """Top `limit` fingerprints by `order_by` (total_ms, max_ms, mean_ms, count, slow_count)."""
+    with _query_stats_lock:
+        rows = [dict(stats) for stats in _query_stats.values()]
+    for row in rows:
+        row["mean_ms"] = row["total_ms"] / row["count"] if row["count"] else 0.0
+    rows.sort(key=lambda row: row.get(order_by, 0), reverse=True)
+    return rows[:limit]
+
+
+class TimedCursor:
+    """DB-API cursor proxy: execute* is timed as `query` and fed to the slow-query
+    log, fetch*/nextset are timed as `fetch`."""
+
+    __slots__ = ("_cursor", "_fingerprint")
+
+    def __init__(self, cursor: Any):
+        object.__setattr__(self, "_cursor", cursor)
+        object.__setattr__(self, "_fingerprint", None)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(self._cursor, name, value)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self) -> "TimedCursor":
+        self._cursor.__enter__()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> Any:
+        return self._cursor.__exit__(*exc_info)
+
+    def _run(self, method: Callable[..., Any], sql: str, args: tuple, params: tuple) -> Any:
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = method(sql, *args)
+            failed = False
+            return result
+        finally:
+            elapsed = time.perf_counter() - started
+            timing = _current_timing.get()
+            if timing is not None:
+                timing.add("query", elapsed)
+            if SLOW_QUERY_LOG_ENABLED:
+                rowcount = None if failed else getattr(self._cursor, "rowcount", None)
+                object.__setattr__(self, "_fingerprint", record_statement(sql, params, elapsed, rowcount, failed))
+
+    def execute(self, sql: str, *params: Any) -> "TimedCursor":
+        self._run(self._cursor.execute, sql, params, params)
+        return self
+
+    def executemany(self, sql: str, seq_of_params: Any) -> None:
+        self._run(self._cursor.executemany, sql, (seq_of_params,), ())
+
+    def fetchone(self) -> Any:
+        with request_phase("fetch"):
+            row = self._cursor.fetchone()
+        _record_fetched_rows(self._fingerprint, row is not None)
+        return row
+
+    def fetchmany(self, *args: Any) -> List[Any]:
+        with request_phase("fetch"):
+            rows = self._cursor.fetchmany(*args)
+        _record_fetched_rows(self._fingerprint, len(rows))
+        return rows
+
+    def fetchall(self) -> List[Any]:
+        with request_phase("fetch"):
+            rows = self._cursor.fetchall()
+        _record_fetched_rows(self._fingerprint, len(rows))
+        return rows
+
+    def nextset(self) -> Any:
+        with request_phase("fetch"):
+            return self._cursor.nextset()
+
+
+_connection_stats = {"opened": 0, "active": 0, "peak_active": 0, "connect_failures": 0}
+
+
+def connection_stats() -> Dict[str, Any]:
+    """Connections opened through db_connect in this worker and time spent
+    acquiring them (ODBC pool wait + login)."""
+    with _metrics_lock:
+        stats = dict(_connection_stats)
+    stats["connect_ms"] = get_histograms("db_connect_ms").get("db_connect_ms", {"count": 0})
+    return stats
+
+
+def _track_connection(delta: int) -> None:
+    with _metrics_lock:
+        if delta > 0:
+            _connection_stats["opened"] += 1
+        _connection_stats["active"] += delta
+        _connection_stats["peak_active"] = max(_connection_stats["peak_active"], _connection_stats["active"])
+
+
+class TimedConnection:
+    """DB-API connection proxy handing out TimedCursors."""
+
+    __slots__ = ("_conn", "_released")
+
+    def __init__(self, conn: Any):
+        object.__setattr__(self, "_conn", conn)
+        object.__setattr__(self, "_released", False)
+        _track_connection(1)
+
+    def _release(self) -> None:
+        if not self._released:
+            object.__setattr__(self, "_released", True)
+            _track_connection(-1)
+
+    def close(self) -> None:
+        try:
+            self._conn.close()
+        finally:
+            self._release()
+
+    def __del__(self) -> None:
+        # pyodbc's `with` only commits; the connection goes back to the pool when collected
+        self._release()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(self._conn, name, value)
+
+    def __enter__(self) -> "TimedConnection":
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> Any:
+        return self._conn.__exit__(*exc_info)
+
+    def cursor(self, *args: Any, **kwargs: Any) -> TimedCursor:
+        return TimedCursor(self._conn.cursor(*args, **kwargs))
+
+    def execute(self, sql: str, *params: Any) -> TimedCursor:
+        return self.cursor().execute(sql, *params)
+
+
+def db_connect(*args: Any, driver: Any = None, **kwargs: Any) -> Any:
+    """`driver.connect(...)` (pyodbc unless given, e.g. pymssql) with request timing
+    and the slow-query log."""
+    driver = driver or pyodbc
+    if not (REQUEST_TIMING_ENABLED or SLOW_QUERY_LOG_ENABLED):
+        return driver.connect(*args, **kwargs)
+    started = time.perf_counter()
+    try:
+        with request_phase("connect"):
+            conn = driver.connect(*args, **kwargs)
+    except Exception:
+        with _metrics_lock:
+            _connection_stats["connect_failures"] += 1
+        raise
+    record_latency("db_connect_ms", 1000 * (time.perf_counter() - started))
+    return TimedConnection(conn)
@@ -0,0 +1,207 @@
+"""
+Station entry rules (gating) evaluated in the app before a scan is written.
+
+The authoritative rules live in trg_Insert_Update_Part_Status (and the
+Control_check / Quality_check flags maintained by trg_Control_Station_Complete):
+a scan that violates them is still written to traceability_log and h_part_status,
+costs a trigger run, and only then gets ignored. The table below mirrors those
+rules so impossible scans can be rejected up front and so terminals can ask
+/api/CanEnter before the operator puts the part down.
+
+Stations without a rule here (12, 13, 15-20, 999, ...) are not gated by the
+app — the DB stays the final authority for everything that passes.
+"""
+import os
+from typing import Any, Dict, Optional, Tuple
+
+from shared_utils import LRUCache, call_with_resilience, SQL_READ_DEADLINE_SECONDS, db_connect, log_event
+
+# Statuses the trigger applies at any station (before the per-station rules),
+# unless the part is already DESTROYED.
+ALWAYS_ALLOWED_STATUSES = {"NOK", "DESTROYED"}
+
+# station_id -> entry rule
+#   after:                  (previous station_id, required last_status or None = any)
+#   new_part:               station creates the part_status row (part must not exist yet)
+#   requires_control_check: part_status.Control_check = 1 (KKK stations 15-18 OK)
+#   requires_quality_check: part_status.Quality_check = 1 (stations 15-20 OK)
+STATION_RULES: Dict[str, Dict[str, Any]] = {
+    "1": {"name": "Kovací linka", "new_part": True},
+    "2": {"name": "Test tvrdosti", "after": [("1", "OK"), ("7", "OK"), ("8", "OK")]},
+    "3": {"name": "Penetrace", "after": [("2", "OK")]},
+    "4": {"name": "Tryskání", "after": [("3", "OK"), ("9", "OK"), ("10", "OK")],
+          "requires_control_check": True},
+    "5": {"name": "Kontrola kvality", "after": [("4", "OK"), ("10", "OK")],
+          "requires_quality_check": True},
+    "6": {"name": "Přeskladnění", "after": [("5", "OK"), ("4", "OK")]},
+    "7": {"name": "Laboratoř", "after": [("1", None)]},
+    "8": {"name": "Penetrace rework", "after": [("3", "REWORK")]},
+    "9": {"name": "Tryskání rework", "after": [("4", "REWORK")]},
+    "10": {"name": "Kontrola kvality rework", "after": [("5", "REWORK")]},
+    "11": {"name": "Destruktivní kontrola", "after": None},
+}
+
+STATION_NAMES = {station_id: rule["name"] for station_id, rule in STATION_RULES.items()}
+
+# The trigger moves the part to the scan's shipping_id at every station except these
+# (its NOK / DESTROYED branch overwrites shipping_id there too, see keeps_shipping_id)
+STATIONS_KEEPING_SHIPPING_ID = {"5"}
+
+def keeps_shipping_id(station_id: Any, status: Optional[str]) -> bool:
+    """Whether an accepted scan leaves part_status.shipping_id as it was."""
+    return (str(station_id).strip() in STATIONS_KEEPING_SHIPPING_ID
+            and (status or "OK").strip().upper() not in ALWAYS_ALLOWED_STATUSES)
+
+
+# Cached part_status rows; value None = part does not exist (yet).
+_part_state_cache = LRUCache(
+    maxsize=int(os.getenv("PART_STATE_CACHE_SIZE", "20000")),
+    ttl=float(os.getenv("PART_STATE_CACHE_TTL", "300")),
+    name="part_state"
+)
+_NOT_CACHED = object()
+
+
+def is_gating_enforced() -> bool:
+    """Writers reject impossible scans unless STATION_GATING_ENFORCED is off."""
+    return os.getenv("STATION_GATING_ENFORCED", "true").strip().lower() not in ("0", "false", "no", "off")
+
+
+def evaluate_entry(state: Optional[Dict[str, Any]], station_id: Any, status: Optional[str] = "OK") -> Tuple[bool, Optional[str]]:
+    """Evaluate the entry rule of `station_id` for a part in `state`.
+
+    `state` is the part's part_status row as a dict (see fetch_part_state) or
+    None when the part has no part_status row. Returns (allowed, reason).
+    """
+    station_id = str(station_id).strip()
+    status = (status or "OK").strip().upper()
+    rule = STATION_RULES.get(station_id)
+    last_status = (state or {}).get("last_status")
+
+    if last_status == "DESTROYED":
+        return False, "Díl je zničený (DESTROYED), další záznamy se neaplikují."
+
+    if status in ALWAYS_ALLOWED_STATUSES:
+        return True, None
+
+    if rule is None:
+        return True, None
+
+    if rule.get("new_part"):
+        if state is not None:
+            return False, f"Díl už je v evidenci, na stanici {rule['name']} ho nelze založit znovu."
+        return True, None
+
+    if rule.get("after") is None:
+        return True, None
+
+    if state is None:
+        return False, f"Díl nemá žádný záznam v part_status, na stanici {rule['name']} nemůže vstoupit."
+
+    current_station = str(state.get("station_id")).strip() if state.get("station_id") is not None else None
+    if not any(
+        current_station == prev_station and (prev_status is None or last_status == prev_status)
+        for prev_station, prev_status in rule["after"]
+    ):
+        current_name = STATION_NAMES.get(current_station, current_station)
+        return False, (
+            f"Díl nesplňuje podmínky vstupu na stanici {rule['name']} "
+            f"(poslední stanice: {current_name}, status: {last_status})."
+        )
+
+    if rule.get("requires_control_check") and not state.get("control_check"):
+        return False, f"Díl nemá OK ze všech KKK kontrol (Control_check), na stanici {rule['name']} nemůže vstoupit."
+
+    if rule.get("requires_quality_check") and not state.get("quality_check"):
+        return False, f"Díl nemá OK ze všech kontrol (Quality_check), na stanici {rule['name']} nemůže vstoupit."
+
+    return True, None
+
+
+def part_state_from_row(row) -> Dict[str, Any]:
+    """Build the cached state from (last_status, station_id, shipping_id, Control_check, Quality_check)."""
+    return {
+        "last_status": row[0],
+        "station_id": str(row[1]) if row[1] is not None else None,
+        "shipping_id": row[2],
+        "control_check": bool(row[3]) if row[3] is not None else False,
+        "quality_check": bool(row[4]) if row[4] is not None else False,
+    }
+
+
+def fetch_part_state(conn_str: str, part_id: str) -> Optional[Dict[str, Any]]:
+    """Read the part's part_status row and refresh the cache."""
+    with db_connect(conn_str) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT last_status, station_id, shipping_id, Control_check, Quality_check
+                FROM dbo.part_status
+                WHERE part_id = ?
+                """,
+                (part_id,)
+            )
+            row = cursor.fetchone()
+
+    state = part_state_from_row(row) if row else None
+    _part_state_cache.set(part_id, state)
+    return state
+
+
+def _read_part_state(conn_str: str, part_id: str) -> Optional[Dict[str, Any]]:
+    return call_with_resilience(fetch_part_state, conn_str, part_id, deadline_seconds=SQL_READ_DEADLINE_SECONDS)
+
+
+def remember_part_state(part_id: str, state: Optional[Dict[str, Any]]) -> None:
+    """Let other readers of part_status (e.g. ReadStatus) warm the cache."""
+    _part_state_cache.set(part_id, state)
+
+
+def peek_part_state(part_id: str) -> Tuple[bool, Optional[Dict[str, Any]]]:
+    """(cached, state) without reading the DB; writers take the state before a scan from here."""
+    state = _part_state_cache.get(part_id, _NOT_CACHED)
+    return (False, None) if state is _NOT_CACHED else (True, state)
+
+
+def forget_part_state(part_id: str) -> None:
+    """Drop the cached state after a write to the part."""
+    _part_state_cache.pop(part_id)
+
+
+def can_enter(conn_str: str, part_id: str, station_id: Any, status: Optional[str] = "OK") -> Dict[str, Any]:
+    """Decide whether `part_id` may be scanned at `station_id` with `status`.
+
+    Uses the cached part state when there is one. A cached state is only
+    trusted to allow a scan (the trigger re-checks anyway); before rejecting,
+    the state is re-read from the DB so a stale cache never blocks a valid scan.
+    """
+    station_id = str(station_id).strip()
+    state = _part_state_cache.get(part_id, _NOT_CACHED)
+    from_cache = state is not _NOT_CACHED
+    if not from_cache:
+        state = _read_part_state(conn_str, part_id)
+
+    allowed, reason = evaluate_entry(state, station_id, status)
+    if not allowed and from_cache:
+        state = _read_part_state(conn_str, part_id)
+        from_cache = False
+        allowed, reason = evaluate_entry(state, station_id, status)
+
+    if not allowed:
+        log_event("StationGating", "Station gating: part rejected", part_id=part_id, station_id=station_id,
+                  reason=reason)
+
+    return {
+        "part_id": part_id,
+        "station_id": station_id,
+        "station_name": STATION_NAMES.get(station_id),
+        "status": (status or "OK").strip().upper(),
+        "allowed": allowed,
+        "reason": reason,
+        "part_found": state is not None,
+        "last_process_station_id": state.get("station_id") if state else None,
+        "last_process_status": state.get("last_status") if state else None,
+        "control_check": state.get("control_check") if state else False,
+        "quality_check": state.get("quality_check") if state else False,
+        "cached": from_cache,
+    }
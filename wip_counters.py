@@ -0,0 +1,152 @@
+"""
+Work in progress per station: part_status counted by station_id and last_status.
+
+Seeded by one GROUP BY over part_status and then adjusted in memory by the
+app's own writes (shared_utils.notify_write). A scan moves one part from its
+previous (station, status) to the new one when the worker knows the previous
+state (station_rules part state cache, warmed by the gating check) and the
+station's entry rule lets the trigger apply it. Writes the worker can't
+follow exactly (unknown previous state, stations without a rule, gitterbox
+status changes) only mark the counters dirty. Counters are reconciled with the DB in the background every
+WIP_RECONCILE_SECONDS, or after WIP_DIRTY_RECONCILE_SECONDS once dirty; the
+drift found is reported as the wip_drift metric.
+"""
+import datetime
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, Optional, Tuple
+
+from shared_utils import (
+    DB_EXECUTOR, add_write_listener, call_with_resilience, db_connect, get_connection_string,
+    increment_metric, set_gauge, SQL_READ_DEADLINE_SECONDS,
+)
+from station_rules import STATION_RULES, evaluate_entry
+
+WIP_RECONCILE_SECONDS = float(os.getenv("WIP_RECONCILE_SECONDS", "300"))
+WIP_DIRTY_RECONCILE_SECONDS = float(os.getenv("WIP_DIRTY_RECONCILE_SECONDS", "30"))
+
+Key = Tuple[Optional[str], Optional[str]]  # (station_id, last_status)
+
+_lock = threading.Lock()
+_counts: Counter = Counter()
+_seeded = False
+_reconciled_at = 0.0  # time.monotonic()
+_reconciled_wall: Optional[datetime.datetime] = None
+_dirty_since: Optional[float] = None
+_applied_since_reconcile = 0
+_reconciling = False
+
+
+def _key(station_id: Any, status: Any) -> Key:
+    return (str(station_id).strip() if station_id is not None else None,
+            str(status).strip().upper() if status is not None else None)
+
+
+def read_counts(conn_str: str) -> Counter:
+    with db_connect(conn_str) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT station_id, last_status, COUNT(*)
+                FROM dbo.part_status
+                GROUP BY station_id, last_status
+                """
+            )
+            rows = cursor.fetchall()
+    counts: Counter = Counter()
+    for station_id, last_status, count in rows:
+        counts[_key(station_id, last_status)] += count
+    return counts
+
+
+def reconcile(conn_str: Optional[str] = None) -> int:
+    """Replace the counters with the DB's; returns the drift (sum of absolute differences)."""
+    global _seeded, _reconciled_at, _reconciled_wall, _dirty_since, _applied_since_reconcile, _reconciling
+    try:
+        fresh = call_with_resilience(read_counts, conn_str or get_connection_string(),
+                                     deadline_seconds=SQL_READ_DEADLINE_SECONDS)
+        with _lock:
+            drift = sum(abs(fresh[k] - _counts[k]) for k in set(fresh) | set(_counts)) if _seeded else 0
+            _counts.clear()
+            _counts.update(fresh)
+            _seeded = True
+            _reconciled_at = time.monotonic()
+            _reconciled_wall = datetime.datetime.now()
+            _dirty_since = None
+            _applied_since_reconcile = 0
+        increment_metric("wip_reconciliations")
+        increment_metric("wip_drift", drift)
+        set_gauge("wip_last_drift", drift)
+        return drift
+    finally:
+        with _lock:
+            _reconciling = False
+
+
+def _reconcile_in_background() -> None:
+    try:
+        reconcile()
+    except Exception as e:
+        logging.warning(f"WIP reconciliation failed: {e}")
+
+
+def _due(now: float) -> bool:
+    if now - _reconciled_at >= WIP_RECONCILE_SECONDS:
+        return True
+    return _dirty_since is not None and now - _dirty_since >= WIP_DIRTY_RECONCILE_SECONDS
+
+
+def snapshot(conn_str: Optional[str] = None) -> Dict[str, Any]:
+    """Current counters; seeds synchronously once, later reconciliations run in the background."""
+    global _reconciling
+    if not _seeded:
+        reconcile(conn_str)
+    now = time.monotonic()
+    with _lock:
+        if _due(now) and not _reconciling:
+            _reconciling = True
+            DB_EXECUTOR.submit(_reconcile_in_background)
+        counts = dict(_counts)
+        return {
+            "counts": counts,
+            "reconciled_at": _reconciled_wall,
+            "age_seconds": round(now - _reconciled_at, 1),
+            "dirty": _dirty_since is not None,
+            "writes_applied_since_reconcile": _applied_since_reconcile,
+        }
+
+
+def _mark_dirty() -> None:
+    global _dirty_since
+    with _lock:
+        if _dirty_since is None:
+            _dirty_since = time.monotonic()
+
+
+def _apply_scan(previous: Optional[Dict[str, Any]], station_id: Any, status: Any) -> None:
+    global _applied_since_reconcile
+    allowed, _ = evaluate_entry(previous, station_id, status)
+    if not allowed:
+        return  # the trigger ignores the scan, part_status stays as it was
+    with _lock:
+        if previous is not None:
+            old = _key(previous.get("station_id"), previous.get("last_status"))
+            _counts[old] -= 1
+            if _counts[old] <= 0:
+                del _counts[old]
+        _counts[_key(station_id, status)] += 1
+        _applied_since_reconcile += 1
+
+
+@add_write_listener
+def on_write(kind: str, fields: Dict[str, Any]) -> None:
+    if not _seeded:
+        return
+    # The app mirrors the trigger only for stations with an entry rule
+    if kind == "part" and "previous" in fields and str(fields.get("station_id")).strip() in STATION_RULES:
+        _apply_scan(fields["previous"], fields.get("station_id"), fields.get("status"))
+    else:
+        _mark_dirty()